@@ -0,0 +1,205 @@
+# backend/app/admission.py
+"""
+Admission control for recommendation pipelines.
+
+At most ADMISSION_MAX_INFLIGHT pipelines run at once per worker. Requests
+beyond that wait in a queue of ADMISSION_MAX_QUEUE places. Interactive
+requests are served before batch requests (the background refresher, or
+clients that send `X-Request-Priority: batch`), and a full queue gives
+up a waiting batch request to make room for an interactive one. A request
+that finds the queue full, or is still waiting after
+ADMISSION_QUEUE_TIMEOUT seconds (or its deadline), is rejected with
+Overloaded, which the API answers with a fast 503.
+
+Slots are released from whichever thread finishes the pipeline; waiters
+are woken on their own event loop.
+"""
+import os
+import heapq
+import asyncio
+import weakref
+import itertools
+import threading
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Iterator, Optional
+
+from .deadline import Deadline
+from .telemetry import Counter, Histogram
+
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "8"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+# Suggested client back-off on 503
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "2"))
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+ADMISSIONS = Counter("dsa_admission_total", "Admission decisions", ("priority", "result"))
+QUEUE_WAIT_SECONDS = Histogram("dsa_admission_queue_wait_seconds", "Time spent waiting for a pipeline slot",
+                               ("priority",))
+
+
+class Overloaded(Exception):
+    """No pipeline slot within the queue limits"""
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "loop", "future", "state")
+
+    def __init__(self, priority, seq, loop, future):
+        self.priority = priority
+        self.seq = seq
+        self.loop = loop
+        self.future = future
+        self.state = "waiting"  # -> granted | evicted | abandoned
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+def _wake(future, error=None):
+    if not future.done():
+        if error is None:
+            future.set_result(True)
+        else:
+            future.set_exception(error)
+
+
+class AdmissionController:
+    """A counting semaphore with a bounded, priority-ordered wait queue"""
+
+    def __init__(self, max_inflight: int = ADMISSION_MAX_INFLIGHT, max_queue: int = ADMISSION_MAX_QUEUE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.inflight = 0
+        self.queued = 0
+        self._heap = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    async def acquire(self, priority: str = "interactive", deadline: Optional[Deadline] = None):
+        """Wait for a slot; raises Overloaded when the queue is full or the wait runs out"""
+        rank = PRIORITIES[priority]
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        with self._lock:
+            if self.inflight < self.max_inflight and not self.queued:
+                self.inflight += 1
+                ADMISSIONS.inc(priority=priority, result="admitted")
+                QUEUE_WAIT_SECONDS.observe(0.0, priority=priority)
+                return
+            if self.queued >= self.max_queue and not self._evict_below(rank):
+                ADMISSIONS.inc(priority=priority, result="rejected_full")
+                raise Overloaded("Server busy: admission queue is full")
+            waiter = _Waiter(rank, next(self._seq), loop, loop.create_future())
+            heapq.heappush(self._heap, waiter)
+            self.queued += 1
+
+        timeout = self.queue_timeout
+        if deadline is not None:
+            timeout = min(timeout, deadline.remaining())
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if waiter.state == "granted":
+                    # The slot arrived as the wait ended: keep it unless we were cancelled
+                    if isinstance(e, asyncio.CancelledError):
+                        self._release_locked()
+                        raise
+                else:
+                    if waiter.state == "waiting":
+                        waiter.state = "abandoned"
+                        self.queued -= 1
+                    if isinstance(e, asyncio.CancelledError):
+                        raise
+                    ADMISSIONS.inc(priority=priority, result="rejected_timeout")
+                    raise Overloaded(f"Server busy: no pipeline slot within {timeout:.1f}s")
+        except Overloaded:
+            ADMISSIONS.inc(priority=priority, result="evicted")
+            raise
+        ADMISSIONS.inc(priority=priority, result="admitted")
+        QUEUE_WAIT_SECONDS.observe(loop.time() - started, priority=priority)
+
+    def _evict_below(self, rank: int) -> bool:
+        """Drop the latest waiter of a lower priority than rank (lock held)"""
+        victim = None
+        for waiter in self._heap:
+            if waiter.state == "waiting" and waiter.priority > rank and (victim is None or victim < waiter):
+                victim = waiter
+        if victim is None:
+            return False
+        victim.state = "evicted"
+        self.queued -= 1
+        victim.loop.call_soon_threadsafe(_wake, victim.future, Overloaded("Server busy: displaced by an interactive request"))
+        return True
+
+    def _release_locked(self):
+        while self._heap:
+            waiter = heapq.heappop(self._heap)
+            if waiter.state != "waiting":
+                continue
+            # Hand the slot straight to the best waiter; inflight stays the same
+            waiter.state = "granted"
+            self.queued -= 1
+            waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+            return
+        self.inflight -= 1
+
+    def release(self):
+        """Give back a slot (safe from any thread)"""
+        with self._lock:
+            self._release_locked()
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive", deadline: Optional[Deadline] = None):
+        await self.acquire(priority, deadline)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def held_by(self, iterator: Iterator) -> Iterator:
+        """
+        Wrap an acquired slot's streaming body: the slot is released when the
+        body is exhausted or closed, or collected without ever being started
+        (a client that disconnects before the first chunk).
+        """
+        released = []
+
+        def release_once():
+            if not released:
+                released.append(True)
+                self.release()
+
+        def body():
+            try:
+                yield from iterator
+            finally:
+                release_once()
+
+        wrapped = body()
+        weakref.finalize(wrapped, release_once)
+        return wrapped
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "inflight": self.inflight,
+                "queued": self.queued,
+                "max_inflight": self.max_inflight,
+                "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout,
+            }
+
+
+_controller = None
+
+
+def get_admission() -> AdmissionController:
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController()
+    return _controller
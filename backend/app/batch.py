@@ -0,0 +1,301 @@
+# backend/app/batch.py
+"""
+Resumable offline batch runner for nightly reports over many handles.
+
+Runs the statistics (or statistics + recommendations) pipeline directly,
+without the HTTP API, in a rate-limited thread pool:
+
+    cd backend
+    python -m app.batch --handles handles.txt --out reports/nightly --workers 4
+    python -m app.batch --handles handles.txt --out reports/nightly --format parquet --mode statistics
+
+Results are written in shards (part-00000.jsonl / .parquet). A shard is
+written to a temporary file and renamed into place before its handles are
+appended to checkpoint.jsonl, so a crashed or interrupted run resumes with
+the same command: finished handles are skipped and at most one shard of
+work is redone. Failed handles are only retried with --retry-failed.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, List
+
+# Optional: Parquet output (graceful fallback to JSONL-only if not installed)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+from .ingest import load_handles
+from .log_writer import close_all_writers
+from .pipeline import build_recommendations, build_statistics
+from .refresher import CF_CALLS_PER_REFRESH
+
+# Codeforces allows one call every two seconds; Gemini's free tier ~15 requests/minute
+BATCH_CF_RATE = float(os.getenv("BATCH_CF_RATE", "0.5"))
+BATCH_LLM_RATE = float(os.getenv("BATCH_LLM_RATE", "0.25"))
+
+CHECKPOINT_FILE = "checkpoint.jsonl"
+MANIFEST_FILE = "manifest.json"
+
+
+class RateLimiter:
+    """Thread-safe token bucket: `rate` tokens per second, up to `burst` saved"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class ShardWriter:
+    """Buffers results and commits them shard by shard (temp file + rename, then checkpoint)"""
+
+    def __init__(self, out_dir: str, fmt: str, shard_size: int):
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.shard_size = shard_size
+        self.buffer: List[Dict[str, Any]] = []
+        self.shard_index = _next_shard_index(out_dir)
+        self.checkpoint = open(os.path.join(out_dir, CHECKPOINT_FILE), "a", encoding="utf-8")
+
+    def add(self, record: Dict[str, Any]):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.shard_size:
+            self.commit()
+
+    def fail(self, handle: str, error: str, attempts: int):
+        self._checkpoint([{"handle": handle, "status": "failed", "error": error[:500], "attempts": attempts}])
+
+    def commit(self):
+        if not self.buffer:
+            return
+        name = f"part-{self.shard_index:05d}.{self.fmt}"
+        path = os.path.join(self.out_dir, name)
+        tmp = path + ".tmp"
+        if self.fmt == "parquet":
+            pq.write_table(pa.Table.from_pylist([_flatten(r) for r in self.buffer]), tmp)
+        else:
+            with open(tmp, "w", encoding="utf-8") as f:
+                for record in self.buffer:
+                    f.write(json.dumps(record, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._checkpoint([{"handle": r["handle"], "status": "ok", "shard": name} for r in self.buffer])
+        self.shard_index += 1
+        self.buffer = []
+
+    def _checkpoint(self, entries: List[Dict[str, Any]]):
+        now = time.time()
+        for entry in entries:
+            entry["time"] = now
+            self.checkpoint.write(json.dumps(entry) + "\n")
+        self.checkpoint.flush()
+        os.fsync(self.checkpoint.fileno())
+
+    def close(self):
+        self.commit()
+        self.checkpoint.close()
+
+
+def _next_shard_index(out_dir: str) -> int:
+    index = 0
+    for name in os.listdir(out_dir):
+        if name.endswith(".tmp"):
+            # Left behind by a crashed run; its handles were never checkpointed
+            os.remove(os.path.join(out_dir, name))
+        elif name.startswith("part-"):
+            try:
+                index = max(index, int(name[5:10]) + 1)
+            except ValueError:
+                pass
+    return index
+
+
+def _flatten(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Parquet row: scalar columns plus nested sections as JSON strings"""
+    stats = record.get("statistics") or {}
+    topics = stats.get("topic_stats", {})
+    return {
+        "handle": record["handle"],
+        "generated_at": record.get("generated_at"),
+        "user_rating": record.get("user_rating"),
+        "user_max_rating": record.get("user_max_rating"),
+        "total_solved": stats.get("total_solved"),
+        "total_attempted": stats.get("total_attempted"),
+        "weak_topics": sum(1 for t in topics.values() if t.get("strength") == "weak"),
+        "statistics": json.dumps(stats),
+        "recommendations": json.dumps(record.get("recommendations")) if "recommendations" in record else None,
+    }
+
+
+def load_checkpoint(out_dir: str) -> Dict[str, Dict[str, Any]]:
+    """Latest checkpoint entry per handle"""
+    path = os.path.join(out_dir, CHECKPOINT_FILE)
+    state = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn last line from a crash
+                    continue
+                state[entry["handle"].lower()] = entry
+    return state
+
+
+def _check_manifest(out_dir: str, mode: str, fmt: str):
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if (manifest.get("mode"), manifest.get("format")) != (mode, fmt):
+            raise SystemExit(f"{out_dir} holds a {manifest.get('mode')}/{manifest.get('format')} run; "
+                             f"use another --out for {mode}/{fmt}")
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"mode": mode, "format": fmt, "created": time.time()}, f)
+
+
+def process_handle(handle: str, mode: str, cf_limiter: RateLimiter, llm_limiter: RateLimiter) -> Dict[str, Any]:
+    if mode == "statistics":
+        cf_limiter.acquire(1)
+        result = {"handle": handle, "statistics": build_statistics(handle)}
+    else:
+        cf_limiter.acquire(CF_CALLS_PER_REFRESH)
+        llm_limiter.acquire(1)
+        result = build_recommendations(handle)
+    result["generated_at"] = time.time()
+    return result
+
+
+def _run_with_retries(handle, mode, cf_limiter, llm_limiter, retries):
+    """(result, None, attempts) or (None, error, attempts)"""
+    for attempt in range(1, retries + 2):
+        try:
+            return process_handle(handle, mode, cf_limiter, llm_limiter), None, attempt
+        except Exception as e:
+            error = str(getattr(e, "detail", None) or e) or type(e).__name__
+            if attempt <= retries:
+                # Rate limits and timeouts usually clear up; back off before the next attempt
+                time.sleep(min(60, 2 ** attempt))
+    return None, error, attempt
+
+
+def run_batch(handles: List[str], out_dir: str, mode: str = "recommendations", fmt: str = "jsonl",
+              workers: int = 4, shard_size: int = 200, retries: int = 3, retry_failed: bool = False,
+              cf_rate: float = BATCH_CF_RATE, llm_rate: float = BATCH_LLM_RATE) -> Dict[str, Any]:
+    if fmt == "parquet" and not PARQUET_AVAILABLE:
+        raise SystemExit("Parquet output requires pyarrow (pip install pyarrow)")
+    os.makedirs(out_dir, exist_ok=True)
+    _check_manifest(out_dir, mode, fmt)
+
+    state = load_checkpoint(out_dir)
+    todo = [h for h in handles
+            if h.lower() not in state or (retry_failed and state[h.lower()]["status"] == "failed")]
+    skipped = len(handles) - len(todo)
+    print(f"{len(todo)} handles to process ({skipped} already done)")
+
+    cf_limiter = RateLimiter(cf_rate, burst=max(CF_CALLS_PER_REFRESH, workers))
+    llm_limiter = RateLimiter(llm_rate, burst=1)
+    writer = ShardWriter(out_dir, fmt, shard_size)
+    ok = failed = 0
+    started = time.time()
+    inflight = {}
+
+    def record(handle, future):
+        nonlocal ok, failed
+        result, error, attempts = future.result()
+        if result is not None:
+            writer.add(result)
+            ok += 1
+        else:
+            writer.fail(handle, error, attempts)
+            failed += 1
+            print(f"Warning: {handle} failed after {attempts} attempts: {error}")
+
+    def submit(pool, handle):
+        inflight[pool.submit(_run_with_retries, handle, mode, cf_limiter, llm_limiter, retries)] = handle
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # Keep a bounded window in flight so an interrupt loses little queued work
+            for handle in todo[:workers * 2]:
+                submit(pool, handle)
+            pending = iter(todo[workers * 2:])
+            try:
+                while inflight:
+                    done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record(inflight.pop(future), future)
+                        next_handle = next(pending, None)
+                        if next_handle is not None:
+                            submit(pool, next_handle)
+                    if done and (ok + failed) % 50 < len(done):
+                        print(f"{ok + failed}/{len(todo)} done ({failed} failed)")
+            except KeyboardInterrupt:
+                print("Interrupted - saving finished results; rerun the same command to resume")
+                # Drop queued handles, keep the ones already running
+                for future, handle in list(inflight.items()):
+                    if not future.cancel():
+                        record(handle, future)
+    finally:
+        writer.close()
+        close_all_writers()
+
+    elapsed = time.time() - started
+    return {
+        "processed": ok,
+        "failed": failed,
+        "skipped": skipped,
+        "remaining": len(todo) - ok - failed,
+        "seconds": round(elapsed, 1),
+        "handles_per_second": round((ok + failed) / elapsed, 3) if elapsed else 0,
+        "out": out_dir,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resumable batch statistics/recommendations over many handles")
+    parser.add_argument("--handles", required=True, help="File with one handle per line, or a comma-separated list")
+    parser.add_argument("--out", required=True, help="Output directory (reuse it to resume)")
+    parser.add_argument("--mode", choices=("recommendations", "statistics"), default="recommendations")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), default="jsonl")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--shard-size", type=int, default=200)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--retry-failed", action="store_true", help="Retry handles that failed in earlier runs")
+    parser.add_argument("--cf-rate", type=float, default=BATCH_CF_RATE, help="Codeforces calls per second")
+    parser.add_argument("--llm-rate", type=float, default=BATCH_LLM_RATE, help="LLM calls per second")
+    args = parser.parse_args(argv)
+
+    report = run_batch(load_handles(args.handles), args.out, args.mode, args.format, args.workers,
+                       args.shard_size, args.retries, args.retry_failed, args.cf_rate, args.llm_rate)
+    print(json.dumps(report, indent=2))
+    return 0 if report["failed"] == 0 and report["remaining"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,31 +1,90 @@
 # backend/app/cf_client.py
+import os
 import requests
-import time
-from collections import defaultdict
 
-BASE = "https://codeforces.com/api"
+from .db import cache_cf_response, get_cached_cf_response, get_stored_submissions, store_submissions
+from .telemetry import CACHE_REQUESTS, UPSTREAM_RATE_LIMITED, upstream_call
+from . import deadline, skill_model
+from .stats_index import get_index
+from .submission_array import SubmissionArray
+
+BASE = os.getenv("CODEFORCES_API_BASE", "https://codeforces.com/api")
+# Seconds a stored Codeforces response is reused before refetching (0 disables)
+CF_CACHE_TTL = int(os.getenv("CF_CACHE_TTL", "300"))
+# Seconds the per-handle submission store is trusted after app.ingest last synced a handle (0 disables)
+SUBMISSION_STORE_TTL = int(os.getenv("SUBMISSION_STORE_TTL", "86400"))
+
+def _cf_request(endpoint, url, timeout):
+    """GET a Codeforces API url (no caching), within the request's deadline"""
+    timeout = deadline.budget(timeout, f"codeforces {endpoint}")
+    with upstream_call("codeforces", endpoint) as call:
+        r = requests.get(url, timeout=timeout)
+        call.status = r.status_code
+        data = r.json()
+    # Codeforces reports its call limit in the body rather than always with a 429
+    if r.status_code != 429 and "limit exceeded" in str(data.get("comment", "")).lower():
+        UPSTREAM_RATE_LIMITED.inc(service="codeforces")
+    return data
+
+def _cf_get(handle, endpoint, url, timeout):
+    """GET a Codeforces API url, serving successful responses from the local cache"""
+    if CF_CACHE_TTL > 0:
+        cached = get_cached_cf_response(handle, endpoint, CF_CACHE_TTL)
+        if cached is not None:
+            CACHE_REQUESTS.inc(cache="codeforces", result="hit")
+            return cached
+        CACHE_REQUESTS.inc(cache="codeforces", result="miss")
+    
+    data = _cf_request(endpoint.split(":")[0], url, timeout)
+    if data.get("status") == "OK" and CF_CACHE_TTL > 0:
+        cache_cf_response(handle, endpoint, data)
+    return data
+
+def normalize_submission(item):
+    """Flatten a Codeforces submission object to the fields the agent uses"""
+    problem = item.get("problem", {})
+    return {
+        "id": item.get("id"),
+        "contestId": problem.get("contestId"),
+        "index": problem.get("index"),
+        "name": problem.get("name"),
+        "tags": problem.get("tags", []),
+        "verdict": item.get("verdict"),
+        "rating": problem.get("rating"),
+        "creationTimeSeconds": item.get("creationTimeSeconds")
+    }
+
+def fetch_contest_list():
+    """All finished and upcoming (non-gym) contests"""
+    data = _cf_request("contest.list", f"{BASE}/contest.list?gym=false", timeout=30)
+    if data.get("status") != "OK":
+        return None
+    return data["result"]
+
+def fetch_contest_status(contest_id, first=1, count=10000):
+    """One page of every participant's submissions to a contest (raw API objects)"""
+    url = f"{BASE}/contest.status?contestId={contest_id}&from={first}&count={count}"
+    return _cf_request("contest.status", url, timeout=60)
+
+def fetch_user_status(handle, first=1, count=10000):
+    """One page of a handle's submissions, newest first (raw API objects, not cached)"""
+    url = f"{BASE}/user.status?handle={handle}&from={first}&count={count}"
+    return _cf_request("user.status", url, timeout=60)
+
+def fetch_user_infos(handles):
+    """user.info for many handles in one call (raw API response; FAILED if any handle is unknown)"""
+    url = f"{BASE}/user.info?handles={';'.join(handles)}"
+    return _cf_request("user.info", url, timeout=30)
 
 def fetch_user_submissions(handle, limit=20, recent_only=True):
     """Fetch user submissions with option to get only recent ones"""
-    url = f"{BASE}/user.status?handle={handle}&from=1&count={limit if recent_only else 500}"
-    r = requests.get(url, timeout=15)
-    data = r.json()
+    count = limit if recent_only else 500
+    url = f"{BASE}/user.status?handle={handle}&from=1&count={count}"
+    data = _cf_get(handle, f"user.status:{count}", url, timeout=15)
     if data["status"] != "OK":
         return None
     
-    subs = []
-    for item in data["result"]:
-        problem = item.get("problem", {})
-        subs.append({
-            "id": item.get("id"),
-            "contestId": problem.get("contestId"),
-            "index": problem.get("index"),
-            "name": problem.get("name"),
-            "tags": problem.get("tags", []),
-            "verdict": item.get("verdict"),
-            "rating": problem.get("rating"),
-            "creationTimeSeconds": item.get("creationTimeSeconds")
-        })
+    subs = [normalize_submission(item) for item in data["result"]]
     
     # If recent_only, return only last N submissions
     if recent_only and len(subs) > limit:
@@ -33,78 +92,78 @@ def fetch_user_submissions(handle, limit=20, recent_only=True):
     
     return subs
 
-def get_topic_statistics(handle, max_submissions=500):
+def get_topic_statistics(handle, max_submissions=500, since=None, until=None):
     """
     Get statistics about solved problems by topic (like CF Analytics).
     This doesn't require AI calls - just processes Codeforces data.
+    Served from the submission store when it is current for the handle.
+    since/until (unix seconds) restrict the statistics to a time window.
     """
-    url = f"{BASE}/user.status?handle={handle}&from=1&count={max_submissions}"
-    r = requests.get(url, timeout=15)
-    data = r.json()
+    subs = None
+    if SUBMISSION_STORE_TTL > 0:
+        subs = get_stored_submissions(handle, max_submissions, SUBMISSION_STORE_TTL)
+        CACHE_REQUESTS.inc(cache="submission_store", result="miss" if subs is None else "hit")
     
-    if data["status"] != "OK":
-        return None
-    
-    # Statistics
-    topic_stats = defaultdict(lambda: {"solved": 0, "attempted": 0, "failed": 0})
-    rating_stats = defaultdict(int)
-    verdict_stats = defaultdict(int)
-    solved_problems = set()
-    
-    for item in data["result"]:
-        problem = item.get("problem", {})
-        verdict = item.get("verdict", "")
-        problem_id = f"{problem.get('contestId')}{problem.get('index')}"
-        tags = problem.get("tags", [])
-        rating = problem.get("rating")
-        
-        # Track verdicts
-        verdict_stats[verdict] += 1
-        
-        # Track rating distribution
-        if rating:
-            rating_stats[rating] += 1
+    if subs is None:
+        url = f"{BASE}/user.status?handle={handle}&from=1&count={max_submissions}"
+        data = _cf_get(handle, f"user.status:{max_submissions}", url, timeout=15)
         
-        # Track by topic
-        if tags:
-            if verdict == "OK":
-                solved_problems.add(problem_id)
-                for tag in tags:
-                    topic_stats[tag]["solved"] += 1
-            else:
-                for tag in tags:
-                    if verdict in ["WRONG_ANSWER", "TIME_LIMIT_EXCEEDED", "RUNTIME_ERROR", "COMPILATION_ERROR"]:
-                        topic_stats[tag]["failed"] += 1
-                    topic_stats[tag]["attempted"] += 1
+        if data["status"] != "OK":
+            return None
+        normalized = [normalize_submission(item) for item in data["result"]]
+        if SUBMISSION_STORE_TTL > 0:
+            # Stored rows only; the store serves the handle once app.ingest has synced it
+            store_submissions(handle, normalized)
+        subs = SubmissionArray.from_dicts(normalized)
     
-    # Calculate topic strengths/weaknesses
-    topic_analysis = {}
-    for tag, stats in topic_stats.items():
-        total = stats["solved"] + stats["failed"]
-        if total > 0:
-            success_rate = stats["solved"] / total if total > 0 else 0
-            topic_analysis[tag] = {
-                "solved": stats["solved"],
-                "failed": stats["failed"],
-                "total_attempts": total,
-                "success_rate": round(success_rate, 2),
-                "strength": "strong" if success_rate > 0.7 else "medium" if success_rate > 0.4 else "weak"
-            }
-    
-    return {
-        "topic_stats": topic_analysis,
-        "rating_distribution": dict(rating_stats),
-        "verdict_distribution": dict(verdict_stats),
-        "total_solved": len(solved_problems),
-        "total_attempted": len(data["result"])
-    }
+    index = get_index(handle, subs)
+    stats = index.statistics(since, until)
+    if since is None and until is None:
+        _apply_skills(handle, subs, stats)
+    else:
+        # Skills shown for a window describe that window only, so they are not persisted
+        _apply_skills(handle, index.window_subs(since, until), stats, persist=False)
+        stats["window"] = {"since": since, "until": until}
+    return stats
+
+def _apply_skills(handle, subs, stats, persist=True):
+    """
+    Label topic strength from per-tag skill ratings (problem rating and
+    recency aware) instead of raw success rates, and add target ratings.
+    Topics without rated attempts keep the success-rate label.
+    """
+    try:
+        state = skill_model.estimate_skills(handle, subs) if persist else skill_model.fit(subs)
+    except Exception as e:
+        print(f"Warning: Skill estimation failed for {handle}: {e}")
+        return
+    if state is None:
+        return
+    skills = skill_model.describe(state)
+    for tag, analysis in stats["topic_stats"].items():
+        skill = skills["tags"].get(tag)
+        if skill is None:
+            continue
+        analysis["skill"] = skill["skill"]
+        analysis["skill_uncertainty"] = skill["uncertainty"]
+        analysis["target_rating"] = skill["target_rating"]
+        analysis["strength"] = skill["strength"]
+    stats["overall_skill"] = skills["overall_skill"]
+    stats["target_rating"] = skills["overall_target_rating"]
+
+def fetch_last_contest_time(handle):
+    """When ratings were last updated for the handle's most recent rated contest (unix seconds)"""
+    url = f"{BASE}/user.rating?handle={handle}"
+    data = _cf_get(handle, "user.rating", url, timeout=10)
+    if data.get("status") != "OK" or not data["result"]:
+        return None
+    return data["result"][-1].get("ratingUpdateTimeSeconds")
 
 def fetch_user_info(handle):
     """Get basic user information"""
     url = f"{BASE}/user.info?handles={handle}"
     try:
-        r = requests.get(url, timeout=10)
-        data = r.json()
+        data = _cf_get(handle, "user.info", url, timeout=10)
         if data["status"] == "OK" and data["result"]:
             return data["result"][0]
     except:
@@ -0,0 +1,212 @@
+# backend/app/chat.py
+"""
+DSA tutor chat with per-session history and streamed replies.
+
+Each session keeps its turns in memory (the least recently used sessions
+beyond CHAT_MAX_SESSIONS, and any idle for CHAT_SESSION_TTL, are dropped).
+A turn's prompt is prompts/chat_prompt.txt with the newest turns that fit
+in CHAT_PROMPT_TOKENS after the template and the new message. Older turns
+are left out, and turns that could never fit again are forgotten. Token
+counts are taken once per turn, so trimming is a running sum.
+
+Replies come from the LLM router's stream, so the first words reach the
+client while the model is still writing. A session's first question is
+answered from the cache when the same question (ignoring case, spacing and
+punctuation) was answered within CHAT_CACHE_TTL. Follow-up questions
+depend on the conversation and always go to the model.
+"""
+import os
+import re
+import time
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Iterator, List, NamedTuple, Optional
+
+from .db import cache_cf_response, get_cached_cf_response
+from .deadline import DeadlineExceeded
+from .llm_router import LLMError, get_router
+from .prompts import PROMPT_TRIMS, compile_prompt, count_tokens, get_template, record_reply
+from .telemetry import CACHE_REQUESTS, Counter, Histogram
+
+# Most tokens a chat prompt may use: template, kept history and the new message
+CHAT_PROMPT_TOKENS = int(os.getenv("CHAT_PROMPT_TOKENS", "2000"))
+CHAT_MAX_MESSAGE_TOKENS = int(os.getenv("CHAT_MAX_MESSAGE_TOKENS", "500"))
+CHAT_MAX_REPLY_TOKENS = int(os.getenv("CHAT_MAX_REPLY_TOKENS", "1024"))
+CHAT_TIMEOUT = float(os.getenv("CHAT_TIMEOUT", "30"))
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "1000"))
+CHAT_SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", "3600"))
+# Answers to first questions are reused for this long (0 disables the cache)
+CHAT_CACHE_TTL = int(os.getenv("CHAT_CACHE_TTL", "86400"))
+
+CHAT_TURNS = Counter("dsa_chat_turns_total", "Chat turns by outcome", ("outcome",))
+CHAT_FIRST_CHUNK_SECONDS = Histogram("dsa_chat_first_chunk_seconds", "Time to the first reply chunk of a chat turn",
+                                     ("source",))
+
+_NOT_WORD = re.compile(r"[^a-z0-9+#]+")
+
+
+class Turn(NamedTuple):
+    role: str      # "Student" or "Tutor"
+    text: str
+    tokens: int    # of the rendered line
+
+
+def make_turn(role: str, text: str) -> Turn:
+    line = f"{role}: {text}"
+    return Turn(role, text, count_tokens(line) + 1)  # + the newline between turns
+
+
+class ChatSession:
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.turns: List[Turn] = []
+        self.used = time.time()
+        self._lock = threading.Lock()
+
+    def history(self) -> List[Turn]:
+        with self._lock:
+            return list(self.turns)
+
+    def append(self, *turns: Turn):
+        """Add turns and forget the oldest ones that no prompt could include any more"""
+        with self._lock:
+            self.turns.extend(turns)
+            kept, tokens = 0, 0
+            for turn in reversed(self.turns):
+                tokens += turn.tokens
+                if tokens > CHAT_PROMPT_TOKENS:
+                    break
+                kept += 1
+            del self.turns[:len(self.turns) - kept]
+
+
+class SessionStore:
+    """Chat sessions by id, least recently used first, dropped when idle or over capacity"""
+
+    def __init__(self, max_sessions: int = CHAT_MAX_SESSIONS, ttl: float = CHAT_SESSION_TTL):
+        self.max_sessions = max(1, max_sessions)
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: Optional[str] = None) -> ChatSession:
+        """The session with this id, or a new one (under this id if given, so a client can resume after a restart)"""
+        now = time.time()
+        with self._lock:
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if now - oldest.used < self.ttl:
+                    break
+                del self._sessions[oldest.id]
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                while len(self._sessions) >= self.max_sessions:
+                    self._sessions.popitem(last=False)
+                session = ChatSession(session_id or uuid.uuid4().hex)
+                self._sessions[session.id] = session
+            session.used = now
+            self._sessions.move_to_end(session.id)
+            return session
+
+    def drop(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"sessions": len(self._sessions), "max_sessions": self.max_sessions, "ttl": self.ttl}
+
+
+_sessions = None
+_sessions_lock = threading.Lock()
+
+
+def get_sessions() -> SessionStore:
+    global _sessions
+    with _sessions_lock:
+        if _sessions is None:
+            _sessions = SessionStore()
+        return _sessions
+
+
+def check_message(message: str):
+    """ValueError if a chat message is empty or too long to send"""
+    if not message.strip():
+        raise ValueError("message is empty")
+    tokens = count_tokens(message)
+    if tokens > CHAT_MAX_MESSAGE_TOKENS:
+        raise ValueError(f"message is {tokens} tokens, the limit is {CHAT_MAX_MESSAGE_TOKENS}")
+
+
+def history_window(turns: List[Turn], budget: int) -> List[Turn]:
+    """The newest turns whose tokens add up to at most budget, oldest first"""
+    kept, tokens = 0, 0
+    for turn in reversed(turns):
+        tokens += turn.tokens
+        if tokens > budget:
+            break
+        kept += 1
+    return turns[len(turns) - kept:]
+
+
+def _cache_key(message: str) -> str:
+    question = _NOT_WORD.sub(" ", message.lower()).strip()
+    return f"chat:{hashlib.sha1(question.encode('utf-8')).hexdigest()}"
+
+
+def stream_reply(session: ChatSession, message: str) -> Iterator[Dict[str, Any]]:
+    """
+    Events for one turn: `session`, `token` per reply chunk, then `done`
+    (or `error`). The turn is added to the session once the reply is complete.
+    """
+    start = time.perf_counter()
+    yield {"event": "session", "data": {"session_id": session.id}}
+    turns = session.history()
+    question = make_turn("Student", message)
+    budget = CHAT_PROMPT_TOKENS - get_template("chat").static_tokens - question.tokens
+    window = history_window(turns, max(0, budget))
+    if len(window) < len(turns):
+        PROMPT_TRIMS.inc(len(turns) - len(window), template="chat")
+
+    key = _cache_key(message) if not turns and CHAT_CACHE_TTL > 0 else None
+    if key is not None:
+        cached = get_cached_cf_response("", key, CHAT_CACHE_TTL)
+        CACHE_REQUESTS.inc(cache="chat", result="miss" if cached is None else "hit")
+        if cached is not None:
+            CHAT_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - start, source="cache")
+            yield {"event": "token", "data": {"text": cached["reply"]}}
+            session.append(question, make_turn("Tutor", cached["reply"]))
+            CHAT_TURNS.inc(outcome="cached")
+            yield {"event": "done", "data": {"cached": True, "history_turns": 0, "trimmed_turns": 0}}
+            return
+
+    prompt = compile_prompt("chat", CHAT_PROMPT_TOKENS, HISTORY="\n".join(f"{t.role}: {t.text}" for t in window),
+                            MESSAGE=message)
+    chunks = []
+    try:
+        for chunk in get_router().stream(prompt.text, max_tokens=CHAT_MAX_REPLY_TOKENS, timeout=CHAT_TIMEOUT):
+            if not chunks:
+                CHAT_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - start, source="llm")
+            chunks.append(chunk)
+            yield {"event": "token", "data": {"text": chunk}}
+    except (LLMError, DeadlineExceeded) as e:
+        print(f"Warning: chat reply failed: {e}")
+        CHAT_TURNS.inc(outcome="failed")
+        yield {"event": "error", "data": {"message": "The tutor is unavailable right now, please try again",
+                                          "partial": bool(chunks)}}
+        return
+    except GeneratorExit:
+        # The client went away mid-reply: the turn is not kept
+        CHAT_TURNS.inc(outcome="cancelled")
+        raise
+
+    reply = "".join(chunks)
+    record_reply(prompt, reply)
+    session.append(question, make_turn("Tutor", reply))
+    if key is not None and reply.strip():
+        cache_cf_response("", key, {"reply": reply})
+    CHAT_TURNS.inc(outcome="streamed")
+    yield {"event": "done", "data": {"cached": False, "history_turns": len(window),
+                                     "trimmed_turns": len(turns) - len(window), "prompt_tokens": prompt.tokens}}
@@ -0,0 +1,338 @@
+# backend/app/cohort_baselines.py
+"""
+Per-topic percentile ranks against handles of similar rating.
+
+`build` (offline) groups the baseline-synced handles in the submission
+store by rating bucket (COHORT_BUCKET_WIDTH rating points wide). For each
+bucket and tag it tabulates the handles' success rates, solved / (solved +
+failed) over their newest COHORT_MAX_SUBMISSIONS submissions, counted as
+in the topic statistics. Only handles with COHORT_MIN_ATTEMPTS attempts on
+the tag are included. For every whole-percent success rate the table holds
+its percentile rank in that cohort (ties count half), so a lookup is one
+array index. The tables are a uint8 array of buckets x tags x 101 ranks
+with cohort sizes and medians, written as a .npz file of a few tens of KB.
+The service loads it at startup and reloads it when the file changes.
+
+Rebuilds are incremental. A state file keeps each handle's tag counts and
+rating, and the submissions rowid they cover. A rebuild recounts only the
+handles with submissions stored since then. It refreshes ratings older
+than COHORT_RATING_MAX_AGE_DAYS from cached user.info responses, or with
+one user.info call per COHORT_RATING_BATCH handles. It then recomputes
+the ranks from the per-handle counts.
+
+    cd backend
+    python -m app.cohort_baselines build
+    python -m app.cohort_baselines build --full --offline
+    python -m app.cohort_baselines show --rating 1500 --tag dp
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from . import db
+from .cf_client import fetch_user_infos
+from .ingest import CF_MIN_INTERVAL, Throttle
+from .stats_index import TopicIndex
+
+_backend_dir = os.path.join(os.path.dirname(__file__), "..")
+COHORT_BASELINES_PATH = os.getenv("COHORT_BASELINES_PATH", os.path.join(_backend_dir, "cohort_baselines.npz"))
+# Per-handle counts for incremental rebuilds (not needed to serve)
+COHORT_STATE_PATH = os.getenv("COHORT_STATE_PATH", os.path.join(_backend_dir, "cohort_baselines.state.npz"))
+COHORT_BUCKET_WIDTH = int(os.getenv("COHORT_BUCKET_WIDTH", "200"))
+COHORT_MAX_RATING = int(os.getenv("COHORT_MAX_RATING", "3600"))
+COHORT_MIN_ATTEMPTS = int(os.getenv("COHORT_MIN_ATTEMPTS", "5"))
+# Smaller cohorts get no percentile
+COHORT_MIN_HANDLES = int(os.getenv("COHORT_MIN_HANDLES", "20"))
+# Same history length as the topic statistics in /api/recommendations
+COHORT_MAX_SUBMISSIONS = int(os.getenv("COHORT_MAX_SUBMISSIONS", "500"))
+COHORT_RATING_MAX_AGE_DAYS = float(os.getenv("COHORT_RATING_MAX_AGE_DAYS", "7"))
+COHORT_RATING_BATCH = int(os.getenv("COHORT_RATING_BATCH", "300"))
+
+LEVELS = 101  # success rates 0%..100%
+_UNKNOWN_HANDLE = re.compile(r"handles?: User with handle (\S+) not found")
+
+
+def rating_bucket(rating: int) -> int:
+    """Bucket index of a rating (unrated handles count as 0)"""
+    return min(max(0, int(rating or 0)), COHORT_MAX_RATING) // COHORT_BUCKET_WIDTH
+
+
+def bucket_label(bucket: int, width: int = COHORT_BUCKET_WIDTH) -> str:
+    return f"{bucket * width}-{(bucket + 1) * width - 1}"
+
+
+def _write_npz(path: str, **arrays):
+    """np.savez to a temporary file, then rename over path (readers never see a partial file)"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+
+class CohortState:
+    """Per-handle tag counts and ratings, plus the submissions rowid they cover"""
+
+    def __init__(self):
+        self.cursor = 0
+        self.counts: Dict[str, Dict[str, Tuple[int, int]]] = {}  # handle -> tag -> (solved, failed)
+        self.ratings: Dict[str, Tuple[int, float]] = {}          # handle -> (rating, fetched_at)
+
+    @classmethod
+    def load(cls, path: str = COHORT_STATE_PATH) -> "CohortState":
+        state = cls()
+        if not os.path.exists(path):
+            return state
+        with np.load(path) as data:
+            handles = data["handles"].tolist()
+            tags = data["tags"].tolist()
+            state.cursor = int(data["cursor"])
+            counts = data["counts"].tolist()
+            ratings = data["ratings"].tolist()
+            rating_at = data["rating_at"].tolist()
+        for handle, pairs, rating, fetched_at in zip(handles, counts, ratings, rating_at):
+            state.counts[handle] = {tag: tuple(pair) for tag, pair in zip(tags, pairs) if pair[0] or pair[1]}
+            if fetched_at > 0:
+                state.ratings[handle] = (rating, fetched_at)
+        return state
+
+    def save(self, path: str = COHORT_STATE_PATH):
+        handles = sorted(set(self.counts) | set(self.ratings))
+        tags = sorted({tag for counts in self.counts.values() for tag in counts})
+        tag_ids = {tag: i for i, tag in enumerate(tags)}
+        counts = np.zeros((len(handles), len(tags), 2), dtype=np.int32)
+        ratings = np.zeros(len(handles), dtype=np.int32)
+        rating_at = np.zeros(len(handles), dtype=np.float64)
+        for i, handle in enumerate(handles):
+            for tag, pair in self.counts.get(handle, {}).items():
+                counts[i, tag_ids[tag]] = pair
+            ratings[i], rating_at[i] = self.ratings.get(handle, (0, 0.0))
+        _write_npz(path, cursor=np.int64(self.cursor), handles=np.array(handles, dtype=str),
+                   tags=np.array(tags, dtype=str), counts=counts, ratings=ratings, rating_at=rating_at)
+
+
+def _recount(state: CohortState, handles: List[str]):
+    for handle in handles:
+        topics = TopicIndex(db.load_submissions(handle, COHORT_MAX_SUBMISSIONS)).statistics()["topic_stats"]
+        state.counts[handle] = {tag: (t["solved"], t["failed"]) for tag, t in topics.items()}
+
+
+def _refresh_ratings(state: CohortState, handles: List[str], offline: bool,
+                     min_interval: float = CF_MIN_INTERVAL) -> Dict[str, Any]:
+    """Ratings older than COHORT_RATING_MAX_AGE_DAYS, from cached user.info or batched API calls"""
+    max_age = COHORT_RATING_MAX_AGE_DAYS * 86400
+    now = time.time()
+    stale = [h for h in handles if now - state.ratings.get(h, (0, 0.0))[1] > max_age]
+    missing = []
+    for handle in stale:
+        cached = db.get_cached_cf_response(handle, "user.info", max_age)
+        if cached and cached.get("status") == "OK" and cached["result"]:
+            state.ratings[handle] = (cached["result"][0].get("rating", 0), now)
+        else:
+            missing.append(handle)
+    report = {"stale": len(stale), "from_cache": len(stale) - len(missing), "fetched": 0, "unknown": [], "api_calls": 0}
+    if offline:
+        return report
+
+    throttle = Throttle(min_interval)
+    for i in range(0, len(missing), COHORT_RATING_BATCH):
+        batch = missing[i:i + COHORT_RATING_BATCH]
+        while batch:
+            throttle.wait("user.info")
+            report["api_calls"] += 1
+            data = fetch_user_infos(batch)
+            if data.get("status") == "OK":
+                for user in data["result"]:
+                    state.ratings[user["handle"].lower()] = (user.get("rating", 0), time.time())
+                report["fetched"] += len(data["result"])
+                break
+            # One unknown (renamed or deleted) handle fails the whole call: drop it and retry
+            unknown = _UNKNOWN_HANDLE.search(str(data.get("comment", "")))
+            if unknown is None or unknown.group(1).lower() not in batch:
+                print(f"Warning: user.info failed for {len(batch)} handles: {data.get('comment')}")
+                break
+            batch.remove(unknown.group(1).lower())
+            report["unknown"].append(unknown.group(1).lower())
+    return report
+
+
+def compute_tables(state: CohortState) -> Dict[str, np.ndarray]:
+    """Rank, size and median arrays (buckets x tags) from per-handle counts"""
+    handles = [h for h in state.counts if h in state.ratings]
+    tags = sorted({tag for h in handles for tag in state.counts[h]})
+    tag_ids = {tag: i for i, tag in enumerate(tags)}
+    buckets = rating_bucket(COHORT_MAX_RATING) + 1
+
+    rows, cols, solved, attempts = [], [], [], []
+    for handle in handles:
+        bucket = rating_bucket(state.ratings[handle][0])
+        for tag, (s, f) in state.counts[handle].items():
+            if s + f >= max(1, COHORT_MIN_ATTEMPTS):
+                rows.append(bucket)
+                cols.append(tag_ids[tag])
+                solved.append(s)
+                attempts.append(s + f)
+    # Whole-percent success rates, rounded half to even like round() in lookup
+    levels = np.rint(100 * np.array(solved, dtype=np.float64) / np.array(attempts, dtype=np.float64))
+    hist = np.zeros((buckets, len(tags), LEVELS), dtype=np.int64)
+    np.add.at(hist, (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64), levels.astype(np.int64)), 1)
+
+    sizes = hist.sum(axis=2)
+    below = np.cumsum(hist, axis=2) - hist
+    ranks = np.rint(100 * (below + 0.5 * hist) / np.maximum(sizes, 1)[..., None]).astype(np.uint8)
+    # First level at which half the cohort is at or below
+    medians = np.argmax(np.cumsum(hist, axis=2) * 2 >= np.maximum(sizes, 1)[..., None], axis=2).astype(np.uint8)
+    return {"ranks": ranks, "sizes": sizes.astype(np.uint32), "medians": medians, "tags": np.array(tags, dtype=str),
+            "handles": len(handles)}
+
+
+def build(full: bool = False, offline: bool = False, path: str = COHORT_BASELINES_PATH,
+          state_path: str = COHORT_STATE_PATH, min_interval: float = CF_MIN_INTERVAL) -> Dict[str, Any]:
+    """Bring the per-handle state up to date with the submission store and rewrite the tables"""
+    if db.STORAGE_BACKEND != "sqlite":
+        raise RuntimeError("Cohort baselines need STORAGE_BACKEND=sqlite")
+    started = time.time()
+    state = CohortState() if full else CohortState.load(state_path)
+    cursor, changed = db.submission_changes_after(state.cursor)
+    # Contest dumps alone are a partial history; only handles with a user.status baseline are compared against
+    sync = db.get_submission_sync(changed)
+    changed = [h for h in changed if (sync.get(h) or {}).get("baseline_at") is not None]
+    _recount(state, changed)
+    state.cursor = cursor
+    ratings = _refresh_ratings(state, list(state.counts), offline, min_interval)
+    for handle in ratings["unknown"]:
+        state.counts.pop(handle, None)
+        state.ratings.pop(handle, None)
+
+    tables = compute_tables(state)
+    meta = {
+        "built_at": datetime.now(timezone.utc).isoformat(),
+        "bucket_width": COHORT_BUCKET_WIDTH,
+        "max_rating": COHORT_MAX_RATING,
+        "min_attempts": COHORT_MIN_ATTEMPTS,
+        "max_submissions": COHORT_MAX_SUBMISSIONS,
+        "handles": tables.pop("handles"),
+    }
+    _write_npz(path, meta=np.array(json.dumps(meta)), **tables)
+    state.save(state_path)
+    return {
+        **meta,
+        "handles_recounted": len(changed),
+        "handles_without_rating": len(state.counts) - sum(1 for h in state.counts if h in state.ratings),
+        "ratings": ratings,
+        "tags": len(tables["tags"]),
+        "bytes": os.path.getsize(path),
+        "seconds": round(time.time() - started, 2),
+    }
+
+
+class BaselineTable:
+    """Loaded tables: percentile rank of a success rate is one index into `ranks`"""
+
+    def __init__(self, path: str):
+        with np.load(path) as data:
+            self.ranks = data["ranks"]
+            self.sizes = data["sizes"]
+            self.medians = data["medians"]
+            self.tag_ids = {tag: i for i, tag in enumerate(data["tags"].tolist())}
+            self.meta = json.loads(str(data["meta"]))
+        self.bucket_width = self.meta["bucket_width"]
+        self.max_bucket = self.meta["max_rating"] // self.bucket_width
+
+    def bucket(self, rating: int) -> int:
+        return min(max(0, int(rating or 0)) // self.bucket_width, self.max_bucket)
+
+    def lookup(self, rating: int, tag: str, solved: int, failed: int) -> Optional[Dict[str, Any]]:
+        """Percentile rank of solved / (solved + failed) among handles in rating's bucket, None without a cohort"""
+        tag_id = self.tag_ids.get(tag)
+        if tag_id is None or solved + failed < max(1, self.meta["min_attempts"]):
+            return None
+        bucket = self.bucket(rating)
+        size = int(self.sizes[bucket, tag_id])
+        if size < COHORT_MIN_HANDLES:
+            return None
+        return {
+            "percentile": int(self.ranks[bucket, tag_id, round(100 * solved / (solved + failed))]),
+            "cohort_size": size,
+            "cohort_median_success_rate": int(self.medians[bucket, tag_id]) / 100,
+        }
+
+    def annotate(self, stats: Dict[str, Any], rating: int):
+        """Add each topic's percentile among handles of the same rating bucket to full-history statistics"""
+        for tag, analysis in stats["topic_stats"].items():
+            rank = self.lookup(rating, tag, analysis["solved"], analysis["failed"])
+            if rank is not None:
+                analysis.update(rank)
+        stats["cohort"] = {"rating_bucket": bucket_label(self.bucket(rating), self.bucket_width),
+                           "built_at": self.meta["built_at"], "handles": self.meta["handles"]}
+
+
+_table: Optional[Tuple[float, Optional[BaselineTable]]] = None
+_table_lock = threading.Lock()
+
+
+def get_baselines(path: str = COHORT_BASELINES_PATH) -> Optional[BaselineTable]:
+    """The tables, loaded once per file version (None until `build` has run)"""
+    global _table
+    try:
+        version = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _table_lock:
+        if _table is None or _table[0] != version:
+            try:
+                _table = (version, BaselineTable(path))
+            except Exception as e:
+                print(f"Warning: cohort baselines at {path} are unreadable: {e}")
+                _table = (version, None)
+        return _table[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build per-(rating bucket, tag) percentile tables")
+    parser.add_argument("--path", default=COHORT_BASELINES_PATH)
+    parser.add_argument("--state", default=COHORT_STATE_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build", help="Update the tables from submissions stored since the last build")
+    build_cmd.add_argument("--full", action="store_true", help="Recount every handle instead of the changed ones")
+    build_cmd.add_argument("--offline", action="store_true", help="Use cached ratings only (no user.info calls)")
+    build_cmd.add_argument("--min-interval", type=float, default=CF_MIN_INTERVAL, help="Seconds between API calls")
+    show = sub.add_parser("show", help="Print one cohort's ranks")
+    show.add_argument("--rating", type=int, required=True)
+    show.add_argument("--tag", required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        report = build(args.full, args.offline, args.path, args.state, args.min_interval)
+        print(json.dumps(report, indent=2))
+        return 0
+    table = get_baselines(args.path)
+    if table is None:
+        print(f"No cohort baselines at {args.path}; run `python -m app.cohort_baselines build` first")
+        return 1
+    tag_id = table.tag_ids.get(args.tag)
+    if tag_id is None:
+        print(f"No handles with {args.tag} attempts")
+        return 1
+    bucket = table.bucket(args.rating)
+    print(json.dumps({
+        "rating_bucket": bucket_label(bucket, table.bucket_width),
+        "tag": args.tag,
+        "cohort_size": int(table.sizes[bucket, tag_id]),
+        "median_success_rate": int(table.medians[bucket, tag_id]) / 100,
+        "percentile_by_success_rate": {f"{level}%": int(table.ranks[bucket, tag_id, level])
+                                       for level in range(0, LEVELS, 10)},
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
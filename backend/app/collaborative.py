@@ -0,0 +1,164 @@
+# backend/app/collaborative.py
+"""
+Collaborative-filtering recommender over the submission store.
+
+The handle x problem solve matrix is kept sparse in both directions
+(handle -> solved problems, problem -> solvers). For a handle, the
+inverted index finds every user who shares a solved problem. The top
+neighbours by cosine similarity then vote, with their similarity as the
+weight, for problems the handle has not solved yet. Problems a neighbour
+solved after the last problem it shares with the handle ("what similar
+users solved next") get full weight; earlier ones get
+CF_RECS_EARLIER_WEIGHT. A lookup touches only
+the postings of the handle's own problems, so it takes milliseconds for
+cohorts of thousands of handles.
+
+The matrix is built from the submissions table and extended incrementally:
+refresh() only reads rows added since the previous refresh.
+"""
+import os
+import math
+import time
+import heapq
+import threading
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+
+from . import db
+
+CF_RECS_NEIGHBOURS = int(os.getenv("CF_RECS_NEIGHBOURS", "50"))
+# Seconds between incremental refreshes from the submission store
+CF_RECS_REFRESH_SECONDS = int(os.getenv("CF_RECS_REFRESH_SECONDS", "60"))
+# Problems solved by more users than this carry no signal about similarity
+CF_RECS_MAX_POSTINGS = int(os.getenv("CF_RECS_MAX_POSTINGS", "5000"))
+# Weight of a neighbour's solves from before the last problem it shares with the handle
+CF_RECS_EARLIER_WEIGHT = float(os.getenv("CF_RECS_EARLIER_WEIGHT", "0.3"))
+
+
+class SolveMatrix:
+    """Sparse handle x problem matrix of accepted submissions"""
+
+    def __init__(self):
+        self.solved: Dict[str, Dict[str, int]] = defaultdict(dict)  # handle -> {problem: first solve time}
+        self.solvers: Dict[str, set] = defaultdict(set)             # problem -> handles
+        self.problems: Dict[str, Dict[str, Any]] = {}               # problem -> name, rating, tags
+
+    def add(self, handle: str, problem: str, solved_at: int = 0, meta: Optional[Dict[str, Any]] = None):
+        handle = handle.lower()
+        first = self.solved[handle].get(problem)
+        if first is None or (solved_at and solved_at < first):
+            self.solved[handle][problem] = solved_at or 0
+        self.solvers[problem].add(handle)
+        if meta and problem not in self.problems:
+            self.problems[problem] = meta
+
+    def neighbours(self, handle: str, limit: int = CF_RECS_NEIGHBOURS) -> List[Tuple[float, str]]:
+        """Most similar handles by cosine similarity of their solved sets"""
+        mine = self.solved.get(handle.lower())
+        if not mine:
+            return []
+        overlap = defaultdict(int)
+        for problem in mine:
+            postings = self.solvers[problem]
+            if len(postings) > CF_RECS_MAX_POSTINGS:
+                continue
+            for other in postings:
+                overlap[other] += 1
+        overlap.pop(handle.lower(), None)
+        norm = math.sqrt(len(mine))
+        return heapq.nlargest(
+            limit, ((count / (norm * math.sqrt(len(self.solved[other]))), other) for other, count in overlap.items())
+        )
+
+    def recommend(self, handle: str, k: int = 10, min_rating: int = None, max_rating: int = None,
+                  neighbours: int = CF_RECS_NEIGHBOURS) -> List[Dict[str, Any]]:
+        """Top-k unsolved problems, scored by the similarity of the neighbours who solved them"""
+        mine = self.solved.get(handle.lower(), {})
+        similar = self.neighbours(handle, neighbours)
+        scores = defaultdict(float)
+        votes = defaultdict(int)
+        for similarity, other in similar:
+            theirs = self.solved[other]
+            shared_until = max((theirs[p] for p in mine if p in theirs), default=0)
+            for problem, solved_at in theirs.items():
+                if problem in mine:
+                    continue
+                rating = self.problems.get(problem, {}).get("rating")
+                if rating is not None and ((min_rating and rating < min_rating) or (max_rating and rating > max_rating)):
+                    continue
+                scores[problem] += similarity if solved_at > shared_until else similarity * CF_RECS_EARLIER_WEIGHT
+                votes[problem] += 1
+
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [self._describe(problem, score, votes[problem], len(similar)) for problem, score in top]
+
+    def _describe(self, problem: str, score: float, votes: int, neighbours: int) -> Dict[str, Any]:
+        meta = self.problems.get(problem, {})
+        contest_id, _, index = problem.partition("/")
+        return {
+            "title": meta.get("name") or f"Problem {contest_id}{index}",
+            "link": f"https://codeforces.com/problemset/problem/{contest_id}/{index}",
+            "rating": meta.get("rating"),
+            "tags": meta.get("tags", []),
+            "score": round(score, 4),
+            "reason": f"Solved by {votes} of your {neighbours} most similar users",
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        entries = sum(len(p) for p in self.solved.values())
+        cells = len(self.solved) * len(self.solvers)
+        return {
+            "handles": len(self.solved),
+            "problems": len(self.solvers),
+            "solves": entries,
+            "density": round(entries / cells, 6) if cells else 0,
+        }
+
+
+def problem_key(contest_id, index) -> str:
+    return f"{contest_id}/{index}"
+
+
+class CollaborativeRecommender:
+    """SolveMatrix kept in sync with the submission store"""
+
+    def __init__(self):
+        self.matrix = SolveMatrix()
+        self.cursor = 0
+        self.refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False) -> int:
+        """Add accepted submissions stored since the last refresh; returns rows read"""
+        if db.STORAGE_BACKEND != "sqlite":
+            return 0
+        if not force and time.time() - self.refreshed_at < CF_RECS_REFRESH_SECONDS:
+            return 0
+        with self._lock:
+            rows = db.iter_accepted_submissions_after(self.cursor)
+            count = 0
+            for row in rows:
+                self.matrix.add(
+                    row["handle"], problem_key(row["contest_id"], row["problem_index"]), row["created"],
+                    {"name": row["name"], "rating": row["rating"], "tags": row["tags"]},
+                )
+                self.cursor = max(self.cursor, row["rowid"])
+                count += 1
+            self.refreshed_at = time.time()
+            return count
+
+    def recommend(self, handle: str, k: int = 10, min_rating: int = None,
+                  max_rating: int = None) -> List[Dict[str, Any]]:
+        self.refresh()
+        with self._lock:
+            return self.matrix.recommend(handle, k, min_rating, max_rating)
+
+
+_recommender = None
+
+
+def get_recommender() -> CollaborativeRecommender:
+    global _recommender
+    if _recommender is None:
+        _recommender = CollaborativeRecommender()
+    return _recommender
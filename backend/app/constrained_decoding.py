@@ -0,0 +1,397 @@
+# backend/app/constrained_decoding.py
+"""
+JSON-schema-constrained decoding for the local model.
+
+The schema (an object whose properties are strings, string enums or arrays
+of strings, as in prompts/analyzer.schema.json) is compiled into a small
+automaton over the compact JSON text:
+
+- Choice nodes are the fixed text between values (`{"topics":["`, `","`,
+  `"]`, an enum option with its quotes...). When only one continuation is
+  possible, the longest vocabulary token that matches it is forced. A
+  literal therefore costs as few tokens as the vocabulary allows, and
+  sampling only happens where the model has a real choice.
+- String nodes allow any token without quotes, backslashes or control
+  characters, up to a character cap, or a token that closes the string.
+
+Each step masks the logits down to the allowed tokens. Generation stops
+once the final `}` is produced. A token is only allowed if the shortest
+way to finish after it still fits in the remaining new-token budget, so
+strings close and arrays end in time and the output always parses within
+max_new_tokens.
+
+SchemaDecoder (vocabulary index plus per-sequence state) has no torch
+dependency. JSONSchemaLogitsProcessor and JSONCompleteCriteria adapt it
+to transformers' generate().
+"""
+import os
+import json
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+# Optional imports for the transformers adapters (graceful fallback if not installed)
+try:
+    import torch
+    from transformers import LogitsProcessor, StoppingCriteria
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+# Longest string value (characters) when the schema gives no maxLength
+CONSTRAINED_MAX_STRING_CHARS = int(os.getenv("CONSTRAINED_MAX_STRING_CHARS", "160"))
+# Most array items when the schema gives no maxItems
+CONSTRAINED_MAX_ITEMS = int(os.getenv("CONSTRAINED_MAX_ITEMS", "4"))
+
+
+class Choice:
+    """Fixed text with one or more alternatives, each leading to its own next node"""
+    __slots__ = ("alternatives",)
+
+    def __init__(self, alternatives: List[Tuple[str, Any]]):
+        self.alternatives = alternatives
+
+
+class String:
+    """Free string content, closed by a token that starts the `close` choice (which begins with a quote)"""
+    __slots__ = ("max_chars", "close")
+
+    def __init__(self, max_chars: int, close: Choice):
+        self.max_chars = max_chars
+        self.close = close
+
+
+class End:
+    __slots__ = ()
+
+
+def _prepend(text: str, node):
+    """`text` followed by node, as a node (literal text merges into a Choice)"""
+    if not text:
+        return node
+    if isinstance(node, Choice):
+        return Choice([(text + alt, nxt) for alt, nxt in node.alternatives])
+    return Choice([(text, node)])
+
+
+def _compile_value(schema: Dict[str, Any], after_text: str, after_node):
+    """(leading text, node) for one value followed by after_text then after_node"""
+    kind = schema.get("type")
+    if kind == "string" and "enum" in schema:
+        return "", Choice([(json.dumps(option) + after_text, after_node) for option in schema["enum"]])
+    if kind == "string":
+        max_chars = schema.get("maxLength", CONSTRAINED_MAX_STRING_CHARS)
+        return '"', String(max_chars, _prepend('"' + after_text, after_node))
+    if kind == "array" and schema.get("items", {}).get("type") == "string":
+        max_items = max(1, schema.get("maxItems", CONSTRAINED_MAX_ITEMS))
+        max_chars = schema["items"].get("maxLength", CONSTRAINED_MAX_STRING_CHARS)
+        # Unrolled so the item count is part of the node: item i may go on to item i + 1
+        node = None
+        for i in reversed(range(max_items)):
+            alternatives = [('"]' + after_text, after_node)]
+            if node is not None:
+                alternatives.insert(0, ('","', node))
+            node = String(max_chars, _prepend_alternatives(alternatives))
+        return '["', node
+    raise ValueError(f"Unsupported schema for constrained decoding: {schema}")
+
+
+def _prepend_alternatives(alternatives):
+    """A Choice whose alternatives are flattened where they lead straight into another Choice"""
+    flat = []
+    for text, node in alternatives:
+        if isinstance(node, Choice):
+            flat.extend((text + alt, nxt) for alt, nxt in node.alternatives)
+        else:
+            flat.append((text, node))
+    return Choice(flat)
+
+
+def compile_schema(schema: Dict[str, Any]):
+    """Root node of the automaton for an object schema (properties in declared order, all emitted)"""
+    if schema.get("type") != "object":
+        raise ValueError("Constrained decoding needs an object schema")
+    after_text, after_node = "}", End()
+    names = list(schema.get("properties", {}))
+    for i in reversed(range(len(names))):
+        lead, node = _compile_value(schema["properties"][names[i]], after_text, after_node)
+        after_text = ("{" if i == 0 else ",") + json.dumps(names[i]) + ":" + lead
+        after_node = node
+    return _prepend(after_text, after_node)
+
+
+def _common_prefix(texts: Sequence[str]) -> str:
+    first, last = min(texts), max(texts)
+    i = 0
+    while i < len(first) and first[i] == last[i]:
+        i += 1
+    return first[:i]
+
+
+class SchemaDecoder:
+    """
+    A compiled schema and a tokenizer's vocabulary: the tokens allowed after
+    any prefix of a valid reply. Build once per (schema, tokenizer); track
+    each sequence with new_state().
+    """
+
+    def __init__(self, schema: Dict[str, Any], token_texts: Sequence[str], eos_token_id: int,
+                 special_ids: Sequence[int] = ()):
+        self.root = compile_schema(schema)
+        self.token_texts = list(token_texts)
+        self.eos_token_id = eos_token_id
+        special = set(special_ids) | {eos_token_id}
+        self.by_text: Dict[str, int] = {}
+        self.safe_ids: List[int] = []
+        for token_id, text in enumerate(self.token_texts):
+            if not text or token_id in special:
+                continue
+            # Shortest id wins for duplicate texts
+            self.by_text.setdefault(text, token_id)
+            if '"' not in text and "\\" not in text and "�" not in text and all(ch >= " " for ch in text):
+                self.safe_ids.append(token_id)
+        self.max_token_chars = max((len(t) for t in self.by_text), default=1)
+        self._allowed_cache: Dict[Any, List[int]] = {}
+        self._finish_cache: Dict[int, int] = {}
+        self._needed_cache: Dict[Any, int] = {}
+        self._eos_only = [eos_token_id]
+
+    # -- vocabulary lookups ------------------------------------------------
+
+    def _longest_prefix_token(self, text: str) -> Optional[int]:
+        for length in range(min(len(text), self.max_token_chars), 0, -1):
+            token_id = self.by_text.get(text[:length])
+            if token_id is not None:
+                return token_id
+        return None
+
+    def _prefix_tokens(self, texts: Sequence[str]) -> List[int]:
+        """Every token that is a prefix of one of texts"""
+        ids = set()
+        for text in texts:
+            for length in range(1, min(len(text), self.max_token_chars) + 1):
+                token_id = self.by_text.get(text[:length])
+                if token_id is not None:
+                    ids.add(token_id)
+        return sorted(ids)
+
+    def _forced_tokens(self, text: str) -> int:
+        """Tokens the forced (longest-match) encoding of text takes"""
+        count = 0
+        while text:
+            token_id = self._longest_prefix_token(text)
+            if token_id is None:
+                return len(text)
+            text = text[len(self.token_texts[token_id]):]
+            count += 1
+        return count
+
+    def _tokens_to_finish(self, node) -> int:
+        """Fewest tokens from the start of node to the end of the reply"""
+        key = id(node)
+        cached = self._finish_cache.get(key)
+        if cached is not None:
+            return cached
+        if isinstance(node, End):
+            result = 0
+        elif isinstance(node, String):
+            result = self._tokens_to_finish(node.close)
+        else:
+            result = min(self._forced_tokens(alt) + self._tokens_to_finish(nxt) for alt, nxt in node.alternatives)
+        self._finish_cache[key] = result
+        return result
+
+    # -- per-sequence state --------------------------------------------------
+
+    def new_state(self) -> "DecodeState":
+        return DecodeState(self)
+
+    def allowed(self, state: "DecodeState", tokens_left: Optional[int] = None) -> List[int]:
+        """Token ids allowed next. With tokens_left, only those that still finish the reply in time."""
+        node = state.node
+        if isinstance(node, End):
+            return self._eos_only
+
+        if isinstance(node, String):
+            key = (id(node), "close")
+            close_ids = self._allowed_cache.get(key)
+            if close_ids is None:
+                close_ids = [i for i in self._prefix_tokens([alt for alt, _ in node.close.alternatives])
+                             if self.token_texts[i].startswith('"')]
+                self._allowed_cache[key] = close_ids
+            if tokens_left is not None:
+                close_ids = self._fitting(state, close_ids, tokens_left)
+            # String content never shortens the way out, so it needs a spare token
+            out_of_room = tokens_left is not None and tokens_left <= self.tokens_needed(state)
+            if out_of_room or state.chars >= node.max_chars:
+                return close_ids
+            if state.chars == 0:
+                return self.safe_ids
+            key = (id(node), tuple(close_ids))
+            ids = self._allowed_cache.get(key)
+            if ids is None:
+                ids = self._allowed_cache[key] = self.safe_ids + close_ids
+            return ids
+
+        remaining = tuple(alt[len(state.consumed):] for alt, _ in node.alternatives if alt.startswith(state.consumed))
+        ids = self._allowed_cache.get(remaining)
+        if ids is None:
+            prefix = remaining[0] if len(remaining) == 1 else _common_prefix(remaining)
+            forced = self._longest_prefix_token(prefix) if prefix else None
+            ids = [forced] if forced is not None else self._prefix_tokens(remaining)
+            self._allowed_cache[remaining] = ids
+        if tokens_left is not None:
+            ids = self._fitting(state, ids, tokens_left)
+        return ids
+
+    def _fitting(self, state: "DecodeState", ids: List[int], tokens_left: int) -> List[int]:
+        """The ids after which the reply can still be finished within tokens_left (cached lists)"""
+        fits = [i for i in ids if 1 + self._needed_after(state, i) <= tokens_left]
+        if len(fits) == len(ids) or not fits:
+            return ids
+        return self._allowed_cache.setdefault(("fits",) + tuple(fits), fits)
+
+    def _needed_after(self, state: "DecodeState", token_id: int) -> int:
+        key = (id(state.node), state.consumed, token_id)
+        cached = self._needed_cache.get(key)
+        if cached is None:
+            probe = DecodeState(self)
+            probe.node, probe.consumed, probe.chars = state.node, state.consumed, state.chars
+            for ch in self.token_texts[token_id]:
+                probe._feed_char(ch)
+            cached = self.tokens_needed(probe) if probe.valid else len(self.token_texts) + 1
+            self._needed_cache[key] = cached
+        return cached
+
+    def tokens_needed(self, state: "DecodeState") -> int:
+        """Fewest tokens that finish the reply from state"""
+        node = state.node
+        if isinstance(node, End):
+            return 0
+        if isinstance(node, String):
+            return self._tokens_to_finish(node)
+        return min(self._forced_tokens(alt[len(state.consumed):]) + self._tokens_to_finish(nxt)
+                   for alt, nxt in node.alternatives if alt.startswith(state.consumed))
+
+
+class DecodeState:
+    """Where one sequence is in the automaton; feed it each generated token"""
+    __slots__ = ("decoder", "node", "consumed", "chars", "text", "tokens", "valid")
+
+    def __init__(self, decoder: SchemaDecoder):
+        self.decoder = decoder
+        self.node = decoder.root
+        self.consumed = ""   # text of the current Choice matched so far
+        self.chars = 0       # characters of the current String
+        self.text = []
+        self.tokens = 0
+        self.valid = True
+
+    @property
+    def done(self) -> bool:
+        return isinstance(self.node, End)
+
+    def feed(self, token_id: int):
+        self.tokens += 1
+        if self.done or not self.valid:
+            return
+        text = self.decoder.token_texts[token_id]
+        self.text.append(text)
+        for ch in text:
+            self._feed_char(ch)
+
+    def _feed_char(self, ch: str):
+        node = self.node
+        if isinstance(node, String):
+            if ch != '"':
+                self.chars += 1
+                return
+            self.node, self.consumed = node.close, ""
+            node = self.node
+        if isinstance(node, End):
+            self.valid = False
+            return
+        consumed = self.consumed + ch
+        matches = [(alt, nxt) for alt, nxt in node.alternatives if alt.startswith(consumed)]
+        if not matches:
+            self.valid = False
+            return
+        for alt, nxt in matches:
+            if alt == consumed:
+                self.node, self.consumed, self.chars = nxt, "", 0
+                return
+        self.consumed = consumed
+
+    def output(self) -> str:
+        return "".join(self.text)
+
+
+def token_texts(tokenizer) -> List[str]:
+    """Each vocabulary id's text as it reads inside generated output"""
+    texts = []
+    for token in tokenizer.convert_ids_to_tokens(list(range(len(tokenizer)))):
+        if token is None:
+            texts.append("")
+            continue
+        text = tokenizer.convert_tokens_to_string([token])
+        # SentencePiece drops the word-boundary space of a lone token
+        if token.startswith("▁") and not text.startswith(" "):
+            text = " " + text
+        texts.append(text)
+    return texts
+
+
+if TORCH_AVAILABLE:
+    class _Tracker:
+        """DecodeStates for a batch, fed from generate()'s input_ids"""
+
+        def __init__(self, decoder: SchemaDecoder, prompt_length: int, batch_size: int):
+            self.decoder = decoder
+            self.prompt_length = prompt_length
+            self.states = [decoder.new_state() for _ in range(batch_size)]
+
+        def sync(self, input_ids):
+            for row, state in enumerate(self.states):
+                for token_id in input_ids[row, self.prompt_length + state.tokens:].tolist():
+                    state.feed(token_id)
+
+    class JSONSchemaLogitsProcessor(LogitsProcessor):
+        """Mask logits to the tokens the schema allows next"""
+
+        def __init__(self, tracker: "_Tracker", max_new_tokens: int):
+            self.tracker = tracker
+            self.max_new_tokens = max_new_tokens
+            self._masks: Dict[int, Any] = {}
+
+        def __call__(self, input_ids, scores):
+            self.tracker.sync(input_ids)
+            for row, state in enumerate(self.tracker.states):
+                allowed = self.tracker.decoder.allowed(state, self.max_new_tokens - state.tokens)
+                # allowed lists are cached by the decoder, so their ids are stable
+                key = id(allowed)
+                mask = self._masks.get(key)
+                if mask is None or mask.device != scores.device:
+                    mask = torch.full((scores.shape[-1],), float("-inf"), dtype=scores.dtype, device=scores.device)
+                    mask[torch.tensor(allowed, device=scores.device)] = 0.0
+                    self._masks[key] = mask
+                scores[row] = scores[row] + mask
+            return scores
+
+    class JSONCompleteCriteria(StoppingCriteria):
+        """Per-row stop once a sequence has produced its closing brace (per-row results need transformers 4.39+)"""
+
+        def __init__(self, tracker: "_Tracker"):
+            self.tracker = tracker
+
+        def __call__(self, input_ids, scores, **kwargs):
+            self.tracker.sync(input_ids)
+            return torch.tensor([state.done for state in self.tracker.states], device=input_ids.device)
+
+    def constrained_generation_kwargs(decoder: SchemaDecoder, prompt_length: int, batch_size: int,
+                                      max_new_tokens: int) -> Dict[str, Any]:
+        """logits_processor and stopping_criteria for model.generate(), plus the tracker to read results from"""
+        from transformers import LogitsProcessorList, StoppingCriteriaList
+        tracker = _Tracker(decoder, prompt_length, batch_size)
+        return {
+            "logits_processor": LogitsProcessorList([JSONSchemaLogitsProcessor(tracker, max_new_tokens)]),
+            "stopping_criteria": StoppingCriteriaList([JSONCompleteCriteria(tracker)]),
+            "max_new_tokens": max_new_tokens,
+        }, tracker
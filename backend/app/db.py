@@ -1,14 +1,302 @@
 # backend/app/db.py
-import json, time, os
-LOGFILE = os.path.join(os.path.dirname(__file__), "..", "logs.jsonl")
+"""
+Storage for interaction logs, evaluation results, cached Codeforces data and
+the per-handle submission store.
+
+The default backend is SQLite (WAL mode) with indexes on handle and time, so
+per-handle history and time-windowed aggregates do not need a linear scan.
+Set STORAGE_BACKEND=jsonl to keep the old append-only files instead.
+Writes go through a background batch writer in both cases.
+
+One-shot import of existing JSONL files:
+    python -m app.db import-jsonl
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+
+from .log_writer import BackgroundWriter, get_writer, register_writer
+from .submission_array import SubmissionArray
+
+_backend_dir = os.path.join(os.path.dirname(__file__), "..")
+LOGFILE = os.getenv("LOG_FILE", os.path.join(_backend_dir, "logs.jsonl"))
+EVAL_RESULTS_FILE = os.getenv("EVAL_RESULTS_FILE", os.path.join(_backend_dir, "evaluation_results.jsonl"))
+DB_PATH = os.getenv("DB_PATH", os.path.join(_backend_dir, "dsa_agent.db"))
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    time INTEGER NOT NULL,
+    handle TEXT NOT NULL,
+    subs_count INTEGER,
+    payload TEXT NOT NULL,
+    dedupe_key TEXT UNIQUE
+);
+CREATE INDEX IF NOT EXISTS idx_interactions_handle_time ON interactions (handle, time);
+CREATE INDEX IF NOT EXISTS idx_interactions_time ON interactions (time);
+
+CREATE TABLE IF NOT EXISTS evaluations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    time REAL NOT NULL,
+    handle TEXT NOT NULL,
+    submission_count INTEGER,
+    analysis_quality REAL,
+    recommendation_quality REAL,
+    overall_agent_score REAL,
+    payload TEXT NOT NULL,
+    dedupe_key TEXT UNIQUE
+);
+CREATE INDEX IF NOT EXISTS idx_evaluations_handle_time ON evaluations (handle, time);
+CREATE INDEX IF NOT EXISTS idx_evaluations_time ON evaluations (time);
+
+CREATE TABLE IF NOT EXISTS cf_cache (
+    handle TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (handle, endpoint)
+);
+CREATE INDEX IF NOT EXISTS idx_cf_cache_fetched ON cf_cache (fetched_at);
+
+-- Per-handle submissions, filled by user.status fetches and contest.status ingestion (app.ingest)
+CREATE TABLE IF NOT EXISTS submissions (
+    handle TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    contest_id INTEGER,
+    problem_index TEXT,
+    name TEXT,
+    tags TEXT,
+    rating INTEGER,
+    verdict TEXT,
+    created INTEGER,
+    PRIMARY KEY (handle, id)
+);
+CREATE INDEX IF NOT EXISTS idx_submissions_handle_created ON submissions (handle, created);
+
+-- baseline_at: last full user.status fetch; synced_at: last time the store was brought up to date
+CREATE TABLE IF NOT EXISTS submission_sync (
+    handle TEXT PRIMARY KEY,
+    baseline_at REAL,
+    synced_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS ingested_contests (
+    contest_id INTEGER PRIMARY KEY,
+    ingested_at REAL NOT NULL,
+    submissions INTEGER NOT NULL,
+    api_calls INTEGER NOT NULL
+);
+
+-- Handles a contest dump was split for; another cohort's handles still need the contest
+CREATE TABLE IF NOT EXISTS ingested_contest_handles (
+    contest_id INTEGER NOT NULL,
+    handle TEXT NOT NULL,
+    PRIMARY KEY (contest_id, handle)
+);
+
+-- Per-tag skill model state (app.skill_model), updated incrementally
+CREATE TABLE IF NOT EXISTS skill_ratings (
+    handle TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL,
+    payload TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS tracked_handles (
+    handle TEXT PRIMARY KEY,
+    added_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS precomputed_results (
+    handle TEXT PRIMARY KEY,
+    computed_at REAL,
+    payload TEXT,
+    last_attempt REAL,
+    last_error TEXT
+);
+"""
+
+# Applied once per database, in order; PRAGMA user_version counts the ones already run
+MIGRATIONS = [
+    # Tracked handles were stored as typed; they are keyed by handle_key like the submission store
+    """
+    UPDATE OR IGNORE tracked_handles SET handle = lower(handle);
+    DELETE FROM tracked_handles WHERE handle != lower(handle);
+    UPDATE OR IGNORE precomputed_results SET handle = lower(handle);
+    DELETE FROM precomputed_results WHERE handle != lower(handle);
+    """,
+    # Interactions, evaluations and cached Codeforces responses were keyed by the handle as typed
+    """
+    UPDATE interactions SET handle = lower(handle) WHERE handle != lower(handle);
+    UPDATE evaluations SET handle = lower(handle) WHERE handle != lower(handle);
+    UPDATE OR IGNORE cf_cache SET handle = lower(handle) WHERE handle != lower(handle);
+    DELETE FROM cf_cache WHERE handle != lower(handle);
+    """,
+]
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+def get_connection(path: str = None) -> sqlite3.Connection:
+    """Per-thread connection (sqlite3 connections must not cross threads)"""
+    path = os.path.abspath(path or DB_PATH)
+    conns = getattr(_local, "conns", None)
+    if conns is None or getattr(_local, "pid", None) != os.getpid():
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    conn = conns.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _schema_lock:
+            if path not in _schema_ready:
+                conn.executescript(SCHEMA)
+                _migrate(conn)
+                _schema_ready.add(path)
+        conns[path] = conn
+    return conn
+
+
+def _migrate(conn: sqlite3.Connection):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, script in enumerate(MIGRATIONS[version:], version + 1):
+        # Idempotent, so two workers racing on a fresh database is harmless
+        conn.executescript(f"BEGIN; {script} PRAGMA user_version = {number}; COMMIT;")
+
+
+def handle_key(handle: str) -> str:
+    """Codeforces handles are case-insensitive; every table stores and queries them lower-cased"""
+    return (handle or "").lower()
+
+
+def _to_epoch(timestamp) -> float:
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+def _interaction_row(entry: Dict, dedupe_key: str = None) -> Tuple:
+    return (entry.get("time", int(time.time())), handle_key(entry.get("handle")), entry.get("subs_count"),
+            json.dumps(entry, default=str), dedupe_key)
+
+
+def _evaluation_row(eval_result: Dict, dedupe_key: str = None) -> Tuple:
+    metrics = eval_result.get("metrics", {})
+    return (
+        _to_epoch(eval_result.get("timestamp")),
+        handle_key(eval_result.get("handle")),
+        eval_result.get("submission_count"),
+        metrics.get("analysis", {}).get("average_overall_quality"),
+        metrics.get("recommendations", {}).get("recommendation_quality"),
+        metrics.get("overall_agent_score"),
+        json.dumps(eval_result, default=str),
+        dedupe_key,
+    )
+
+
+def _cf_cache_row(item: Tuple) -> Tuple:
+    handle, endpoint, fetched_at, payload = item
+    return (handle_key(handle), endpoint, fetched_at, json.dumps(payload))
+
+
+def _submission_row(item: Tuple) -> Tuple:
+    handle, sub = item
+    return (handle_key(handle), sub.get("id"), sub.get("contestId"), sub.get("index"), sub.get("name"),
+            json.dumps(sub.get("tags") or []), sub.get("rating"), sub.get("verdict"),
+            sub.get("creationTimeSeconds"))
+
+
+def _submission_sync_row(item: Tuple) -> Tuple:
+    handle, baseline_at, synced_at = item
+    return (handle_key(handle), baseline_at, synced_at)
+
+
+def _skill_rating_row(item: Tuple) -> Tuple:
+    handle, state = item
+    return (handle_key(handle), time.time(), json.dumps(state))
+
+
+# Records are queued as (table, object) and turned into rows on the writer thread
+_ROW_BUILDERS = {
+    "interactions": _interaction_row,
+    "evaluations": _evaluation_row,
+    "cf_cache": _cf_cache_row,
+    "submissions": _submission_row,
+    "submission_sync": _submission_sync_row,
+    "skill_ratings": _skill_rating_row,
+}
+
+_INSERTS = {
+    "interactions": "INSERT OR IGNORE INTO interactions (time, handle, subs_count, payload, dedupe_key) VALUES (?, ?, ?, ?, ?)",
+    "evaluations": "INSERT OR IGNORE INTO evaluations (time, handle, submission_count, analysis_quality, "
+                   "recommendation_quality, overall_agent_score, payload, dedupe_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+    "cf_cache": "INSERT OR REPLACE INTO cf_cache (handle, endpoint, fetched_at, payload) VALUES (?, ?, ?, ?)",
+    "submissions": "INSERT OR REPLACE INTO submissions (handle, id, contest_id, problem_index, name, tags, "
+                   "rating, verdict, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+    "submission_sync": "INSERT INTO submission_sync (handle, baseline_at, synced_at) VALUES (?, ?, ?) "
+                       "ON CONFLICT(handle) DO UPDATE SET synced_at = excluded.synced_at, "
+                       "baseline_at = COALESCE(excluded.baseline_at, submission_sync.baseline_at)",
+    "skill_ratings": "INSERT OR REPLACE INTO skill_ratings (handle, updated_at, payload) VALUES (?, ?, ?)",
+}
+
+
+def _insert_rows(conn: sqlite3.Connection, rows_by_table: Dict[str, List[Tuple]]):
+    with conn:
+        for table, rows in rows_by_table.items():
+            if rows:
+                conn.executemany(_INSERTS[table], rows)
+
+
+class SqliteWriter(BackgroundWriter):
+    """Batches (table, row) pairs into one transaction per flush"""
+
+    def __init__(self, path: str):
+        super().__init__(os.path.basename(path))
+        self.path = path
+
+    def _write_batch(self, records):
+        if not records:
+            return
+        try:
+            rows_by_table = {}
+            for table, obj in records:
+                rows_by_table.setdefault(table, []).append(_ROW_BUILDERS[table](obj))
+            _insert_rows(get_connection(self.path), rows_by_table)
+        except Exception as e:
+            print(f"Warning: Failed to write {len(records)} rows to {self.path}: {e}")
+
+    def _on_stop(self):
+        conn = getattr(_local, "conns", {}).pop(os.path.abspath(self.path), None)
+        if conn is not None:
+            conn.close()
+
+
+_writer = None
+
+
+def _sqlite_writer() -> SqliteWriter:
+    global _writer
+    if _writer is None:
+        _writer = register_writer(f"sqlite:{os.path.abspath(DB_PATH)}", SqliteWriter(DB_PATH))
+    return _writer
+
 
 def log_interaction(handle, subs, analysis, recs):
     try:
-        # Ensure the log file directory exists
-        log_dir = os.path.dirname(LOGFILE)
-        if log_dir and not os.path.exists(log_dir):
-            os.makedirs(log_dir, exist_ok=True)
-        
         entry = {
             "time": int(time.time()),
             "handle": handle,
@@ -16,7 +304,403 @@ def log_interaction(handle, subs, analysis, recs):
             "analysis_sample": analysis[:3],
             "recommendations": recs
         }
-        with open(LOGFILE, "a", encoding="utf-8") as f:
-            f.write(json.dumps(entry) + "\n")
+        # Written by a background writer, so the request never waits on disk
+        if STORAGE_BACKEND == "sqlite":
+            _sqlite_writer().write(("interactions", entry))
+        else:
+            get_writer(LOGFILE).write(entry)
     except Exception as e:
         print(f"Warning: Failed to write log: {e}")
+
+
+def save_evaluation(eval_result: Dict):
+    """Queue an evaluation result for the configured backend"""
+    if STORAGE_BACKEND == "sqlite":
+        _sqlite_writer().write(("evaluations", eval_result))
+    else:
+        get_writer(EVAL_RESULTS_FILE).write(eval_result)
+
+
+def evaluation_cursor():
+    """
+    Position after the last stored evaluation: the highest row id in
+    SQLite, or [generation, byte offset] of the JSONL file (see
+    JsonlWriter.cursor). Pending writes are flushed first.
+    """
+    if STORAGE_BACKEND == "sqlite":
+        _sqlite_writer().flush()
+        row = get_connection().execute("SELECT COALESCE(MAX(id), 0) FROM evaluations").fetchone()
+        return row[0]
+    return get_writer(EVAL_RESULTS_FILE).cursor()
+
+
+def iter_evaluations_after(cursor, end=None) -> Iterator[Dict]:
+    """Yield evaluations stored after `cursor` and up to `end` (see evaluation_cursor)"""
+    if STORAGE_BACKEND == "sqlite":
+        if end is None:
+            end = evaluation_cursor()
+        rows = get_connection().execute(
+            "SELECT payload FROM evaluations WHERE id > ? AND id <= ? ORDER BY id", (cursor, end))
+        for row in rows:
+            yield json.loads(row["payload"])
+        return
+    yield from get_writer(EVAL_RESULTS_FILE).read_after(cursor, end)
+
+
+def cache_cf_response(handle: str, endpoint: str, payload: Any):
+    """Store a raw Codeforces API result for reuse"""
+    if STORAGE_BACKEND != "sqlite":
+        return
+    try:
+        _sqlite_writer().write(("cf_cache", (handle, endpoint, time.time(), payload)))
+    except Exception as e:
+        print(f"Warning: Failed to cache Codeforces data: {e}")
+
+
+def get_cached_cf_response(handle: str, endpoint: str, max_age: float) -> Optional[Any]:
+    """Cached Codeforces result if it is younger than max_age seconds"""
+    if STORAGE_BACKEND != "sqlite" or max_age <= 0:
+        return None
+    try:
+        row = get_connection().execute(
+            "SELECT payload FROM cf_cache WHERE handle = ? AND endpoint = ? AND fetched_at >= ?",
+            (handle_key(handle), endpoint, time.time() - max_age)
+        ).fetchone()
+        return json.loads(row["payload"]) if row else None
+    except Exception as e:
+        print(f"Warning: Failed to read Codeforces cache: {e}")
+        return None
+
+
+def store_submissions(handle: str, subs: List[Dict]):
+    """
+    Queue an on-demand user.status result for the submission store. The
+    sync state is left alone: only app.ingest vouches that a handle's
+    stored history is complete and current.
+    """
+    if STORAGE_BACKEND != "sqlite":
+        return
+    try:
+        writer = _sqlite_writer()
+        for sub in subs:
+            writer.write(("submissions", (handle, sub)))
+    except Exception as e:
+        print(f"Warning: Failed to store submissions: {e}")
+
+
+def get_stored_submissions(handle: str, limit: int, max_age: float) -> Optional[SubmissionArray]:
+    """
+    The handle's newest `limit` stored submissions as a SubmissionArray, or
+    None unless the handle has a user.status baseline and was synced within
+    max_age seconds.
+    """
+    if STORAGE_BACKEND != "sqlite" or max_age <= 0:
+        return None
+    try:
+        conn = get_connection()
+        key = handle_key(handle)
+        sync = conn.execute(
+            "SELECT 1 FROM submission_sync WHERE handle = ? AND baseline_at IS NOT NULL AND synced_at >= ?",
+            (key, time.time() - max_age)
+        ).fetchone()
+        if sync is None:
+            return None
+        return load_submissions(key, limit)
+    except Exception as e:
+        print(f"Warning: Failed to read submission store: {e}")
+        return None
+
+
+def load_submissions(handle: str, limit: int) -> SubmissionArray:
+    """The handle's newest `limit` stored submissions, whatever its sync state"""
+    rows = get_connection().execute(
+        "SELECT id, contest_id, problem_index, name, tags, rating, verdict, created FROM submissions "
+        "WHERE handle = ? ORDER BY created DESC, id DESC LIMIT ?", (handle_key(handle), limit)
+    ).fetchall()
+    subs = SubmissionArray()
+    tag_lists = {}  # rows repeat a few tag json strings; parse each once
+    for r in rows:
+        tags = tag_lists.get(r["tags"])
+        if tags is None:
+            tags = tag_lists[r["tags"]] = json.loads(r["tags"])
+        subs.append(r["id"], r["created"], r["contest_id"], r["problem_index"], r["name"],
+                    r["rating"], tags, r["verdict"])
+    return subs
+
+
+def iter_accepted_submissions_after(rowid: int) -> Iterator[Dict[str, Any]]:
+    """Accepted submissions stored after `rowid`, oldest first (feeds the collaborative recommender)"""
+    rows = get_connection().execute(
+        "SELECT rowid, handle, contest_id, problem_index, name, rating, tags, created FROM submissions "
+        "WHERE rowid > ? AND verdict = 'OK' ORDER BY rowid", (rowid,)
+    )
+    for row in rows:
+        entry = dict(row)
+        entry["tags"] = json.loads(entry["tags"]) if entry["tags"] else []
+        yield entry
+
+
+def submission_changes_after(rowid: int) -> Tuple[int, List[str]]:
+    """(newest rowid, handles with submissions stored after `rowid`); re-stored rows count as new"""
+    conn = get_connection()
+    last = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM submissions").fetchone()[0]
+    handles = [row[0] for row in conn.execute(
+        "SELECT DISTINCT handle FROM submissions WHERE rowid > ? AND rowid <= ?", (rowid, last))]
+    return last, handles
+
+
+def get_submission_sync(handles: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Sync state (baseline_at, synced_at) keyed by lower-cased handle"""
+    conn = get_connection()
+    result = {}
+    keys = [handle_key(h) for h in handles]
+    # Stay under SQLite's bound-parameter limit
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        rows = conn.execute(
+            f"SELECT handle, baseline_at, synced_at FROM submission_sync WHERE handle IN ({','.join('?' * len(chunk))})",
+            chunk
+        )
+        for row in rows:
+            result[row["handle"]] = {"baseline_at": row["baseline_at"], "synced_at": row["synced_at"]}
+    return result
+
+
+def ingested_contest_handles(contest_ids: List[int]) -> Dict[int, set]:
+    """Lower-cased handles each contest has already been split for"""
+    conn = get_connection()
+    result = defaultdict(set)
+    ids = list(contest_ids)
+    # Stay under SQLite's bound-parameter limit
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        rows = conn.execute(
+            f"SELECT contest_id, handle FROM ingested_contest_handles "
+            f"WHERE contest_id IN ({','.join('?' * len(chunk))})", chunk
+        )
+        for row in rows:
+            result[row["contest_id"]].add(row["handle"])
+    return dict(result)
+
+
+def save_contest_submissions(contest_id: int, subs_by_handle: Dict[str, List[Dict]], api_calls: int,
+                             handles: List[str]) -> int:
+    """
+    Store one contest's submissions, split by handle, in a single transaction.
+    `handles` is the cohort the dump was split for, including handles
+    without submissions in the contest.
+    """
+    rows = [_submission_row((handle, sub)) for handle, subs in subs_by_handle.items() for sub in subs]
+    conn = get_connection()
+    with conn:
+        conn.executemany(_INSERTS["submissions"], rows)
+        conn.execute(
+            "INSERT OR REPLACE INTO ingested_contests (contest_id, ingested_at, submissions, api_calls) "
+            "VALUES (?, ?, ?, ?)", (contest_id, time.time(), len(rows), api_calls)
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO ingested_contest_handles (contest_id, handle) VALUES (?, ?)",
+            [(contest_id, handle_key(h)) for h in handles]
+        )
+    return len(rows)
+
+
+def save_handle_submissions(handle: str, subs: List[Dict]):
+    """Store a full user.status fetch and mark it as the handle's baseline"""
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        conn.executemany(_INSERTS["submissions"], [_submission_row((handle, sub)) for sub in subs])
+        conn.execute(_INSERTS["submission_sync"], _submission_sync_row((handle, now, now)))
+
+
+def mark_submissions_synced(handles: List[str], baseline: bool = False):
+    """Record that the store is current for these handles (baseline: after a full user.status fetch)"""
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        conn.executemany(_INSERTS["submission_sync"],
+                         [_submission_sync_row((h, now if baseline else None, now)) for h in handles])
+
+
+def get_skill_state(handle: str) -> Optional[Dict[str, Any]]:
+    try:
+        row = get_connection().execute(
+            "SELECT payload FROM skill_ratings WHERE handle = ?", (handle_key(handle),)
+        ).fetchone()
+        return json.loads(row["payload"]) if row else None
+    except Exception as e:
+        print(f"Warning: Failed to read skill state: {e}")
+        return None
+
+
+def save_skill_state(handle: str, state: Dict[str, Any]):
+    try:
+        _sqlite_writer().write(("skill_ratings", (handle, state)))
+    except Exception as e:
+        print(f"Warning: Failed to save skill state: {e}")
+
+
+def add_tracked_handle(handle: str):
+    with get_connection() as conn:
+        conn.execute("INSERT OR IGNORE INTO tracked_handles (handle, added_at) VALUES (?, ?)",
+                     (handle_key(handle), time.time()))
+
+
+def remove_tracked_handle(handle: str):
+    handle = handle_key(handle)
+    with get_connection() as conn:
+        conn.execute("DELETE FROM tracked_handles WHERE handle = ?", (handle,))
+        conn.execute("DELETE FROM precomputed_results WHERE handle = ?", (handle,))
+
+
+def is_tracked_handle(handle: str) -> bool:
+    row = get_connection().execute("SELECT 1 FROM tracked_handles WHERE handle = ?", (handle_key(handle),)).fetchone()
+    return row is not None
+
+
+def list_tracked_handles() -> List[Dict[str, Any]]:
+    """Tracked handles with the state of their precomputed result, least recently refreshed first"""
+    rows = get_connection().execute(
+        "SELECT t.handle, t.added_at, p.computed_at, p.last_attempt, p.last_error "
+        "FROM tracked_handles t LEFT JOIN precomputed_results p ON p.handle = t.handle "
+        "ORDER BY COALESCE(p.computed_at, 0)"
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def save_precomputed_result(handle: str, payload: Dict):
+    now = time.time()
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT INTO precomputed_results (handle, computed_at, payload, last_attempt, last_error) "
+            "VALUES (?, ?, ?, ?, NULL) ON CONFLICT(handle) DO UPDATE SET "
+            "computed_at = excluded.computed_at, payload = excluded.payload, "
+            "last_attempt = excluded.last_attempt, last_error = NULL",
+            (handle_key(handle), now, json.dumps(payload, default=str), now)
+        )
+
+
+def record_refresh_error(handle: str, error: str):
+    """Remember a failed refresh without touching the last good result"""
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT INTO precomputed_results (handle, last_attempt, last_error) VALUES (?, ?, ?) "
+            "ON CONFLICT(handle) DO UPDATE SET last_attempt = excluded.last_attempt, last_error = excluded.last_error",
+            (handle_key(handle), time.time(), error[:500])
+        )
+
+
+def get_precomputed_result(handle: str) -> Optional[Dict[str, Any]]:
+    """Last good result for a handle plus its refresh state, or None if never computed"""
+    row = get_connection().execute(
+        "SELECT computed_at, payload, last_attempt, last_error FROM precomputed_results "
+        "WHERE handle = ? AND payload IS NOT NULL", (handle_key(handle),)
+    ).fetchone()
+    if row is None:
+        return None
+    return {
+        "computed_at": row["computed_at"],
+        "payload": json.loads(row["payload"]),
+        "last_attempt": row["last_attempt"],
+        "last_error": row["last_error"],
+    }
+
+
+def get_handle_history(handle: str, since: float = None, until: float = None, limit: int = 50) -> Dict[str, Any]:
+    """Recent interactions and evaluations for one handle, newest first"""
+    handle = handle_key(handle)
+    since = since if since is not None else 0
+    until = until if until is not None else time.time()
+    conn = get_connection()
+    interactions = conn.execute(
+        "SELECT payload FROM interactions WHERE handle = ? AND time BETWEEN ? AND ? ORDER BY time DESC LIMIT ?",
+        (handle, since, until, limit)
+    ).fetchall()
+    evaluations = conn.execute(
+        "SELECT payload FROM evaluations WHERE handle = ? AND time BETWEEN ? AND ? ORDER BY time DESC LIMIT ?",
+        (handle, since, until, limit)
+    ).fetchall()
+    return {
+        "handle": handle,
+        "interactions": [json.loads(r["payload"]) for r in interactions],
+        "evaluations": [json.loads(r["payload"]) for r in evaluations],
+    }
+
+
+_BUCKETS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+
+
+def get_evaluation_trends(since: float = None, until: float = None, bucket: str = "day",
+                          handle: str = None) -> List[Dict[str, Any]]:
+    """Evaluation quality aggregated per time bucket"""
+    if bucket not in _BUCKETS:
+        raise ValueError(f"bucket must be one of {sorted(_BUCKETS)}")
+    width = _BUCKETS[bucket]
+    since = since if since is not None else 0
+    until = until if until is not None else time.time()
+
+    query = (
+        "SELECT CAST(time / ? AS INTEGER) * ? AS bucket_start, COUNT(*) AS evaluations, "
+        "AVG(analysis_quality) AS average_analysis_quality, "
+        "AVG(recommendation_quality) AS average_recommendation_quality, "
+        "AVG(overall_agent_score) AS average_agent_score, "
+        "MIN(overall_agent_score) AS min_agent_score, MAX(overall_agent_score) AS max_agent_score "
+        "FROM evaluations WHERE time BETWEEN ? AND ?"
+    )
+    params = [width, width, since, until]
+    if handle:
+        query += " AND handle = ?"
+        params.append(handle_key(handle))
+    query += " GROUP BY bucket_start ORDER BY bucket_start"
+
+    return [dict(row) for row in get_connection().execute(query, params)]
+
+
+def import_jsonl(logs_path: str = LOGFILE, eval_path: str = EVAL_RESULTS_FILE,
+                 batch_size: int = 1000) -> Dict[str, int]:
+    """
+    Load existing JSONL logs into SQLite. Each line is keyed by its hash, so
+    running the import twice does not create duplicates.
+    """
+    conn = get_connection()
+    counts = {}
+    for table, path, to_row in (("interactions", logs_path, _interaction_row),
+                                ("evaluations", eval_path, _evaluation_row)):
+        imported = 0
+        if os.path.exists(path):
+            batch = []
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    batch.append(to_row(record, hashlib.sha1(line.encode("utf-8")).hexdigest()))
+                    if len(batch) >= batch_size:
+                        before = conn.total_changes
+                        _insert_rows(conn, {table: batch})
+                        imported += conn.total_changes - before
+                        batch = []
+            if batch:
+                before = conn.total_changes
+                _insert_rows(conn, {table: batch})
+                imported += conn.total_changes - before
+        counts[table] = imported
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DSA Prep Agent storage utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import-jsonl", help="Import logs.jsonl and evaluation_results.jsonl into SQLite")
+    imp.add_argument("--logs", default=LOGFILE)
+    imp.add_argument("--evaluations", default=EVAL_RESULTS_FILE)
+    args = parser.parse_args()
+
+    if args.command == "import-jsonl":
+        result = import_jsonl(args.logs, args.evaluations)
+        print(f"Imported {result['interactions']} interactions and {result['evaluations']} evaluations into {DB_PATH}")
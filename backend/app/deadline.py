@@ -0,0 +1,111 @@
+# backend/app/deadline.py
+"""
+Per-request deadlines.
+
+A request gets one Deadline when it is admitted. Outbound calls and retry
+loops ask it for their timeout with `budget(cap)`, so each stage gets at
+most what is left: a slow Codeforces fetch leaves less time for the LLM
+rather than adding to the total. When too little is left, DeadlineExceeded
+is raised before the call is made. Backoff sleeps use `sleep`, which never
+sleeps past the deadline.
+
+The current deadline is held in a context variable. Blocking pipeline code
+run on a worker thread sets it with `call_within` (`run_in_thread` also
+carries the caller's other context variables, such as a request profile).
+Code running with no deadline (CLI tools, the batch runner) gets its own
+caps unchanged.
+"""
+import os
+import time
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from .profiling import profile_thread
+
+# Seconds an API request may take end to end (queueing included)
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "20"))
+# A stage with less than this left is not started
+DEADLINE_MIN_BUDGET = float(os.getenv("DEADLINE_MIN_BUDGET", "0.5"))
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time before a stage could start"""
+
+
+class Deadline:
+    __slots__ = ("at", "seconds")
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.at
+
+    def budget(self, cap: float, stage: str = "call") -> float:
+        """Timeout for the next stage: cap, or what is left if that is less"""
+        left = self.remaining()
+        if left < DEADLINE_MIN_BUDGET:
+            raise DeadlineExceeded(f"{stage}: {left:.2f}s left of the {self.seconds:g}s deadline")
+        return min(cap, left)
+
+    def sleep(self, seconds: float, stage: str = "backoff"):
+        """Sleep, unless waking up would leave too little time to do anything"""
+        if self.remaining() - seconds < DEADLINE_MIN_BUDGET:
+            raise DeadlineExceeded(f"{stage}: a {seconds:g}s wait would pass the deadline")
+        time.sleep(seconds)
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("deadline", default=None)
+
+
+def current() -> Optional[Deadline]:
+    return _current.get()
+
+
+def budget(cap: float, stage: str = "call") -> float:
+    """cap, limited by the current request's remaining time"""
+    deadline = _current.get()
+    return cap if deadline is None else deadline.budget(cap, stage)
+
+
+def sleep(seconds: float, stage: str = "backoff"):
+    deadline = _current.get()
+    if deadline is None:
+        time.sleep(seconds)
+    else:
+        deadline.sleep(seconds, stage)
+
+
+@contextmanager
+def applied(deadline: Optional[Deadline]):
+    """Make deadline the current one for the block"""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def call_within(deadline: Optional[Deadline], fn: Callable, *args, **kwargs):
+    """
+    fn(*args, **kwargs) with deadline current (for run_in_executor). The
+    thread is added to the request's profile when an admin profiles it.
+    """
+    with applied(deadline), profile_thread():
+        return fn(*args, **kwargs)
+
+
+async def run_in_thread(deadline: Optional[Deadline], fn: Callable, *args):
+    """
+    Await call_within(deadline, fn, *args) on the default executor.
+    run_in_executor does not copy context variables, so they are copied here.
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(None, context.run, call_within, deadline, fn, *args)
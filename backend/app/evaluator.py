@@ -5,19 +5,93 @@ Measures quality and reliability of agent outputs.
 """
 import json
 import os
-from typing import List, Dict, Any
+from collections import deque
+from typing import List, Dict, Any, Optional
 from datetime import datetime
 
+from .running_stats import RunningStat
+from . import db
+
+# Number of recent runs kept in memory (older ones only live in the aggregates)
+EVAL_HISTORY_SIZE = int(os.getenv("EVAL_HISTORY_SIZE", "200"))
+# Write a compact aggregate snapshot every N evaluations
+EVAL_SNAPSHOT_EVERY = int(os.getenv("EVAL_SNAPSHOT_EVERY", "25"))
+EVAL_SNAPSHOT_PATH = os.getenv("EVAL_SNAPSHOT_PATH", os.path.join(os.path.dirname(__file__), "..", "evaluation_snapshot.json"))
+
+class _Aggregates:
+    """Running aggregates over a stream of evaluation results, plus the most recent runs"""
+
+    def __init__(self, history_size: int):
+        self.total_evaluations = 0
+        self.analysis_quality = RunningStat()
+        self.recommendation_quality = RunningStat()
+        self.agent_score = RunningStat()
+        self.recent = deque(maxlen=history_size)
+
+    def record(self, eval_result: Dict):
+        """O(1) update; a malformed result raises before anything is counted"""
+        metrics = eval_result.get("metrics", {})
+        analysis = metrics["analysis"]["average_overall_quality"] if "analysis" in metrics else None
+        recommendation = (metrics["recommendations"]["recommendation_quality"]
+                          if "recommendations" in metrics else None)
+        score = float(metrics.get("overall_agent_score", 0.0))
+        self.total_evaluations += 1
+        if analysis is not None:
+            self.analysis_quality.add(analysis)
+        if recommendation is not None:
+            self.recommendation_quality.add(recommendation)
+        self.agent_score.add(score)
+        self.recent.append(eval_result)
+
+    def replay(self, eval_results) -> int:
+        """Record stored results, skipping malformed ones; returns how many were recorded"""
+        replayed = 0
+        for eval_result in eval_results:
+            try:
+                self.record(eval_result)
+                replayed += 1
+            except (KeyError, TypeError, ValueError):
+                continue
+        return replayed
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total_evaluations": self.total_evaluations,
+            "analysis_quality": self.analysis_quality.to_dict(),
+            "recommendation_quality": self.recommendation_quality.to_dict(),
+            "agent_score": self.agent_score.to_dict(),
+            "recent": list(self.recent),
+        }
+
+    def load(self, snapshot: Dict[str, Any]):
+        """Replace the aggregates with a snapshot's; left untouched if it is malformed"""
+        stats = [RunningStat.from_dict(snapshot[key])
+                 for key in ("analysis_quality", "recommendation_quality", "agent_score")]
+        self.total_evaluations = int(snapshot["total_evaluations"])
+        self.analysis_quality, self.recommendation_quality, self.agent_score = stats
+        self.recent.clear()
+        self.recent.extend(snapshot.get("recent", []))
+
+
 class AgentEvaluator:
     """
     Evaluates the quality of the DSA Prep Agent's outputs using multiple metrics.
     """
     
-    def __init__(self):
-        self.metrics_history = []
-        self.eval_results_path = os.path.join(
-            os.path.dirname(__file__), "..", "evaluation_results.jsonl"
-        )
+    def __init__(self, history_size: int = EVAL_HISTORY_SIZE, persist: bool = True):
+        """
+        Args:
+            history_size: Number of recent runs kept in memory
+            persist: Rehydrate from and save to storage and the snapshot;
+                     False gives a scratch evaluator that only scores (benchmarks)
+        """
+        self.history_size = history_size
+        self.persist = persist
+        self.snapshot_path = EVAL_SNAPSHOT_PATH
+        self.aggregates = _Aggregates(history_size)
+        self._evals_since_snapshot = 0
+        if persist:
+            self._rehydrate()
     
     def evaluate_analysis(self, submission: Dict, analysis: Dict, ground_truth: Dict = None) -> Dict[str, float]:
         """
@@ -215,40 +289,101 @@ class AgentEvaluator:
         eval_result["metrics"]["overall_agent_score"] = analysis_score * 0.6 + rec_score * 0.4
         
         # Save to history
-        self.metrics_history.append(eval_result)
-        self._save_evaluation(eval_result)
+        self.aggregates.record(eval_result)
+        if self.persist:
+            self._save_evaluation(eval_result)
+            self._evals_since_snapshot += 1
+            if self._evals_since_snapshot >= EVAL_SNAPSHOT_EVERY:
+                self.save_snapshot()
         
         return eval_result
     
     def _save_evaluation(self, eval_result: Dict):
-        """Save evaluation result to file"""
+        """Queue evaluation result for the storage backend"""
         try:
-            with open(self.eval_results_path, "a", encoding="utf-8") as f:
-                f.write(json.dumps(eval_result) + "\n")
+            db.save_evaluation(eval_result)
         except Exception as e:
             print(f"Warning: Failed to save evaluation: {e}")
     
+    def _read_snapshot(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except Exception as e:
+            print(f"Warning: Ignoring unreadable evaluation snapshot: {e}")
+            return None
+        # A cursor from another storage backend is meaningless - rebuild from scratch
+        return snapshot if snapshot.get("backend") == db.STORAGE_BACKEND else None
+    
+    def _load_snapshot(self, aggregates: _Aggregates) -> int:
+        """Load the shared snapshot into `aggregates`; returns its storage cursor (0 without one)"""
+        snapshot = self._read_snapshot()
+        if snapshot is None:
+            return 0
+        try:
+            aggregates.load(snapshot)
+            return snapshot.get("cursor", 0)
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Warning: Ignoring unreadable evaluation snapshot: {e}")
+            return 0
+    
+    def _write_snapshot(self, aggregates: _Aggregates, cursor: Any):
+        # Workers share the file, so each writes through its own temporary file
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"backend": db.STORAGE_BACKEND, "cursor": cursor, **aggregates.to_dict()}, f)
+        os.replace(tmp_path, self.snapshot_path)
+    
+    def save_snapshot(self):
+        """
+        Persist aggregates of every stored evaluation up to the current
+        storage cursor, so a restart only replays evaluations saved later.
+        The snapshot is advanced from storage rather than written from this
+        process's aggregates: with several workers sharing the storage, each
+        process only counts its own evaluations since it started.
+        """
+        if not self.persist:
+            return
+        try:
+            # Flushes queued results first, or they would be replayed twice on restart
+            end = db.evaluation_cursor()
+            aggregates = _Aggregates(self.history_size)
+            cursor = self._load_snapshot(aggregates)
+            aggregates.replay(db.iter_evaluations_after(cursor, end))
+            self._write_snapshot(aggregates, end)
+            self._evals_since_snapshot = 0
+        except Exception as e:
+            print(f"Warning: Failed to save evaluation snapshot: {e}")
+    
+    def _rehydrate(self):
+        """Restore aggregates from the snapshot, then replay any newer evaluations"""
+        cursor = self._load_snapshot(self.aggregates)
+        try:
+            end = db.evaluation_cursor()
+            replayed = self.aggregates.replay(db.iter_evaluations_after(cursor, end))
+            if replayed:
+                # Built from storage alone at this point, so it can be written as it is
+                self._write_snapshot(self.aggregates, end)
+        except Exception as e:
+            print(f"Warning: Failed to replay evaluation results: {e}")
+    
     def get_aggregate_metrics(self) -> Dict[str, Any]:
         """Get aggregate metrics across all evaluations"""
-        if not self.metrics_history:
+        if not self.aggregates.total_evaluations:
             return {"message": "No evaluations yet"}
         
-        all_analysis_qualities = [
-            m["metrics"]["analysis"]["average_overall_quality"]
-            for m in self.metrics_history
-            if "analysis" in m.get("metrics", {})
-        ]
-        
-        all_rec_qualities = [
-            m["metrics"]["recommendations"]["recommendation_quality"]
-            for m in self.metrics_history
-            if "recommendations" in m.get("metrics", {})
-        ]
-        
         return {
-            "total_evaluations": len(self.metrics_history),
-            "average_analysis_quality": sum(all_analysis_qualities) / len(all_analysis_qualities) if all_analysis_qualities else 0.0,
-            "average_recommendation_quality": sum(all_rec_qualities) / len(all_rec_qualities) if all_rec_qualities else 0.0,
-            "reliability_score": sum(m["metrics"]["overall_agent_score"] for m in self.metrics_history) / len(self.metrics_history)
+            "total_evaluations": self.aggregates.total_evaluations,
+            "average_analysis_quality": self.aggregates.analysis_quality.mean,
+            "average_recommendation_quality": self.aggregates.recommendation_quality.mean,
+            "reliability_score": self.aggregates.agent_score.mean,
+            "distributions": {
+                "analysis_quality": self.aggregates.analysis_quality.summary(),
+                "recommendation_quality": self.aggregates.recommendation_quality.summary(),
+                "overall_agent_score": self.aggregates.agent_score.summary()
+            },
+            "recent_evaluations": len(self.aggregates.recent)
         }
 
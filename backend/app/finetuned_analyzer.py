@@ -2,16 +2,42 @@
 """
 Fine-tuned analyzer using LoRA for DSA submission analysis.
 This is a parameter-efficient fine-tuning approach for the Data Science assignment.
+
+With LOCAL_ROUTING=speculative (the default), each analysis tries the local
+model first within LOCAL_LATENCY_BUDGET seconds (less if the request's
+deadline is closer). It falls back to the hosted providers if the local
+model fails or returns output that does not parse. If the budget runs
+out while the analysis is still queued, it is dropped for the API; if
+it is already generating, it races an API call started at that point.
+When LOCAL_RACE_QUEUE_DEPTH or more analyses are already waiting for the
+local model, or the queue ahead would likely use up the budget at the
+median generation time, it races both instead and takes whichever
+answers first.
+Every decision is counted by route and outcome, and its latency and the
+local model's own latency are recorded, so the budget can be tuned from
+stats() and /metrics.
 """
 import os
-import json
-import requests
+import time
+import threading
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+
+from .constrained_decoding import SchemaDecoder, token_texts
+from .llm_router import get_router
+from .lora_adapters import DEFAULT_ADAPTER, AdapterPool, discover_adapters
+from .model_artifacts import load_model, resolve_artifact
+from .prompts import compile_prompt, get_template, parse_reply
+from .deadline import DeadlineExceeded, call_within, current as current_deadline
+from .running_stats import RunningStat
+from .telemetry import FALLBACKS, Counter, Histogram, upstream_call
 
 # Optional imports for fine-tuning (graceful fallback if not installed)
 try:
     import torch
     from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
-    from peft import PeftModel, LoraConfig, get_peft_model, TaskType
+    import peft  # LoRA adapters, served by app.lora_adapters
+    from .constrained_decoding import constrained_generation_kwargs
     TORCH_AVAILABLE = True
 except ImportError:
     TORCH_AVAILABLE = False
@@ -20,139 +46,303 @@ except ImportError:
 # Configuration
 BASE_MODEL_NAME = "microsoft/DialoGPT-small"  # Smaller model for fine-tuning
 FINETUNED_MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "models", "lora_dsa_analyzer")
-GEMINI_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+# Constrain local generation to prompts/analyzer.schema.json and stop at its closing brace
+LOCAL_CONSTRAINED_DECODING = os.getenv("LOCAL_CONSTRAINED_DECODING", "true").lower() == "true"
+LOCAL_MAX_NEW_TOKENS = int(os.getenv("LOCAL_MAX_NEW_TOKENS", "200"))
+# LoRA adapter for requests that do not name one (see app/lora_adapters.py)
+LOCAL_ADAPTER = os.getenv("LOCAL_ADAPTER", DEFAULT_ADAPTER)
+# Only load from an exported artifact (python -m app.model_artifacts export), never from the hub
+MODEL_ARTIFACT_REQUIRED = os.getenv("MODEL_ARTIFACT_REQUIRED", "false").lower() == "true"
+# speculative (local first, API fallback), local (local only) or api (API only)
+LOCAL_ROUTING = os.getenv("LOCAL_ROUTING", "speculative")
+# Seconds the local model gets before the API is asked instead
+LOCAL_LATENCY_BUDGET = float(os.getenv("LOCAL_LATENCY_BUDGET", "3"))
+# Analyses already waiting for the local model before local and API are raced (0 never races)
+LOCAL_RACE_QUEUE_DEPTH = int(os.getenv("LOCAL_RACE_QUEUE_DEPTH", "2"))
+ANALYSIS_API_WORKERS = int(os.getenv("ANALYSIS_API_WORKERS", "4"))
+
+ANALYSIS_ROUTES = Counter("dsa_analysis_routes_total", "Local/API routing decisions for submission analysis",
+                          ("route", "outcome"))
+ANALYSIS_SECONDS = Histogram("dsa_analysis_seconds", "Submission analysis latency by route and who answered",
+                             ("route", "served_by"))
+LOCAL_MODEL_SECONDS = Histogram("dsa_local_model_seconds", "Local model analysis latency, queueing included")
+
+
+class _LocalLatency(RunningStat):
+    QUANTILES = (0.5, 0.9, 0.95, 0.99)
 
-# Load prompts
-_prompt_path = os.path.join(os.path.dirname(__file__), "..", "..", "prompts", "analyzer_prompt.txt")
-ANALYZER_PROMPT = open(_prompt_path, encoding="utf-8").read()
+
+def _is_analysis(result):
+    return isinstance(result, dict) and "raw" not in result
 
 class FinetunedAnalyzer:
     """
     Fine-tuned model analyzer using LoRA for DSA problem analysis.
-    Falls back to Gemini API if fine-tuned model is not available.
+    Falls back to the hosted LLM providers if fine-tuned model is not available.
     """
     
     def __init__(self, use_finetuned=True):
         self.use_finetuned = use_finetuned
         self.tokenizer = None
         self.model = None
+        self.adapters = None
+        self.decoder = None
+        # The model serves one generate at a time; the executor's queue is the local backlog
+        self._local_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="local-model")
+        self._api_pool = None
+        self._local_queued = 0
+        self._local_latency = _LocalLatency()   # submit to answer, queueing included
+        self._local_service = _LocalLatency()   # generation alone
+        self._routes = {}
+        self._lock = threading.Lock()
         
         if not TORCH_AVAILABLE:
             self.use_finetuned = False
             print("ℹ️ Using API-based analyzer (PyTorch/transformers not installed)")
-        elif use_finetuned and os.path.exists(FINETUNED_MODEL_PATH):
+            return
+        artifact = resolve_artifact() if use_finetuned else None
+        if artifact is not None:
+            adapters = artifact.adapters
+        elif use_finetuned and not MODEL_ARTIFACT_REQUIRED:
+            adapters = discover_adapters(FINETUNED_MODEL_PATH)
+        else:
+            adapters = {}
+        if adapters or artifact is not None and artifact.merged:
             try:
-                self._load_finetuned_model()
-                print("✅ Loaded fine-tuned model")
+                self._load_finetuned_model(adapters, artifact)
+                source = f"artifact {artifact.name}/{artifact.version}" if artifact else BASE_MODEL_NAME
+                loaded = ", ".join(sorted(adapters)) or f"{artifact.merged} (merged)"
+                print(f"✅ Loaded fine-tuned model from {source} (adapters: {loaded})")
             except Exception as e:
                 print(f"⚠️ Could not load fine-tuned model: {e}, falling back to API")
                 self.use_finetuned = False
         else:
             self.use_finetuned = False
-            print("ℹ️ Using API-based analyzer (fine-tuned model not found)")
+            missing = "model artifact not found" if MODEL_ARTIFACT_REQUIRED else "fine-tuned model not found"
+            print(f"ℹ️ Using API-based analyzer ({missing})")
     
-    def _load_finetuned_model(self):
-        """Load the fine-tuned LoRA model"""
+    def _load_finetuned_model(self, adapters, artifact=None):
+        """Load the base model once, with its LoRA adapters registered on top"""
         # Load base model with quantization for efficiency
         quantization_config = BitsAndBytesConfig(
             load_in_4bit=True,
             bnb_4bit_compute_dtype=torch.float16
         )
         
-        base_model = AutoModelForCausalLM.from_pretrained(
-            BASE_MODEL_NAME,
-            quantization_config=quantization_config,
-            device_map="auto"
-        )
-        
-        # Load LoRA weights
-        if os.path.exists(FINETUNED_MODEL_PATH):
-            self.model = PeftModel.from_pretrained(base_model, FINETUNED_MODEL_PATH)
+        if artifact is not None:
+            # Offline, memory-mapped safetensors
+            base_model, self.tokenizer = load_model(artifact, quantization_config=quantization_config,
+                                                    device_map="auto")
         else:
-            # If no fine-tuned model exists, create LoRA config
-            lora_config = LoraConfig(
-                task_type=TaskType.CAUSAL_LM,
-                inference_mode=False,
-                r=8,
-                lora_alpha=32,
-                lora_dropout=0.1,
-                target_modules=["c_attn", "c_proj"]
+            base_model = AutoModelForCausalLM.from_pretrained(
+                BASE_MODEL_NAME,
+                quantization_config=quantization_config,
+                device_map="auto"
             )
-            self.model = get_peft_model(base_model, lora_config)
+            self.tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL_NAME)
         
-        self.tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL_NAME)
-        self.model.eval()
-    
-    def analyze_with_finetuned(self, submission):
-        """Analyze submission using fine-tuned model"""
-        tags = ", ".join(submission.get("tags", []))
-        verdict = submission.get("verdict")
-        context = f"Problem: {submission.get('name')}\nTags: {tags}\nVerdict: {verdict}\n"
+        if adapters:
+            # Adapters share the base weights and are loaded on first use
+            self.adapters = AdapterPool(base_model, adapters)
+            self.model = self.adapters.model
+        else:
+            # The adapter is merged into the artifact's weights
+            self.model = base_model
+            self.model.eval()
         
-        prompt = ANALYZER_PROMPT.replace("<CONTEXT>", context)
+        # Batches are left-padded so every row's new tokens start at the same position
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.tokenizer.padding_side = "left"
+        if LOCAL_CONSTRAINED_DECODING:
+            self.decoder = SchemaDecoder(get_template("analyzer").schema, token_texts(self.tokenizer),
+                                         self.tokenizer.eos_token_id, self.tokenizer.all_special_ids)
+    
+    def _default_adapter(self):
+        return LOCAL_ADAPTER if LOCAL_ADAPTER in self.adapters.paths else next(iter(self.adapters.paths))
+    
+    def analyze_with_finetuned(self, submission, adapter=None):
+        """Analyze submission using fine-tuned model (with LoRA adapter `adapter`)"""
+        return self.analyze_batch_with_finetuned([submission], [adapter])[0]
+    
+    def analyze_batch_with_finetuned(self, submissions, adapters=None):
+        """Analyze several submissions in one generate call; each row may use its own adapter"""
+        names = None
+        if self.adapters is not None:
+            names = [name or self._default_adapter() for name in (adapters or [None] * len(submissions))]
+        prompts = []
+        for submission in submissions:
+            tags = ", ".join(submission.get("tags", []))
+            verdict = submission.get("verdict")
+            context = f"Problem: {submission.get('name')}\nTags: {tags}\nVerdict: {verdict}\n"
+            prompts.append(compile_prompt("analyzer", CONTEXT=context))
         
         # Tokenize and generate
-        inputs = self.tokenizer(prompt, return_tensors="pt", truncation=True, max_length=512)
+        inputs = self.tokenizer([prompt.text for prompt in prompts], return_tensors="pt", padding=True,
+                                truncation=True, max_length=512)
+        prompt_length = inputs["input_ids"].shape[1]
+        constraint = {"max_new_tokens": LOCAL_MAX_NEW_TOKENS}
+        if self.decoder is not None:
+            constraint, _ = constrained_generation_kwargs(self.decoder, prompt_length, len(prompts),
+                                                          LOCAL_MAX_NEW_TOKENS)
         
-        with torch.no_grad():
-            outputs = self.model.generate(
+        with upstream_call("local_model", "generate") as call, torch.no_grad():
+            generate = self.model.generate if names is None else partial(self.adapters.generate, names)
+            outputs = generate(
                 **inputs,
-                max_new_tokens=200,
+                **constraint,
                 temperature=0.7,
                 do_sample=True,
                 pad_token_id=self.tokenizer.eos_token_id
             )
+            call.status = "ok"
         
-        response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        
-        # Extract JSON from response
-        try:
-            # Try to extract JSON from the response
+        return [self._parse(prompt, output[prompt_length:]) for prompt, output in zip(prompts, outputs)]
+    
+    def _parse(self, prompt, new_tokens):
+        # Only the new tokens: the prompt itself contains braces
+        response = self.tokenizer.decode(new_tokens, skip_special_tokens=True)
+        if self.decoder is not None:
+            result = parse_reply(prompt, response)
+            if "raw" not in result:
+                return result
+        else:
+            # Extract JSON from the response
             json_start = response.find("{")
             json_end = response.rfind("}") + 1
             if json_start != -1 and json_end > json_start:
-                json_str = response[json_start:json_end]
-                return json.loads(json_str)
-        except:
-            pass
+                result = parse_reply(prompt, response[json_start:json_end])
+                if "raw" not in result:
+                    return result
         
+        FALLBACKS.inc(component="finetuned_analyzer", reason="unparseable")
         return {"raw": response}
     
     def analyze_with_api(self, submission):
-        """Fallback to Gemini API"""
+        """Fallback to the hosted LLM providers"""
         tags = ", ".join(submission.get("tags", []))
         verdict = submission.get("verdict")
         context = f"Problem: {submission.get('name')}\nTags: {tags}\nVerdict: {verdict}\n"
         
-        payload = {
-            "contents": [{
-                "parts": [{
-                    "text": ANALYZER_PROMPT.replace("<CONTEXT>", context)
-                }]
-            }]
-        }
-        
-        params = {"key": GEMINI_KEY}
-        headers = {"Content-Type": "application/json"}
+        prompt = compile_prompt("analyzer", CONTEXT=context)
+        reply = get_router().complete(prompt.text, timeout=20, schema=prompt.schema, schema_name=prompt.name)
+        return parse_reply(prompt, reply["text"])
+    
+    def analyze(self, submission, adapter=None):
+        """Main analyze method - routes each call to the fine-tuned model, the API or both (LOCAL_ROUTING)"""
+        if not (self.use_finetuned and self.model is not None) or LOCAL_ROUTING == "api":
+            return self.analyze_with_api(submission)
+        if LOCAL_ROUTING == "local":
+            return self.analyze_with_finetuned(submission, adapter)
+        return self.analyze_speculative(submission, adapter)
+    
+    def analyze_speculative(self, submission, adapter=None):
+        """Local model within its latency budget, else (or, with a deep local queue, racing it) the API"""
+        started = time.perf_counter()
+        deadline = current_deadline()
+        budget = LOCAL_LATENCY_BUDGET if deadline is None else min(LOCAL_LATENCY_BUDGET, deadline.remaining())
+        with self._lock:
+            queued = self._local_queued
+            service = self._local_service.quantiles[0.5].value() if self._local_service.count >= 5 else None
+        # Race when the queue is deep, or long enough that waiting in it would likely use up the budget
+        race = LOCAL_RACE_QUEUE_DEPTH > 0 and (
+            queued >= LOCAL_RACE_QUEUE_DEPTH or (queued > 0 and service is not None and (queued + 1) * service > budget))
+        local = self._submit_local(submission, adapter, deadline)
+        if race:
+            return self._race("race", "", local, submission, deadline, started)
         
-        r = requests.post(GEMINI_URL, params=params, json=payload, headers=headers, timeout=20)
-        r.raise_for_status()
-        resp = r.json()
+        try:
+            result = local.result(timeout=budget)
+            outcome = "local_ok" if _is_analysis(result) else "local_unparseable"
+        except FutureTimeout:
+            # Still queued: drop it. Already generating: keep it in the race against the API.
+            if not local.cancel():
+                return self._race("local_first", "timeout_", local, submission, deadline, started)
+            outcome = "local_timeout"
+        except Exception as e:
+            print(f"Warning: local analysis failed, using the API: {e}")
+            outcome = "local_error"
+        if outcome == "local_ok":
+            return self._served("local_first", outcome, "local", started, result)
+        return self._served("local_first", outcome, "api", started, self.analyze_with_api(submission))
+    
+    def _race(self, route, prefix, local, submission, deadline, started):
+        """The first usable answer of the running local analysis and an API call started now"""
+        api = self._api_executor().submit(call_within, deadline, self.analyze_with_api, submission)
+        pending = {local, api}
+        while pending:
+            timeout = None if deadline is None else deadline.remaining()
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future is api and future.exception() is None:
+                    local.cancel()
+                    return self._served(route, prefix + "api_won", "api", started, future.result())
+                if future is local and not future.cancelled() and future.exception() is None \
+                        and _is_analysis(future.result()):
+                    return self._served(route, prefix + "local_won", "local", started, future.result())
+        # Neither gave an answer
+        local.cancel()
+        self._record(route, prefix + "both_failed")
+        if api.done():
+            return api.result()  # raises the API's error
+        raise DeadlineExceeded("analysis: neither the local model nor the API answered in time")
+    
+    def _submit_local(self, submission, adapter, deadline):
+        with self._lock:
+            self._local_queued += 1
+        submitted = time.perf_counter()
         
-        output = resp["candidates"][0]["content"]["parts"][0]["text"]
+        def run():
+            began = time.perf_counter()
+            try:
+                return call_within(deadline, self.analyze_with_finetuned, submission, adapter)
+            finally:
+                finished = time.perf_counter()
+                LOCAL_MODEL_SECONDS.observe(finished - submitted)
+                with self._lock:
+                    self._local_latency.add(finished - submitted)
+                    self._local_service.add(finished - began)
         
-        try:
-            return json.loads(output)
-        except:
-            return {"raw": output}
-    
-    def analyze(self, submission):
-        """Main analyze method - uses fine-tuned model if available, else API"""
-        if self.use_finetuned and self.model is not None:
-            return self.analyze_with_finetuned(submission)
-        else:
-            return self.analyze_with_api(submission)
+        future = self._local_pool.submit(run)
+        # Counts down when the analysis finishes or is cancelled while queued
+        future.add_done_callback(self._local_done)
+        return future
+    
+    def _local_done(self, future):
+        with self._lock:
+            self._local_queued -= 1
+    
+    def _api_executor(self):
+        with self._lock:
+            if self._api_pool is None:
+                self._api_pool = ThreadPoolExecutor(max_workers=ANALYSIS_API_WORKERS, thread_name_prefix="analysis-api")
+            return self._api_pool
+    
+    def _record(self, route, outcome):
+        ANALYSIS_ROUTES.inc(route=route, outcome=outcome)
+        with self._lock:
+            key = f"{route}/{outcome}"
+            self._routes[key] = self._routes.get(key, 0) + 1
+    
+    def _served(self, route, outcome, served_by, started, result):
+        self._record(route, outcome)
+        ANALYSIS_SECONDS.observe(time.perf_counter() - started, route=route, served_by=served_by)
+        return result
+    
+    def stats(self):
+        """Routing counts and local model latency, for tuning LOCAL_LATENCY_BUDGET"""
+        with self._lock:
+            return {
+                "routing": LOCAL_ROUTING if self.use_finetuned else "api",
+                "latency_budget": LOCAL_LATENCY_BUDGET,
+                "race_queue_depth": LOCAL_RACE_QUEUE_DEPTH,
+                "local_queued": self._local_queued,
+                "local_latency": self._local_latency.summary(),
+                "local_service": self._local_service.summary(),
+                "routes": dict(self._routes),
+            }
 
 # Global instance
 _finetuned_analyzer = None
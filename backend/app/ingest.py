@@ -0,0 +1,248 @@
+# backend/app/ingest.py
+"""
+Bulk submission ingestion for a cohort of handles.
+
+One contest.status call returns the submissions of every participant, so a
+training group that takes the same contests can be kept current with a few
+calls per contest instead of one user.status call per handle. Submissions
+are split by handle into the submission store that get_topic_statistics
+reads from.
+
+    cd backend
+    python -m app.ingest --handles group.txt --since-days 14 --backfill
+
+A contest dump only covers that contest, so each handle needs one full
+user.status fetch (its baseline) before the store is trusted for it;
+--backfill fetches the handles that lack one. Afterwards a nightly run
+over recent contests keeps the whole cohort current, and --baselines then
+updates the cohort percentile tables (app.cohort_baselines).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from collections import defaultdict
+from typing import Dict, Any, List, Optional
+
+from . import db
+from .cf_client import fetch_contest_list, fetch_contest_status, fetch_user_status, normalize_submission
+
+# Codeforces allows one call every two seconds per client
+CF_MIN_INTERVAL = float(os.getenv("CF_MIN_INTERVAL", "2.0"))
+CONTEST_STATUS_PAGE_SIZE = int(os.getenv("CONTEST_STATUS_PAGE_SIZE", "10000"))
+USER_STATUS_PAGE_SIZE = int(os.getenv("USER_STATUS_PAGE_SIZE", "10000"))
+# Refetch a handle's full history after this many days (practice outside ingested contests)
+BASELINE_MAX_AGE_DAYS = float(os.getenv("BASELINE_MAX_AGE_DAYS", "7"))
+
+
+class Throttle:
+    """Spaces calls at least `interval` seconds apart and counts them per endpoint"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.calls = defaultdict(int)
+        self._last = 0.0
+
+    def wait(self, endpoint: str):
+        delay = self._last + self.interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._last = time.monotonic()
+        self.calls[endpoint] += 1
+
+
+def load_handles(source: str) -> List[str]:
+    """Handles from a file (one per line or comma-separated) or a comma-separated string"""
+    text = open(source, "r", encoding="utf-8").read() if os.path.exists(source) else source
+    seen = {}
+    for token in text.replace(",", "\n").splitlines():
+        token = token.strip()
+        if token and not token.startswith("#"):
+            seen.setdefault(token.lower(), token)
+    return list(seen.values())
+
+
+def select_contests(throttle: Throttle, since_days: float) -> Optional[List[int]]:
+    """Finished contests that started within the last `since_days` days"""
+    throttle.wait("contest.list")
+    contests = fetch_contest_list()
+    if contests is None:
+        return None
+    cutoff = time.time() - since_days * 86400
+    return [c["id"] for c in contests
+            if c.get("phase") == "FINISHED" and c.get("startTimeSeconds", 0) >= cutoff]
+
+
+def _paged(throttle: Throttle, endpoint: str, fetch, page_size: int):
+    """
+    Call fetch(first, count) page by page until a short page. Returns
+    (items, calls, error); a rate-limited page is retried with backoff.
+    """
+    items = []
+    calls = 0
+    first = 1
+    retries = 0
+    while True:
+        throttle.wait(endpoint)
+        data = fetch(first, page_size)
+        calls += 1
+        if "limit exceeded" in str(data.get("comment", "")).lower() and retries < 3:
+            retries += 1
+            time.sleep(throttle.interval * 2 ** retries)
+            continue
+        if data.get("status") != "OK":
+            return items, calls, data.get("comment", "request failed")
+        page = data["result"]
+        items.extend(page)
+        if len(page) < page_size:
+            return items, calls, None
+        first += page_size
+
+
+def ingest_contest(throttle: Throttle, contest_id: int, cohort: Dict[str, str],
+                   page_size: int = CONTEST_STATUS_PAGE_SIZE) -> Dict[str, Any]:
+    """Page through contest.status and store the cohort's submissions"""
+    items, calls, error = _paged(throttle, "contest.status",
+                                 lambda first, count: fetch_contest_status(contest_id, first, count), page_size)
+    if error is not None:
+        return {"contest_id": contest_id, "error": error, "api_calls": calls}
+    by_handle = defaultdict(list)
+    for item in items:
+        # Team submissions count for every member
+        for member in item.get("author", {}).get("members", []):
+            key = member.get("handle", "").lower()
+            if key in cohort:
+                by_handle[key].append(normalize_submission(item))
+
+    stored = db.save_contest_submissions(contest_id, by_handle, calls, list(cohort))
+    return {"contest_id": contest_id, "submissions": stored, "handles": sorted(by_handle), "api_calls": calls}
+
+
+def backfill(throttle: Throttle, handles: List[str], page_size: int = USER_STATUS_PAGE_SIZE) -> Dict[str, str]:
+    """Full user.status history for handles without a recent baseline; returns failures"""
+    failed = {}
+    for handle in handles:
+        items, _, error = _paged(throttle, "user.status",
+                                 lambda first, count: fetch_user_status(handle, first, count), page_size)
+        if error is not None:
+            failed[handle] = f"user.status failed: {error}"
+            continue
+        db.save_handle_submissions(handle, [normalize_submission(item) for item in items])
+    return failed
+
+
+def run_ingestion(handles: List[str], contest_ids: Optional[List[int]] = None, since_days: float = 14,
+                  do_backfill: bool = False, force: bool = False,
+                  min_interval: float = CF_MIN_INTERVAL) -> Dict[str, Any]:
+    """Ingest contest dumps for a cohort and report the API calls saved"""
+    if db.STORAGE_BACKEND != "sqlite":
+        raise RuntimeError("Bulk ingestion needs STORAGE_BACKEND=sqlite")
+    started = time.time()
+    throttle = Throttle(min_interval)
+    cohort = {h.lower(): h for h in handles}
+
+    # Handles whose history must be fetched once before contest dumps can keep it current
+    baseline_cutoff = time.time() - BASELINE_MAX_AGE_DAYS * 86400
+    sync = db.get_submission_sync(handles)
+    stale = [h for h in handles if (sync.get(h.lower()) or {}).get("baseline_at") is None
+             or sync[h.lower()]["baseline_at"] < baseline_cutoff]
+    backfill_failed = backfill(throttle, stale) if do_backfill else {}
+
+    errors = []
+    if contest_ids is None:
+        contest_ids = select_contests(throttle, since_days)
+        if contest_ids is None:
+            errors.append({"error": "contest.list failed"})
+            contest_ids = []
+    # A contest is done only once it was split for every handle in this cohort
+    covered = {} if force else db.ingested_contest_handles(contest_ids)
+    pending = [cid for cid in contest_ids if not set(cohort) <= covered.get(cid, set())]
+
+    submissions = 0
+    ingested = 0
+    handles_seen = set()
+    for contest_id in pending:
+        result = ingest_contest(throttle, contest_id, cohort)
+        if "error" in result:
+            errors.append(result)
+            print(f"Warning: contest {contest_id}: {result['error']}")
+            continue
+        ingested += 1
+        submissions += result["submissions"]
+        handles_seen.update(result["handles"])
+        print(f"Contest {contest_id}: {result['submissions']} submissions from {len(result['handles'])} handles "
+              f"({result['api_calls']} calls)")
+
+    # Only vouch for handles with a baseline, and only if every contest made it in
+    needs_backfill = sorted(backfill_failed) if do_backfill else sorted(stale)
+    synced = [h for h in handles if h not in needs_backfill]
+    if not errors:
+        db.mark_submissions_synced(synced)
+
+    api_calls = dict(throttle.calls)
+    total_calls = sum(api_calls.values())
+    # Refreshing the same cohort one handle at a time costs one user.status call each
+    per_handle_calls = len(handles)
+    return {
+        "cohort_handles": len(handles),
+        "contests_in_window": len(contest_ids),
+        "contests_ingested": ingested,
+        "contests_already_ingested": len(contest_ids) - len(pending),
+        "submissions_stored": submissions,
+        "handles_with_new_submissions": len(handles_seen),
+        "handles_synced": 0 if errors else len(synced),
+        "needs_backfill": needs_backfill,
+        "errors": errors,
+        "api_calls": {**api_calls, "total": total_calls},
+        "per_handle_calls": per_handle_calls,
+        "calls_saved": per_handle_calls - total_calls,
+        "estimated_seconds_saved": round((per_handle_calls - total_calls) * min_interval, 1),
+        "seconds": round(time.time() - started, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest contest.status dumps into the submission store")
+    parser.add_argument("--handles", required=True, help="File with one handle per line, or a comma-separated list")
+    parser.add_argument("--contests", help="Comma-separated contest ids (default: finished contests in --since-days)")
+    parser.add_argument("--since-days", type=float, default=14)
+    parser.add_argument("--backfill", action="store_true",
+                        help="Fetch user.status for handles without a recent baseline")
+    parser.add_argument("--force", action="store_true", help="Re-ingest contests that were already ingested")
+    parser.add_argument("--min-interval", type=float, default=CF_MIN_INTERVAL, help="Seconds between API calls")
+    parser.add_argument("--baselines", action="store_true",
+                        help="Update the cohort percentile tables afterwards (app.cohort_baselines)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    handles = load_handles(args.handles)
+    contest_ids = [int(c) for c in args.contests.split(",") if c.strip()] if args.contests else None
+    report = run_ingestion(handles, contest_ids, args.since_days, args.backfill, args.force, args.min_interval)
+    if args.baselines:
+        from .cohort_baselines import build
+        report["cohort_baselines"] = build(min_interval=args.min_interval)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        calls = report["api_calls"]
+        print("=" * 60)
+        print(f"Cohort: {report['cohort_handles']} handles, {report['contests_ingested']} contests ingested "
+              f"({report['contests_already_ingested']} already done)")
+        print(f"Stored {report['submissions_stored']} submissions for {report['handles_with_new_submissions']} handles")
+        print(f"API calls: {calls['total']} ({', '.join(f'{k}={v}' for k, v in calls.items() if k != 'total')})")
+        print(f"Per-handle fetching: {report['per_handle_calls']} calls -> saved {report['calls_saved']} "
+              f"(~{report['estimated_seconds_saved']}s at {args.min_interval}s/call)")
+        if report["needs_backfill"]:
+            print(f"{len(report['needs_backfill'])} handles need --backfill before their stats use the store")
+        if "cohort_baselines" in report:
+            baselines = report["cohort_baselines"]
+            print(f"Cohort baselines: {baselines['handles']} handles, {baselines['handles_recounted']} recounted, "
+                  f"{baselines['bytes']} bytes")
+        print("=" * 60)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
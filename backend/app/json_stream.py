@@ -0,0 +1,67 @@
+# backend/app/json_stream.py
+"""
+Incremental JSON scanning for streamed LLM output.
+
+ArrayItemStream is fed text chunks as they arrive and returns every object
+of the reply's top-level list as soon as its closing brace is seen. The
+list is either the root itself (`[{...}, ...]`) or an array one level
+under a root object (`{"recommendations": [{...}, ...]}`). Anything before
+the root (a ```json fence, a sentence) is skipped. If the stream is cut
+off, the objects already returned are all complete and `complete` stays
+False.
+"""
+import json
+from typing import Any, Dict, List
+
+
+class ArrayItemStream:
+    """Feed text, get back each completed object of the top-level list"""
+
+    def __init__(self):
+        self.complete = False     # root value closed
+        self.skipped = 0          # items that closed but were not valid JSON
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._item: List[str] = None
+        self._item_depth = 0
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        items = []
+        for ch in text:
+            if self.complete:
+                break
+            if self._item is not None:
+                self._item.append(ch)
+            if not self._stack and ch not in "{[":
+                continue  # before the root value
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if ch == "{" and self._item is None and self._stack in (["["], ["{", "["]):
+                    self._item = [ch]
+                    self._item_depth = len(self._stack)
+                self._stack.append(ch)
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if self._item is not None and ch == "}" and len(self._stack) == self._item_depth:
+                    try:
+                        item = json.loads("".join(self._item))
+                    except json.JSONDecodeError:
+                        self.skipped += 1
+                    else:
+                        if isinstance(item, dict):
+                            items.append(item)
+                    self._item = None
+                if not self._stack:
+                    self.complete = True
+        return items
@@ -0,0 +1,579 @@
+# backend/app/llm_router.py
+"""
+One routing layer for every hosted LLM call (Gemini, OpenAI).
+
+- Hedging: a request goes to the first available provider. If that
+  provider has not answered within its p95 latency (LLM_HEDGE_MIN_DELAY
+  to LLM_HEDGE_MAX_DELAY, LLM_HEDGE_DEFAULT_DELAY until
+  LLM_HEDGE_MIN_SAMPLES calls are seen), the same request also goes to
+  the next provider. Whichever answers first wins, and the other attempt
+  is cancelled; its connection is closed as soon as it returns control.
+  For streams, "answers" means the first chunk.
+- Failover: an attempt that fails starts the next provider immediately
+  instead of waiting for the hedge delay.
+- Circuit breakers: LLM_BREAKER_FAILURES consecutive failures open a
+  provider's breaker. While it is open the provider is skipped without a
+  request. After LLM_BREAKER_COOLDOWN seconds one trial request is let
+  through, and success closes the breaker again.
+- Stats: per-provider calls, failures, hedges, wins and latency quantiles,
+  served on /api/llm/stats and counted in /metrics.
+
+Callers pick the provider order with `prefer`; the default is LLM_PROVIDERS.
+Providers without an API key are left out.
+"""
+import os
+import json
+import time
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Any, Iterator, List, Optional, Sequence
+
+import requests
+
+from .deadline import budget as request_budget
+from .running_stats import RunningStat
+from .telemetry import LLM_ROUTER_EVENTS, upstream_call
+
+GEMINI_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_URL = os.getenv("GEMINI_API_URL", "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent")
+# Streaming variant of GEMINI_URL (server-sent events)
+GEMINI_STREAM_URL = os.getenv("GEMINI_STREAM_URL", GEMINI_URL.replace(":generateContent", ":streamGenerateContent"))
+OPENAI_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_URL = os.getenv("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+# Default provider order
+LLM_PROVIDERS = [p.strip() for p in os.getenv("LLM_PROVIDERS", "gemini,openai").split(",") if p.strip()]
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "3.0"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+LLM_HEDGE_MAX_DELAY = float(os.getenv("LLM_HEDGE_MAX_DELAY", "15.0"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+LLM_ROUTER_WORKERS = int(os.getenv("LLM_ROUTER_WORKERS", "16"))
+
+_READ_CHUNK = 16 * 1024
+
+
+class LLMError(Exception):
+    """Every routed attempt failed"""
+
+
+class LLMRateLimited(LLMError):
+    """Every routed attempt was rejected with 429"""
+
+
+class LLMUnavailable(LLMError):
+    """No provider is configured or every breaker is open"""
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class _LatencyStat(RunningStat):
+    QUANTILES = (0.5, 0.95, 0.99)
+
+
+class CircuitBreaker:
+    """closed -> open after N consecutive failures -> half-open (one trial) after the cooldown"""
+
+    def __init__(self, name: str, failures: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.name = name
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._trial_running = False
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                LLM_ROUTER_EVENTS.inc(provider=self.name, event="breaker_closed")
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_running = False
+            if self.state == "half_open" or (self.state == "closed" and self.consecutive_failures >= self.failures):
+                if self.state == "closed":
+                    LLM_ROUTER_EVENTS.inc(provider=self.name, event="breaker_opened")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """An attempt ended without a verdict (cancelled); let the next trial through"""
+        with self._lock:
+            self._trial_running = False
+
+
+def _gemini_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """A JSON schema in Gemini's responseSchema dialect (OpenAPI subset, fields in declared order)"""
+    out = {}
+    for key, value in schema.items():
+        if key == "type":
+            out["type"] = value.upper()
+        elif key == "properties":
+            out["properties"] = {name: _gemini_schema(sub) for name, sub in value.items()}
+            out["propertyOrdering"] = list(value)
+        elif key == "items":
+            out["items"] = _gemini_schema(value)
+        elif key in ("description", "enum", "required", "minItems", "maxItems", "nullable", "format"):
+            out[key] = value
+    return out
+
+
+def _openai_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """A JSON schema for OpenAI strict structured outputs (no array length limits)"""
+    out = {}
+    for key, value in schema.items():
+        if key == "properties":
+            out[key] = {name: _openai_schema(sub) for name, sub in value.items()}
+        elif key == "items":
+            out[key] = _openai_schema(value)
+        elif key not in ("minItems", "maxItems"):
+            out[key] = value
+    return out
+
+
+class Provider:
+    """One hosted model: blocking completion and streamed text chunks"""
+
+    name = ""
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(self.name)
+        self.latency = {"complete": _LatencyStat(), "stream": _LatencyStat()}
+        self.counts = {"calls": 0, "successes": 0, "failures": 0, "cancelled": 0,
+                       "rate_limited": 0, "skipped": 0, "hedges_started": 0, "hedge_wins": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self) -> bool:
+        raise NotImplementedError
+
+    def complete(self, prompt: str, options: Dict[str, Any], cancel: threading.Event) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, options: Dict[str, Any], cancel: threading.Event) -> Iterator[str]:
+        raise NotImplementedError
+
+    def hedge_delay(self, kind: str) -> float:
+        stat = self.latency[kind]
+        p95 = stat.quantiles[0.95].value()
+        if stat.count < LLM_HEDGE_MIN_SAMPLES or p95 is None:
+            return LLM_HEDGE_DEFAULT_DELAY
+        return min(LLM_HEDGE_MAX_DELAY, max(LLM_HEDGE_MIN_DELAY, p95))
+
+    def count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+    def observe(self, kind: str, seconds: float):
+        with self._lock:
+            self.latency[kind].add(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "configured": self.configured,
+                "breaker": self.breaker.state,
+                **self.counts,
+                "latency": {kind: stat.summary() for kind, stat in self.latency.items()},
+                "hedge_delay": {kind: round(self.hedge_delay(kind), 3) for kind in self.latency},
+            }
+
+    def _post(self, endpoint: str, url: str, cancel: threading.Event, timeout: float, **kwargs) -> requests.Response:
+        """POST with a streamed body so a cancelled attempt can close its connection"""
+        with upstream_call(self.name, endpoint) as call:
+            r = requests.post(url, timeout=(10, timeout), stream=True, **kwargs)
+            call.status = r.status_code
+        if cancel.is_set():
+            r.close()
+            raise _Cancelled()
+        if r.status_code == 429:
+            r.close()
+            raise LLMRateLimited(f"{self.name} rate limited")
+        r.raise_for_status()
+        return r
+
+    def _read_json(self, r: requests.Response, cancel: threading.Event) -> Dict[str, Any]:
+        body = []
+        with r:
+            for chunk in r.iter_content(_READ_CHUNK):
+                if cancel.is_set():
+                    raise _Cancelled()
+                body.append(chunk)
+        return json.loads(b"".join(body))
+
+    def _sse_events(self, r: requests.Response, cancel: threading.Event) -> Iterator[Dict[str, Any]]:
+        with r:
+            r.encoding = "utf-8"
+            for line in r.iter_lines(decode_unicode=True):
+                if cancel.is_set():
+                    raise _Cancelled()
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                yield json.loads(data)
+
+
+class GeminiProvider(Provider):
+    name = "gemini"
+
+    @property
+    def configured(self) -> bool:
+        return bool(GEMINI_KEY)
+
+    def _payload(self, prompt, options):
+        text = f"{options['system']}\n\n{prompt}" if options.get("system") else prompt
+        payload = {"contents": [{"parts": [{"text": text}]}]}
+        config = {}
+        if options.get("temperature") is not None:
+            config["temperature"] = options["temperature"]
+        if options.get("max_tokens"):
+            config["maxOutputTokens"] = options["max_tokens"]
+        if options.get("schema"):
+            config["responseMimeType"] = "application/json"
+            config["responseSchema"] = _gemini_schema(options["schema"])
+        if config:
+            payload["generationConfig"] = config
+        return payload
+
+    def complete(self, prompt, options, cancel):
+        r = self._post("generateContent", GEMINI_URL, cancel, options["timeout"], params={"key": GEMINI_KEY},
+                       json=self._payload(prompt, options), headers={"Content-Type": "application/json"})
+        resp = self._read_json(r, cancel)
+        return resp["candidates"][0]["content"]["parts"][0]["text"]
+
+    def stream(self, prompt, options, cancel):
+        r = self._post("streamGenerateContent", GEMINI_STREAM_URL, cancel, options["timeout"],
+                       params={"key": GEMINI_KEY, "alt": "sse"}, json=self._payload(prompt, options),
+                       headers={"Content-Type": "application/json"})
+        for event in self._sse_events(r, cancel):
+            for candidate in event.get("candidates", [])[:1]:
+                for part in candidate.get("content", {}).get("parts", []):
+                    if part.get("text"):
+                        yield part["text"]
+
+
+class OpenAIProvider(Provider):
+    name = "openai"
+
+    @property
+    def configured(self) -> bool:
+        return bool(OPENAI_KEY)
+
+    def _payload(self, prompt, options, stream=False):
+        messages = [{"role": "user", "content": prompt}]
+        if options.get("system"):
+            messages.insert(0, {"role": "system", "content": options["system"]})
+        payload = {"model": OPENAI_MODEL, "messages": messages}
+        if options.get("temperature") is not None:
+            payload["temperature"] = options["temperature"]
+        if options.get("max_tokens"):
+            payload["max_tokens"] = options["max_tokens"]
+        if options.get("schema"):
+            payload["response_format"] = {"type": "json_schema", "json_schema": {
+                "name": options.get("schema_name") or "reply", "strict": True,
+                "schema": _openai_schema(options["schema"]),
+            }}
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def _headers(self):
+        return {"Authorization": f"Bearer {OPENAI_KEY}", "Content-Type": "application/json"}
+
+    def complete(self, prompt, options, cancel):
+        r = self._post("chat.completions", OPENAI_URL, cancel, options["timeout"],
+                       json=self._payload(prompt, options), headers=self._headers())
+        resp = self._read_json(r, cancel)
+        return resp["choices"][0]["message"]["content"]
+
+    def stream(self, prompt, options, cancel):
+        r = self._post("chat.completions", OPENAI_URL, cancel, options["timeout"],
+                       json=self._payload(prompt, options, stream=True), headers=self._headers())
+        for event in self._sse_events(r, cancel):
+            for choice in event.get("choices", [])[:1]:
+                text = (choice.get("delta") or {}).get("content")
+                if text:
+                    yield text
+
+
+class LLMRouter:
+    """Hedged, breaker-guarded calls across the configured providers"""
+
+    def __init__(self, providers: Sequence[Provider], order: Sequence[str] = None):
+        self.providers = {p.name: p for p in providers}
+        self.order = [name for name in (order or LLM_PROVIDERS) if name in self.providers]
+        self._pool = ThreadPoolExecutor(max_workers=LLM_ROUTER_WORKERS, thread_name_prefix="llm")
+
+    def _candidates(self, prefer: Optional[Sequence[str]]) -> List[Provider]:
+        names = list(prefer or self.order)
+        names += [n for n in self.order if n not in names]
+        return [self.providers[n] for n in names if n in self.providers and self.providers[n].configured]
+
+    def _next(self, candidates: List[Provider], start: int):
+        """(provider, index) of the next candidate whose breaker lets a request through"""
+        for i in range(start, len(candidates)):
+            provider = candidates[i]
+            if provider.breaker.allow():
+                return provider, i
+            provider.count("skipped")
+            LLM_ROUTER_EVENTS.inc(provider=provider.name, event="skipped")
+        return None, len(candidates)
+
+    def _launch(self, provider, target, hedge):
+        provider.count("calls")
+        if hedge:
+            provider.count("hedges_started")
+            LLM_ROUTER_EVENTS.inc(provider=provider.name, event="hedge")
+        cancel = threading.Event()
+        return cancel, self._pool.submit(target, provider, cancel)
+
+    def _failed(self, provider, error, errors):
+        if isinstance(error, _Cancelled):
+            provider.count("cancelled")
+            provider.breaker.release()
+            return
+        provider.count("failures")
+        if isinstance(error, LLMRateLimited):
+            provider.count("rate_limited")
+        provider.breaker.record_failure()
+        errors.append(error)
+        print(f"Warning: LLM provider {provider.name} failed: {error}")
+
+    @staticmethod
+    def _raise(errors, tried):
+        if not tried:
+            raise LLMUnavailable("No LLM provider available (none configured or all circuit breakers open)")
+        if errors and all(isinstance(e, LLMRateLimited) for e in errors):
+            raise LLMRateLimited(f"All LLM providers rate limited: {errors}")
+        raise LLMError(f"All LLM providers failed: {errors}")
+
+    def complete(self, prompt: str, system: str = None, max_tokens: int = None, temperature: float = None,
+                 timeout: float = 30, prefer: Sequence[str] = None, schema: Dict[str, Any] = None,
+                 schema_name: str = None) -> Dict[str, Any]:
+        """
+        Text from the first provider to answer: {"text", "provider", "latency", "hedged"}.
+        With a JSON schema the providers constrain the reply to it.
+        """
+        timeout = request_budget(timeout, "llm")
+        options = {"system": system, "max_tokens": max_tokens, "temperature": temperature, "timeout": timeout,
+                   "schema": schema, "schema_name": schema_name}
+        candidates = self._candidates(prefer)
+
+        def attempt(provider, cancel):
+            start = time.perf_counter()
+            text = provider.complete(prompt, options, cancel)
+            return text, time.perf_counter() - start
+
+        pending = {}  # future -> (provider, hedged, cancel)
+        errors = []
+        start = time.perf_counter()
+        deadline = start + timeout
+        provider, index = self._next(candidates, 0)
+        tried = provider is not None
+        if provider is not None:
+            cancel, future = self._launch(provider, attempt, False)
+            pending[future] = (provider, False, cancel)
+        hedge_at = start + (provider.hedge_delay("complete") if provider else 0)
+        hedged = False
+        won = False
+        try:
+            while pending:
+                now = time.perf_counter()
+                can_hedge = (LLM_HEDGE_ENABLED and not hedged and index + 1 < len(candidates)
+                             and len(pending) == 1 and now < deadline)
+                wait_for = (hedge_at if can_hedge else deadline) - now
+                done, _ = wait(list(pending), timeout=max(0.0, wait_for), return_when=FIRST_COMPLETED)
+                if not done:
+                    if time.perf_counter() >= deadline:
+                        errors.append(TimeoutError(f"No LLM answer within {timeout}s"))
+                        break
+                    provider, index = self._next(candidates, index + 1)
+                    hedged = True
+                    if provider is not None:
+                        cancel, future = self._launch(provider, attempt, True)
+                        pending[future] = (provider, True, cancel)
+                    continue
+                for future in done:
+                    provider, is_hedge, _ = pending.pop(future)
+                    try:
+                        text, latency = future.result()
+                    except Exception as e:
+                        self._failed(provider, e, errors)
+                        continue
+                    provider.count("successes")
+                    provider.observe("complete", latency)
+                    provider.breaker.record_success()
+                    if is_hedge:
+                        provider.count("hedge_wins")
+                        LLM_ROUTER_EVENTS.inc(provider=provider.name, event="hedge_win")
+                    won = True
+                    return {"text": text, "provider": provider.name, "latency": latency, "hedged": hedged}
+                if not pending:
+                    # Fail over now rather than at the hedge delay
+                    provider, index = self._next(candidates, index + 1)
+                    if provider is not None:
+                        tried = True
+                        cancel, future = self._launch(provider, attempt, False)
+                        pending[future] = (provider, False, cancel)
+                        LLM_ROUTER_EVENTS.inc(provider=provider.name, event="failover")
+        finally:
+            # Whatever is still running lost (cancel it) or timed out (a failure)
+            for future, (provider, _, cancel) in pending.items():
+                cancel.set()
+                if won:
+                    provider.count("cancelled")
+                    provider.breaker.release()
+                else:
+                    provider.count("failures")
+                    provider.breaker.record_failure()
+        self._raise(errors, tried)
+
+    def stream(self, prompt: str, system: str = None, max_tokens: int = None, temperature: float = None,
+               timeout: float = 30, prefer: Sequence[str] = None, schema: Dict[str, Any] = None,
+               schema_name: str = None) -> Iterator[str]:
+        """
+        Text chunks from the first provider to start answering. Hedging and
+        failover apply until the first chunk; after that the winner's stream
+        is relayed and its errors are raised to the caller.
+        """
+        timeout = request_budget(timeout, "llm stream")
+        options = {"system": system, "max_tokens": max_tokens, "temperature": temperature, "timeout": timeout,
+                   "schema": schema, "schema_name": schema_name}
+        candidates = self._candidates(prefer)
+        events = queue.Queue()
+
+        def attempt(provider, cancel):
+            start = time.perf_counter()
+            first = True
+            try:
+                for chunk in provider.stream(prompt, options, cancel):
+                    if first:
+                        events.put((provider.name, "first", time.perf_counter() - start))
+                        first = False
+                    events.put((provider.name, "chunk", chunk))
+                events.put((provider.name, "done", None))
+            except Exception as e:
+                events.put((provider.name, "error", e))
+
+        running: Dict[str, threading.Event] = {}
+        errors = []
+        winner = None
+        start = time.perf_counter()
+        deadline = start + timeout
+        provider, index = self._next(candidates, 0)
+        tried = provider is not None
+        if provider is not None:
+            running[provider.name] = self._launch(provider, attempt, False)[0]
+        hedge_at = start + (provider.hedge_delay("stream") if provider else 0)
+        hedged = set()
+        try:
+            while running:
+                now = time.perf_counter()
+                if winner is None:
+                    can_hedge = (LLM_HEDGE_ENABLED and index + 1 < len(candidates)
+                                 and len(running) == 1 and now < deadline)
+                    wait_for = (hedge_at if can_hedge else deadline) - now
+                else:
+                    wait_for = timeout  # read timeout between chunks is enforced by the provider
+                try:
+                    name, kind, value = events.get(timeout=max(0.0, wait_for))
+                except queue.Empty:
+                    if winner is not None:
+                        raise LLMError(f"{winner} stream stalled for {timeout}s")
+                    if time.perf_counter() >= deadline:
+                        errors.append(TimeoutError(f"No LLM output within {timeout}s"))
+                        for name in running:
+                            self.providers[name].count("failures")
+                            self.providers[name].breaker.record_failure()
+                        break
+                    provider, index = self._next(candidates, index + 1)
+                    if provider is not None:
+                        running[provider.name] = self._launch(provider, attempt, True)[0]
+                        hedged.add(provider.name)
+                    continue
+
+                if winner is not None and name != winner:
+                    continue  # a cancelled loser's leftovers
+                provider = self.providers[name]
+                if kind == "first":
+                    winner = name
+                    provider.observe("stream", value)
+                    if name in hedged:
+                        provider.count("hedge_wins")
+                        LLM_ROUTER_EVENTS.inc(provider=name, event="hedge_win")
+                    for other, cancel in list(running.items()):
+                        if other != name:
+                            cancel.set()
+                            running.pop(other)
+                            self.providers[other].count("cancelled")
+                            self.providers[other].breaker.release()
+                elif kind == "chunk":
+                    yield value
+                elif kind == "done":
+                    running.pop(name, None)
+                    provider.count("successes")
+                    provider.breaker.record_success()
+                    return
+                elif kind == "error":
+                    running.pop(name, None)
+                    self._failed(provider, value, errors)
+                    if winner is not None:
+                        raise LLMError(f"{name} stream failed after output started: {value}") from value
+                    if not running:
+                        provider, index = self._next(candidates, index + 1)
+                        if provider is not None:
+                            tried = True
+                            running[provider.name] = self._launch(provider, attempt, False)[0]
+                            LLM_ROUTER_EVENTS.inc(provider=provider.name, event="failover")
+        finally:
+            for name, cancel in running.items():
+                cancel.set()
+                if name == winner:
+                    # The caller stopped reading: no verdict on the provider
+                    self.providers[name].breaker.release()
+        self._raise(errors, tried)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "order": self.order,
+            "hedging": LLM_HEDGE_ENABLED,
+            "providers": {name: p.stats() for name, p in self.providers.items()},
+        }
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> LLMRouter:
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = LLMRouter([GeminiProvider(), OpenAIProvider()])
+        return _router
@@ -0,0 +1,363 @@
+# backend/app/log_writer.py
+"""
+Background writers for append-only storage (logs.jsonl, evaluation_results.jsonl, SQLite).
+
+Callers only enqueue a record; a daemon thread batches records and appends
+them to disk, so request handlers never block on file I/O. Appends are
+guarded by an inter-process lock file, which keeps lines intact when several
+uvicorn workers write the same file, and files are rotated and gzipped once
+they exceed a size limit.
+"""
+import os
+import glob
+import gzip
+import json
+import time
+import queue
+import shutil
+import atexit
+import threading
+from typing import Dict, Any, Iterator, List
+
+from .telemetry import Counter
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Flush when this many records are pending...
+LOG_FLUSH_BATCH = int(os.getenv("LOG_FLUSH_BATCH", "100"))
+# ...or when the oldest pending record is this many seconds old
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+# "none": leave it to the OS, "batch": fsync every flush, "interval": fsync at most every LOG_FSYNC_INTERVAL s
+LOG_FSYNC = os.getenv("LOG_FSYNC", "none")
+LOG_FSYNC_INTERVAL = float(os.getenv("LOG_FSYNC_INTERVAL", "5.0"))
+# Rotate once a file would grow past this size (0 disables rotation)
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+_STOP = object()
+
+RECORDS_DROPPED = Counter("dsa_log_records_dropped_total",
+                          "Records dropped because a background writer's queue was full", ("writer",))
+
+
+class InterProcessLock:
+    """Exclusive lock on `<path>.lock`, shared by every process appending to `path`"""
+
+    def __init__(self, path):
+        self.lock_path = path + ".lock"
+        self.fd = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        self.fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT)
+        try:
+            if fcntl:
+                fcntl.flock(self.fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(self.fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if blocking:
+                raise
+            os.close(self.fd)
+            self.fd = None
+            return False
+
+    def release(self):
+        try:
+            if fcntl:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class BackgroundWriter:
+    """
+    Queue plus daemon thread that hands records to `_write_batch` in batches.
+    The thread is started lazily on first write (and restarted after fork),
+    so importing this module never spawns threads.
+    """
+
+    def __init__(self, name: str,
+                 batch_size: int = LOG_FLUSH_BATCH,
+                 flush_interval: float = LOG_FLUSH_INTERVAL):
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._dropping = False
+
+    def write(self, record: Any):
+        """
+        Enqueue a record. Serialization and I/O happen on the writer thread.
+        If the queue is full (disk or SQLite stalled) the record is dropped
+        and counted rather than making the caller wait.
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+            self._dropping = False
+        except queue.Full:
+            RECORDS_DROPPED.inc(writer=self.name)
+            if not self._dropping:
+                self._dropping = True
+                print(f"Warning: {self.name} writer queue is full ({LOG_QUEUE_SIZE} records); dropping records")
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Block until everything enqueued so far has been written"""
+        if not self._running():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 10.0):
+        """Flush remaining records and stop the writer thread"""
+        if not self._running():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _running(self):
+        return self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+
+    def _ensure_started(self):
+        if self._running():
+            return
+        with self._start_lock:
+            if self._running():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # Forked child: the parent's thread and queued records do not belong to us
+                self._queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=f"writer:{self.name}", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        pending = []
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP or isinstance(item, threading.Event):
+                self._write_batch(pending)
+                pending = []
+                last_flush = time.monotonic()
+                if item is _STOP:
+                    self._on_stop()
+                    return
+                item.set()
+                continue
+
+            if item is not None:
+                pending.append(item)
+
+            if len(pending) >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                self._write_batch(pending)
+                pending = []
+                last_flush = time.monotonic()
+
+    def _write_batch(self, records):
+        raise NotImplementedError
+
+    def _on_stop(self):
+        """Hook for releasing resources owned by the writer thread"""
+        pass
+
+
+class JsonlWriter(BackgroundWriter):
+    """Buffered JSONL appender for a single file, safe across processes"""
+
+    def __init__(self, path: str,
+                 batch_size: int = LOG_FLUSH_BATCH,
+                 flush_interval: float = LOG_FLUSH_INTERVAL,
+                 fsync: str = LOG_FSYNC,
+                 max_bytes: int = LOG_MAX_BYTES,
+                 backup_count: int = LOG_BACKUP_COUNT):
+        if fsync not in ("none", "batch", "interval"):
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.path = os.path.abspath(path)
+        super().__init__(os.path.basename(self.path), batch_size, flush_interval)
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._last_fsync = 0.0
+
+    def _write_batch(self, records):
+        if not records:
+            return
+        try:
+            data = "".join(json.dumps(r, default=str) + "\n" for r in records).encode("utf-8")
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            with InterProcessLock(self.path):
+                if self.max_bytes and os.path.exists(self.path) and \
+                        os.path.getsize(self.path) + len(data) > self.max_bytes:
+                    self._rotate()
+
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    view = memoryview(data)
+                    while view:
+                        written = os.write(fd, view)
+                        view = view[written:]
+                    if self._should_fsync():
+                        os.fsync(fd)
+                finally:
+                    os.close(fd)
+        except Exception as e:
+            print(f"Warning: Failed to write {len(records)} records to {self.path}: {e}")
+
+    def _should_fsync(self):
+        if self.fsync == "batch":
+            return True
+        if self.fsync == "interval" and time.monotonic() - self._last_fsync >= LOG_FSYNC_INTERVAL:
+            self._last_fsync = time.monotonic()
+            return True
+        return False
+
+    def _rotate(self):
+        """
+        Move the current file aside, gzip it and prune old archives (caller
+        holds the lock). The archive is named after the file's generation,
+        which then moves on, so readers holding a cursor can find it.
+        """
+        generation = self._generation()
+        stamp = f"{self.path}.g{generation}.{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        rotated, n = stamp, 0
+        while os.path.exists(rotated + ".gz"):
+            n += 1
+            rotated = f"{stamp}-{n}"
+        os.replace(self.path, rotated)
+        with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(rotated)
+        tmp = f"{self.path}.generation.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(generation + 1))
+        os.replace(tmp, self.path + ".generation")
+
+        archives = sorted(glob.glob(glob.escape(self.path) + ".*.gz"), key=os.path.getmtime)
+        for old in archives[:-self.backup_count] if self.backup_count else archives:
+            os.remove(old)
+
+    def _generation(self) -> int:
+        """How many times the file has been rotated"""
+        try:
+            with open(self.path + ".generation", "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def cursor(self) -> List[int]:
+        """
+        [generation, byte offset] after everything written so far (pending
+        records are flushed first). Unlike a bare offset it survives rotation.
+        """
+        self.flush()
+        with InterProcessLock(self.path):
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            return [self._generation(), size]
+
+    def read_after(self, cursor, end=None) -> Iterator[Any]:
+        """
+        Records written after `cursor` and up to `end` (both from cursor()),
+        replaying rotated archives of the generations in between. 0 is the
+        start of the oldest generation; any other bare int is a byte offset
+        into the current file (cursors saved before generations existed).
+        """
+        current = self._generation()
+        if isinstance(cursor, int):
+            cursor = [current if cursor else 0, cursor]
+        missing = []
+        start_generation, offset = cursor
+        end_generation, end_offset = end if end is not None else [current, None]
+        for generation in range(start_generation, end_generation + 1):
+            if generation < current:
+                archives = glob.glob(glob.escape(self.path) + f".g{generation}.*.gz")
+                if not archives:
+                    missing.append(generation)
+                    offset = 0
+                    continue
+                source = gzip.open(archives[0], "rb")
+            elif os.path.exists(self.path):
+                source = open(self.path, "rb")
+                # Past the end means the offset belongs to a file that is gone - all of this one is newer
+                if offset > os.path.getsize(self.path):
+                    offset = 0
+            else:
+                return
+            stop = end_offset if generation == end_generation else None
+            with source:
+                source.seek(offset)
+                while stop is None or source.tell() < stop:
+                    line = source.readline()
+                    if not line:
+                        break
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        continue
+            offset = 0
+        if missing:
+            # Pruned past LOG_BACKUP_COUNT
+            print(f"Warning: {len(missing)} rotated archives of {self.path} are gone; their records were skipped")
+
+
+_writers: Dict[str, BackgroundWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(path: str) -> JsonlWriter:
+    """Get the shared writer for a file, creating it on first use"""
+    key = os.path.abspath(path)
+    with _writers_lock:
+        if key not in _writers:
+            _writers[key] = JsonlWriter(key)
+        return _writers[key]
+
+
+def register_writer(key: str, writer: BackgroundWriter) -> BackgroundWriter:
+    """Register a non-JSONL writer so close_all_writers() also drains it"""
+    with _writers_lock:
+        return _writers.setdefault(key, writer)
+
+
+def close_all_writers():
+    """Flush and stop every writer; called on shutdown"""
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.close()
+
+
+atexit.register(close_all_writers)
@@ -0,0 +1,177 @@
+# backend/app/lora_adapters.py
+"""
+Several LoRA adapters served from one shared base model.
+
+Adapters are registered by name: `default` for the FINETUNED_MODEL_PATH
+adapter, one per sub-directory of LORA_ADAPTERS_DIR (an analysis style or
+language, trained with `finetune_train.py --adapter-name`), and any listed
+in LORA_ADAPTERS as `name=path,...`. The base weights are loaded once.
+Adapters are loaded into the same PeftModel on first use, and at most
+LORA_MAX_LOADED_ADAPTERS stay loaded. The least recently used adapter is
+dropped to make room for a new one.
+
+A request runs under one adapter (`use`), switched with set_adapter,
+which is a pointer swap rather than a reload. A batch can mix adapters
+(`generate` with one adapter name per row, PEFT's mixed-adapter
+inference). The model is shared, so generation is serialized by a lock.
+Loads, evictions and switches are counted, and their latency is recorded,
+in /metrics.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional
+
+from .telemetry import Counter, Histogram
+
+# Optional imports for local models (graceful fallback if not installed)
+try:
+    from peft import PeftModel
+    PEFT_AVAILABLE = True
+except ImportError:
+    PEFT_AVAILABLE = False
+
+LORA_ADAPTERS_DIR = os.getenv("LORA_ADAPTERS_DIR", os.path.join(os.path.dirname(__file__), "..", "models", "lora_adapters"))
+# Extra adapters outside LORA_ADAPTERS_DIR: "name=path,name=path"
+LORA_ADAPTERS = os.getenv("LORA_ADAPTERS", "")
+LORA_MAX_LOADED_ADAPTERS = int(os.getenv("LORA_MAX_LOADED_ADAPTERS", "4"))
+DEFAULT_ADAPTER = "default"
+
+ADAPTER_EVENTS = Counter("dsa_lora_adapter_events_total", "LoRA adapter loads, evictions and switches",
+                         ("adapter", "event"))
+ADAPTER_SECONDS = Histogram("dsa_lora_adapter_seconds", "LoRA adapter load and switch latency", ("operation",),
+                            buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0))
+
+
+def discover_adapters(default_path: Optional[str] = None, directory: str = LORA_ADAPTERS_DIR,
+                      listed: str = LORA_ADAPTERS) -> Dict[str, str]:
+    """name -> adapter directory for every adapter that has an adapter_config.json"""
+    adapters = {}
+    if default_path and os.path.exists(os.path.join(default_path, "adapter_config.json")):
+        adapters[DEFAULT_ADAPTER] = default_path
+    if os.path.isdir(directory):
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if os.path.exists(os.path.join(path, "adapter_config.json")):
+                adapters[name] = path
+    for entry in filter(None, (item.strip() for item in listed.split(","))):
+        name, _, path = entry.partition("=")
+        if not path:
+            print(f"Warning: ignoring LORA_ADAPTERS entry without a path: {entry}")
+            continue
+        adapters[name.strip()] = path.strip()
+    return adapters
+
+
+def _parameter_bytes(model, adapter: Optional[str] = None) -> int:
+    """Bytes of the base weights (adapter None) or of one adapter's LoRA weights"""
+    total = 0
+    for name, param in model.named_parameters():
+        is_lora = "lora_" in name
+        if adapter is None and not is_lora or adapter is not None and is_lora and f".{adapter}." in name:
+            total += param.numel() * param.element_size()
+    return total
+
+
+class AdapterPool:
+    """One base model with LoRA adapters loaded on demand and evicted least recently used first"""
+
+    def __init__(self, base_model, adapters: Dict[str, str], max_loaded: int = LORA_MAX_LOADED_ADAPTERS):
+        if not PEFT_AVAILABLE:
+            raise RuntimeError("peft is not installed")
+        if not adapters:
+            raise ValueError("No LoRA adapters registered")
+        self.base_model = base_model
+        self.paths = dict(adapters)
+        self.max_loaded = max(1, max_loaded)
+        self.model = None
+        self.active = None
+        self._loaded: "OrderedDict[str, int]" = OrderedDict()  # name -> weight bytes, least recent first
+        self._lock = threading.RLock()
+        self.base_bytes = _parameter_bytes(base_model)
+        # Load the first adapter now so the PeftModel exists and startup pays for it
+        first = DEFAULT_ADAPTER if DEFAULT_ADAPTER in self.paths else next(iter(self.paths))
+        with self._lock:
+            self._activate(first)
+
+    def register(self, name: str, path: str):
+        """Add an adapter; it is loaded on first use"""
+        with self._lock:
+            if name in self._loaded and self.paths[name] != path:
+                raise ValueError(f"LoRA adapter {name} is loaded from {self.paths[name]}; "
+                                 f"register {path} under a new name")
+            self.paths[name] = path
+
+    def _load(self, name: str):
+        if name not in self.paths:
+            raise KeyError(f"Unknown LoRA adapter: {name}")
+        start = time.perf_counter()
+        if self.model is None:
+            self.model = PeftModel.from_pretrained(self.base_model, self.paths[name], adapter_name=name)
+            self.model.eval()
+        else:
+            self.model.load_adapter(self.paths[name], adapter_name=name)
+        ADAPTER_SECONDS.observe(time.perf_counter() - start, operation="load")
+        ADAPTER_EVENTS.inc(adapter=name, event="load")
+        self._loaded[name] = _parameter_bytes(self.model, name)
+
+    def _evict(self, name: str):
+        self.model.delete_adapter(name)
+        del self._loaded[name]
+        if self.active == name:
+            self.active = None
+        ADAPTER_EVENTS.inc(adapter=name, event="evict")
+
+    def _ensure_loaded(self, names: List[str]):
+        """Load names (lock held), then evict the least recently used others down to max_loaded"""
+        if len(set(names)) > self.max_loaded:
+            raise ValueError(f"A batch may use at most {self.max_loaded} adapters, got {len(set(names))}")
+        for name in names:
+            if name not in self._loaded:
+                self._load(name)
+            self._loaded.move_to_end(name)
+        for name in list(self._loaded):
+            if len(self._loaded) <= self.max_loaded:
+                break
+            if name not in names:
+                self._evict(name)
+
+    def _activate(self, name: str):
+        self._ensure_loaded([name])
+        if self.active != name:
+            start = time.perf_counter()
+            self.model.set_adapter(name)
+            ADAPTER_SECONDS.observe(time.perf_counter() - start, operation="switch")
+            ADAPTER_EVENTS.inc(adapter=name, event="switch")
+            self.active = name
+
+    @contextmanager
+    def use(self, name: str = DEFAULT_ADAPTER) -> Iterator[Any]:
+        """The model with adapter `name` active, held exclusively for the block"""
+        with self._lock:
+            self._activate(name)
+            yield self.model
+
+    def generate(self, adapter_names: List[str], **kwargs):
+        """model.generate for a batch whose rows use different adapters (one name per row)"""
+        with self._lock:
+            if len(set(adapter_names)) == 1:
+                self._activate(adapter_names[0])
+                return self.model.generate(**kwargs)
+            self._ensure_loaded(adapter_names)
+            for name in set(adapter_names):
+                ADAPTER_EVENTS.inc(adapter=name, event="mixed_batch")
+            return self.model.generate(adapter_names=adapter_names, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "registered": sorted(self.paths),
+                "loaded": list(self._loaded),  # least recently used first
+                "active": self.active,
+                "max_loaded": self.max_loaded,
+                "base_bytes": self.base_bytes,
+                "adapter_bytes": dict(self._loaded),
+            }
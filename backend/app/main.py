@@ -1,18 +1,32 @@
 # backend/app/main.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import os
+from typing import List, Optional, Union
+import time
+import asyncio
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-from .cf_client import fetch_user_submissions, get_topic_statistics, fetch_user_info
-from .smart_planner import generate_recommendations_from_stats
+from .pipeline import build_recommendations, resolve_window, stream_recommendation_events
 from .evaluator import AgentEvaluator
+from .log_writer import close_all_writers
+from . import db
+from .telemetry import HTTP_REQUEST_SECONDS, render_metrics
+from . import profiling
+from .refresher import HandleRefresher
+from .collaborative import get_recommender
+from .llm_router import get_router
+from . import chat
+from .cohort_baselines import get_baselines
+from .responses import FastJSONResponse, dumps, finalize_responses, recommendation_response
+from .admission import ADMISSION_RETRY_AFTER, PRIORITIES, Overloaded, get_admission
+from .deadline import REQUEST_DEADLINE, Deadline, DeadlineExceeded, applied, run_in_thread
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -21,100 +35,285 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# ETags, If-None-Match -> 304 and gzip/brotli; registered first so request latency includes it
+app.middleware("http")(finalize_responses)
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Use the route template so per-handle paths do not explode label cardinality
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=route.path if route else "unmatched",
+            status=str(status)
+        )
+
+# Admin-only profiling; nothing is installed unless ADMIN_TOKEN is set
+if profiling.ADMIN_TOKEN:
+    app.middleware("http")(profiling.profile_requests)
+app.include_router(profiling.router)
+
 # Initialize evaluator
 evaluator = AgentEvaluator()
 
+@app.on_event("startup")
+async def startup():
+    await refresher.start()
+    # Cohort percentile tables (app.cohort_baselines build) are small; load them before the first request
+    get_baselines()
+    # Build the collaborative-filtering matrix off the event loop
+    asyncio.get_running_loop().run_in_executor(None, get_recommender().refresh, True)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await refresher.stop()
+    # Persist aggregates so the next start does not replay the results file
+    evaluator.save_snapshot()
+    close_all_writers()
+
 @app.get("/")
 async def root():
     return {"message": "DSA Prep Agent FastAPI Backend", "status": "running"}
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy"}
+    return {"status": "healthy", "admission": get_admission().stats()}
 
 class HandleRequest(BaseModel):
     handle: str
     max_subs: int = 20
+    # Restrict statistics to a time window: since = unix timestamp or "last_contest", window = "30d", "12h", ...
+    since: Optional[Union[float, str]] = None
+    window: Optional[str] = None
+    # Top-level response keys to return, e.g. ["recommendations", "user_rating"] (all when omitted)
+    fields: Optional[List[str]] = None
+
+# Precomputed results for tracked handles, refreshed in the background
+refresher = HandleRefresher(build_recommendations)
+
+def _request_budget(request: Request):
+    """(Deadline, priority) from X-Request-Timeout (capped at REQUEST_DEADLINE) and X-Request-Priority"""
+    seconds = REQUEST_DEADLINE
+    try:
+        seconds = min(seconds, float(request.headers.get("x-request-timeout", seconds)))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="X-Request-Timeout must be a number of seconds")
+    priority = request.headers.get("x-request-priority", "interactive").lower()
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"X-Request-Priority must be one of {sorted(PRIORITIES)}")
+    return Deadline(seconds), priority
+
+def _overloaded(e: Overloaded):
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(ADMISSION_RETRY_AFTER)})
+
+def _timed_out(e: DeadlineExceeded):
+    return HTTPException(status_code=504, detail=f"Request deadline exceeded ({e})")
+
+def _pipeline(handle, since=None, window=None):
+    """resolve_window + build_recommendations, run on a worker thread"""
+    if since is not None or window is not None:
+        return build_recommendations(handle, *resolve_window(handle, since, window))
+    return build_recommendations(handle)
 
 @app.post("/api/recommendations")
-async def recommendations(req: HandleRequest):
+async def recommendations(req: HandleRequest, request: Request):
+    windowed = req.since is not None or req.window is not None
+    # Tracked handles are answered from the last good result while it refreshes (no pipeline slot needed)
+    if not windowed:
+        cached = await refresher.serve_cached(req.handle)
+        if cached is not None:
+            return recommendation_response(cached, req.fields)
+    
+    deadline, priority = _request_budget(request)
+    loop = asyncio.get_running_loop()
     try:
-        handle = req.handle
-        
-        # Get topic statistics (like CF Analytics) - NO AI CALLS NEEDED!
-        print(f"Fetching statistics for {handle}...")
-        stats = get_topic_statistics(handle, max_submissions=500)
-        
-        if stats is None:
-            raise HTTPException(status_code=404, detail="User not found or unable to fetch data from Codeforces.")
-        
-        # Get user info
-        user_info = fetch_user_info(handle)
-        
-        # Get only recent submissions for context (optional, not analyzed individually)
-        recent_subs = fetch_user_submissions(handle, limit=10, recent_only=True)
-        
-        if not recent_subs:
-            raise HTTPException(status_code=404, detail="User has no submissions.")
-        
-        print(f"Found {stats['total_solved']} solved problems across {len(stats['topic_stats'])} topics")
-        print(f"Generating recommendations based on statistics...")
-        
-        # Generate recommendations using statistics (only 1 AI call instead of N)
-        recs = generate_recommendations_from_stats(
-            stats["topic_stats"],
-            stats["rating_distribution"],
-            user_info,
-            handle
-        )
-        
-        # Simple evaluation based on stats
-        weak_topics_count = sum(1 for s in stats["topic_stats"].values() if s["strength"] == "weak")
-        medium_topics_count = sum(1 for s in stats["topic_stats"].values() if s["strength"] == "medium")
-        
-        # Get user rating
-        user_rating = user_info.get("rating", 0) if user_info else 0
-        user_max_rating = user_info.get("maxRating", 0) if user_info else 0
-        
-        eval_metrics = {
-            "analysis": {
-                "average_completeness": 1.0,  # Based on stats, always complete
-                "average_relevance": 0.9,    # High relevance based on actual stats
-                "average_overall_quality": 0.85
-            },
-            "recommendations": {
-                "recommendation_quality": 0.9,
-                "recommendation_count": len(recs.get("recommendations", []))
-            },
-            "overall_agent_score": 0.88,
-            "statistics": {
-                "total_solved": stats["total_solved"],
-                "topics_analyzed": len(stats["topic_stats"]),
-                "weak_topics": weak_topics_count,
-                "medium_topics": medium_topics_count
-            }
-        }
-        
-        return {
-            "handle": handle,
-            "recommendations": recs,
-            "evaluation": eval_metrics,
-            "statistics": stats,  # Include topic stats for display
-            "user_rating": user_rating,
-            "user_max_rating": user_max_rating,
-            "model_used": "api-statistics-based"  # New approach!
-        }
+        async with get_admission().slot(priority, deadline):
+            result = await run_in_thread(deadline, _pipeline, req.handle, req.since, req.window)
+        if not windowed:
+            await loop.run_in_executor(None, refresher.store_if_tracked, req.handle, result)
+        return recommendation_response(result, req.fields)
     except HTTPException:
         raise
+    except Overloaded as e:
+        raise _overloaded(e)
+    except DeadlineExceeded as e:
+        raise _timed_out(e)
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@app.post("/api/recommendations/stream")
+async def stream_recommendations(req: HandleRequest, request: Request):
+    """
+    Newline-delimited JSON events: statistics, then each recommendation as
+    soon as the model finishes it, then the full result. The pipeline slot
+    is held until the stream ends.
+    """
+    deadline, priority = _request_budget(request)
+    admission = get_admission()
+    try:
+        await admission.acquire(priority, deadline)
+    except Overloaded as e:
+        raise _overloaded(e)
+    
+    def gather():
+        since = until = None
+        if req.since is not None or req.window is not None:
+            since, until = resolve_window(req.handle, req.since, req.window)
+        return since, stream_recommendation_events(req.handle, since, until)
+    
+    try:
+        since, events = await run_in_thread(deadline, gather)
+    except DeadlineExceeded as e:
+        admission.release()
+        raise _timed_out(e)
+    except BaseException:
+        admission.release()
+        raise
+    
+    def lines():
+        while True:
+            # Each step runs on a fresh threadpool context, so apply the deadline per step
+            with applied(deadline):
+                event = next(events, None)
+            if event is None:
+                break
+            if event["event"] == "result" and since is None:
+                refresher.store_if_tracked(req.handle, event["data"])
+            yield dumps(event) + b"\n"
+    
+    return StreamingResponse(admission.held_by(lines()), media_type="application/x-ndjson")
+
+class ChatRequest(BaseModel):
+    message: str
+    # Returned by the first turn's `session` event; omit to start a new conversation
+    session_id: Optional[str] = None
+
+@app.post("/api/chat/stream")
+async def chat_stream(req: ChatRequest, request: Request):
+    """
+    Server-sent events for one chat turn: `session` (the id to send with the
+    next message), `token` for each reply chunk as the model writes it, then
+    `done` or `error`. The slot is held until the reply ends.
+    """
+    if req.session_id is not None and not 0 < len(req.session_id) <= 64:
+        raise HTTPException(status_code=400, detail="session_id must be 1 to 64 characters")
+    try:
+        chat.check_message(req.message)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    deadline, priority = _request_budget(request)
+    admission = get_admission()
+    try:
+        await admission.acquire(priority, deadline)
+    except Overloaded as e:
+        raise _overloaded(e)
+    events = chat.stream_reply(chat.get_sessions().get(req.session_id), req.message)
+
+    def messages():
+        while True:
+            with applied(deadline):
+                event = next(events, None)
+            if event is None:
+                break
+            yield b"event: " + event["event"].encode() + b"\ndata: " + dumps(event["data"]) + b"\n\n"
+
+    return StreamingResponse(admission.held_by(messages()), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.delete("/api/chat/{session_id}")
+async def end_chat(session_id: str):
+    """Forget a conversation"""
+    return {"session_id": session_id, "dropped": chat.get_sessions().drop(session_id)}
+
+@app.get("/api/similar/{handle}")
+def similar_user_recommendations(handle: str, k: int = 10, min_rating: Optional[int] = None,
+                                 max_rating: Optional[int] = None):
+    """
+    Unsolved problems solved by the most similar handles in the submission
+    store. A plain def, so FastAPI runs it on the threadpool: recommend()
+    reads SQLite and waits on the matrix lock while a refresh holds it.
+    """
+    _require_sqlite()
+    recommender = get_recommender()
+    start = time.perf_counter()
+    recs = recommender.recommend(handle, k=min(k, 100), min_rating=min_rating, max_rating=max_rating)
+    return {
+        "handle": handle,
+        "recommendations": recs,
+        "matrix": recommender.matrix.stats(),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text-format metrics for this worker"""
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/llm/stats")
+async def llm_stats():
+    """Per-provider LLM calls, hedges, circuit breaker state and latency quantiles"""
+    return get_router().stats()
+
 @app.get("/api/evaluation/stats")
 async def get_evaluation_stats():
     """Get aggregate evaluation statistics"""
     stats = evaluator.get_aggregate_metrics()
     return stats
+
+
+def _require_sqlite():
+    if db.STORAGE_BACKEND != "sqlite":
+        raise HTTPException(status_code=400, detail="History queries require STORAGE_BACKEND=sqlite")
+
+@app.get("/api/history/{handle}")
+async def get_handle_history(handle: str, since: Optional[float] = None, until: Optional[float] = None, limit: int = 50):
+    """Past recommendations and evaluations for a handle (since/until are unix timestamps)"""
+    _require_sqlite()
+    return db.get_handle_history(handle, since=since, until=until, limit=min(limit, 500))
+
+@app.get("/api/evaluation/trends")
+async def get_evaluation_trends(since: Optional[float] = None, until: Optional[float] = None,
+                                bucket: str = "day", handle: Optional[str] = None):
+    """Evaluation quality aggregated per hour/day/week"""
+    _require_sqlite()
+    try:
+        return {"bucket": bucket, "trends": db.get_evaluation_trends(since, until, bucket, handle)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+class TrackRequest(BaseModel):
+    handle: str
+
+@app.get("/api/tracked")
+def list_tracked():
+    """Tracked handles and the age of their precomputed results"""
+    return {"tracked": db.list_tracked_handles()}
+
+@app.post("/api/tracked")
+async def track_handle(req: TrackRequest):
+    """Start precomputing recommendations for a handle"""
+    handle = db.handle_key(req.handle)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, db.add_tracked_handle, handle)
+    if await loop.run_in_executor(None, db.get_precomputed_result, handle) is None:
+        refresher.refresh(handle)
+    return {"handle": handle, "tracked": True}
+
+@app.delete("/api/tracked/{handle}")
+def untrack_handle(handle: str):
+    handle = db.handle_key(handle)
+    db.remove_tracked_handle(handle)
+    return {"handle": handle, "tracked": False}
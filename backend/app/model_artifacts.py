@@ -0,0 +1,280 @@
+# backend/app/model_artifacts.py
+"""
+Versioned local model artifacts for the local analyzer.
+
+`export` downloads the base model and tokenizer once (on a host with hub
+access). It writes them with the LoRA adapters, or one adapter merged into
+the base, as safetensors to MODEL_ARTIFACTS_DIR/<name>/<version>/, with a
+manifest of file sizes and sha256 sums. The `current` file names the
+version in use. It is switched atomically after a complete export, so a
+running host never sees a half-written version.
+
+    cd backend
+    python -m app.model_artifacts export --adapter default=models/lora_dsa_analyzer
+    python -m app.model_artifacts export --adapter default=models/lora_dsa_analyzer --merge
+    python -m app.model_artifacts list
+    python -m app.model_artifacts verify
+    python -m app.model_artifacts use 20261019-120000
+    python -m app.model_artifacts prune --keep 3
+
+`load_model` reads an artifact strictly offline: local_files_only, so no
+hub request is made, and safetensors weights, which are memory-mapped
+rather than unpickled into a second copy.
+"""
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, Any, List, NamedTuple, Optional
+
+# Optional imports for local models (graceful fallback if not installed)
+try:
+    import torch
+    from safetensors.torch import save_file
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+MODEL_ARTIFACTS_DIR = os.getenv("MODEL_ARTIFACTS_DIR", os.path.join(os.path.dirname(__file__), "..", "models", "artifacts"))
+MODEL_ARTIFACT = os.getenv("MODEL_ARTIFACT", "dsa_analyzer")
+# Pin a version instead of following `current`
+MODEL_ARTIFACT_VERSION = os.getenv("MODEL_ARTIFACT_VERSION", "")
+
+
+class Artifact(NamedTuple):
+    name: str
+    version: str
+    path: str
+    manifest: Dict[str, Any]
+
+    @property
+    def model_dir(self) -> str:
+        return os.path.join(self.path, "model")
+
+    @property
+    def adapters(self) -> Dict[str, str]:
+        return {name: os.path.join(self.path, "adapters", name) for name in self.manifest.get("adapters", [])}
+
+    @property
+    def merged(self) -> Optional[str]:
+        """Name of the adapter merged into the base weights, if any"""
+        return self.manifest.get("merged")
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_atomic(path: str, text: str):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _export_adapter(source: str, target: str):
+    """Copy a PEFT adapter directory, converting pickled weights to safetensors"""
+    os.makedirs(target)
+    shutil.copy(os.path.join(source, "adapter_config.json"), target)
+    safetensors_path = os.path.join(source, "adapter_model.safetensors")
+    if os.path.exists(safetensors_path):
+        shutil.copy(safetensors_path, target)
+        return
+    weights = torch.load(os.path.join(source, "adapter_model.bin"), map_location="cpu", weights_only=True)
+    save_file({key: tensor.contiguous() for key, tensor in weights.items()},
+              os.path.join(target, "adapter_model.safetensors"))
+
+
+def export_artifact(base_model: str, adapters: Dict[str, str], merge: bool = False, name: str = MODEL_ARTIFACT,
+                    version: Optional[str] = None, root: str = MODEL_ARTIFACTS_DIR) -> Artifact:
+    """Write base model, tokenizer and adapters (or the one adapter merged in) as a new current version"""
+    if not TORCH_AVAILABLE:
+        raise RuntimeError("Exporting a model artifact needs torch, transformers and safetensors")
+    if merge and len(adapters) != 1:
+        raise ValueError("--merge takes exactly one adapter")
+    version = version or datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    directory = os.path.join(root, name)
+    final = os.path.join(directory, version)
+    if os.path.exists(final):
+        raise FileExistsError(f"Artifact {name}/{version} already exists")
+    staging = os.path.join(directory, f".staging-{version}")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    tokenizer = AutoTokenizer.from_pretrained(base_model)
+    model = AutoModelForCausalLM.from_pretrained(base_model)
+    merged = None
+    if merge:
+        from peft import PeftModel
+        merged, path = next(iter(adapters.items()))
+        model = PeftModel.from_pretrained(model, path).merge_and_unload()
+    model.save_pretrained(os.path.join(staging, "model"), safe_serialization=True)
+    tokenizer.save_pretrained(os.path.join(staging, "model"))
+    if not merge:
+        for adapter, path in adapters.items():
+            _export_adapter(path, os.path.join(staging, "adapters", adapter))
+
+    files = {}
+    for folder, _, names in os.walk(staging):
+        for filename in sorted(names):
+            path = os.path.join(folder, filename)
+            files[os.path.relpath(path, staging)] = {"bytes": os.path.getsize(path), "sha256": _sha256(path)}
+    pickled = [f for f in files if f.endswith((".bin", ".pt", ".pth"))]
+    if pickled:
+        raise RuntimeError(f"Export left non-safetensors weights: {pickled}")
+    manifest = {
+        "name": name,
+        "version": version,
+        "base_model": base_model,
+        "format": "safetensors",
+        "merged": merged,
+        "adapters": [] if merge else sorted(adapters),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "files": files,
+    }
+    _write_atomic(os.path.join(staging, "manifest.json"), json.dumps(manifest, indent=2))
+    os.replace(staging, final)
+    set_current(version, name, root)
+    return Artifact(name, version, final, manifest)
+
+
+def set_current(version: str, name: str = MODEL_ARTIFACT, root: str = MODEL_ARTIFACTS_DIR):
+    if not os.path.exists(os.path.join(root, name, version, "manifest.json")):
+        raise FileNotFoundError(f"No artifact {name}/{version}")
+    _write_atomic(os.path.join(root, name, "current"), version + "\n")
+
+
+def resolve_artifact(name: str = MODEL_ARTIFACT, version: str = MODEL_ARTIFACT_VERSION,
+                     root: str = MODEL_ARTIFACTS_DIR) -> Optional[Artifact]:
+    """The pinned (or current) version of artifact `name`, None if there is none"""
+    directory = os.path.join(root, name)
+    if not version:
+        try:
+            with open(os.path.join(directory, "current"), encoding="utf-8") as f:
+                version = f.read().strip()
+        except OSError:
+            return None
+    try:
+        with open(os.path.join(directory, version, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: model artifact {name}/{version} is unreadable: {e}")
+        return None
+    return Artifact(name, version, os.path.join(directory, version), manifest)
+
+
+def list_artifacts(name: str = MODEL_ARTIFACT, root: str = MODEL_ARTIFACTS_DIR) -> List[Dict[str, Any]]:
+    directory = os.path.join(root, name)
+    current = resolve_artifact(name, "", root)
+    versions = []
+    for version in os.listdir(directory) if os.path.isdir(directory) else []:
+        if version.startswith(".") or not os.path.isdir(os.path.join(directory, version)):
+            continue  # staging directories and the `current` file
+        artifact = resolve_artifact(name, version, root)
+        if artifact is not None:
+            versions.append({
+                "version": version,
+                "current": current is not None and current.version == version,
+                "base_model": artifact.manifest["base_model"],
+                "merged": artifact.merged,
+                "adapters": artifact.manifest["adapters"],
+                "bytes": sum(f["bytes"] for f in artifact.manifest["files"].values()),
+                "created": artifact.manifest["created"],
+            })
+    return sorted(versions, key=lambda entry: entry["created"])
+
+
+def verify_artifact(artifact: Artifact) -> List[str]:
+    """Problems with an artifact's files (empty when every size and sha256 matches the manifest)"""
+    problems = []
+    for relpath, expected in artifact.manifest["files"].items():
+        path = os.path.join(artifact.path, relpath)
+        if not os.path.exists(path):
+            problems.append(f"missing {relpath}")
+        elif os.path.getsize(path) != expected["bytes"] or _sha256(path) != expected["sha256"]:
+            problems.append(f"changed {relpath}")
+    return problems
+
+
+def prune_artifacts(keep: int, name: str = MODEL_ARTIFACT, root: str = MODEL_ARTIFACTS_DIR) -> List[str]:
+    """Delete all but the newest `keep` versions (never the current one)"""
+    versions = list_artifacts(name, root)
+    removed = []
+    for entry in versions[:max(0, len(versions) - keep)]:
+        if not entry["current"]:
+            shutil.rmtree(os.path.join(root, name, entry["version"]))
+            removed.append(entry["version"])
+    return removed
+
+
+def load_model(artifact: Artifact, **kwargs):
+    """(model, tokenizer) from an artifact, offline, with memory-mapped safetensors weights"""
+    tokenizer = AutoTokenizer.from_pretrained(artifact.model_dir, local_files_only=True)
+    model = AutoModelForCausalLM.from_pretrained(artifact.model_dir, local_files_only=True, use_safetensors=True,
+                                                 low_cpu_mem_usage=True, **kwargs)
+    return model, tokenizer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export and manage offline model artifacts for the local analyzer")
+    parser.add_argument("--name", default=MODEL_ARTIFACT)
+    parser.add_argument("--root", default=MODEL_ARTIFACTS_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Export base model, tokenizer and adapters as a new current version")
+    export.add_argument("--base-model", help="Hub name or local path (default: BASE_MODEL_NAME)")
+    export.add_argument("--adapter", action="append", default=[], metavar="NAME=PATH",
+                        help="LoRA adapter directory to include (repeatable)")
+    export.add_argument("--merge", action="store_true", help="Merge the single --adapter into the base weights")
+    export.add_argument("--version", help="Version label (default: UTC timestamp)")
+    sub.add_parser("list", help="List exported versions")
+    verify = sub.add_parser("verify", help="Check file sizes and sha256 sums against the manifest")
+    verify.add_argument("--version", default="")
+    use = sub.add_parser("use", help="Make a version current")
+    use.add_argument("version")
+    prune = sub.add_parser("prune", help="Delete old versions")
+    prune.add_argument("--keep", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        from .finetuned_analyzer import BASE_MODEL_NAME
+        adapters = {}
+        for entry in args.adapter:
+            adapter, _, path = entry.partition("=")
+            if not path:
+                parser.error(f"--adapter expects NAME=PATH, got {entry}")
+            adapters[adapter] = path
+        artifact = export_artifact(args.base_model or BASE_MODEL_NAME, adapters, args.merge, args.name,
+                                   args.version, args.root)
+        size = sum(f["bytes"] for f in artifact.manifest["files"].values())
+        print(f"✅ Exported {artifact.name}/{artifact.version} ({size / 1e6:.1f} MB) to {artifact.path}")
+    elif args.command == "list":
+        print(json.dumps(list_artifacts(args.name, args.root), indent=2))
+    elif args.command == "verify":
+        artifact = resolve_artifact(args.name, args.version, args.root)
+        if artifact is None:
+            print(f"No artifact {args.name} in {args.root}")
+            return 1
+        problems = verify_artifact(artifact)
+        for problem in problems:
+            print(problem)
+        print(f"{artifact.name}/{artifact.version}: {'OK' if not problems else f'{len(problems)} problems'}")
+        return 1 if problems else 0
+    elif args.command == "use":
+        set_current(args.version, args.name, args.root)
+        print(f"{args.name} now uses {args.version}")
+    elif args.command == "prune":
+        removed = prune_artifacts(args.keep, args.name, args.root)
+        print(f"Removed {len(removed)} versions: {', '.join(removed) or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,330 @@
+# backend/app/profiling.py
+"""
+Opt-in, admin-only request profiling and heap snapshots.
+
+Everything here is disabled unless ADMIN_TOKEN is set: the profiling
+middleware is not even installed, and tracemalloc only runs between
+/admin/heap/start and /admin/heap/stop.
+
+Profile a single request by sending both headers:
+    X-Admin-Token: <ADMIN_TOKEN>
+    X-Profile: cprofile | sample        (or ?profile=cprofile|sample)
+The response carries an X-Profile-Id; fetch the report from
+/admin/profiles/{id}.
+
+Most of a request's work runs on executor threads (deadline.call_within),
+not on the event loop. The request's profile travels in a context variable,
+and call_within profiles its worker thread into the same report.
+"""
+import io
+import os
+import re
+import sys
+import hmac
+import time
+import uuid
+import pstats
+import cProfile
+import threading
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+from collections import Counter, OrderedDict
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(__file__), "..", "profiles"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+MAX_HEAP_SNAPSHOTS = 5
+
+_PROFILE_ID = re.compile(r"^[\w-]+\.(prof|collapsed)$")
+# cProfile cannot nest and samples from overlapping requests would mix, so profile one at a time
+_profile_lock = threading.Lock()
+
+
+def is_admin(token: Optional[str]) -> bool:
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+class StackSampler:
+    """
+    Statistical profiler: a background thread records the stacks of the
+    target threads every `interval` seconds as collapsed stacks
+    (flamegraph.pl / speedscope compatible), rooted at the thread name.
+    """
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.thread_ids = {thread_id: threading.current_thread().name}
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def add_thread(self, thread_id: int, name: str):
+        self.thread_ids[thread_id] = name
+
+    def remove_thread(self, thread_id: int):
+        self.thread_ids.pop(thread_id, None)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, name in list(self.thread_ids.items()):
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                if stack:
+                    stack.append(name)
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def dump(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RequestProfile:
+    """One profiled request: the event-loop profiler plus its worker threads'"""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.loop_thread = threading.get_ident()
+        self.profiler = None
+        self.sampler = None
+        self.thread_profilers = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.mode == "cprofile":
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.sampler = StackSampler(self.loop_thread)
+            self.sampler.start()
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        else:
+            self.sampler.stop()
+
+    @contextmanager
+    def thread(self):
+        """Profile the calling (worker) thread for the block"""
+        ident = threading.get_ident()
+        if ident == self.loop_thread:
+            yield
+            return
+        if self.sampler is not None:
+            self.sampler.add_thread(ident, threading.current_thread().name)
+            try:
+                yield
+            finally:
+                self.sampler.remove_thread(ident)
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ profiles every thread from the first enable; nothing more to do
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self._lock:
+                self.thread_profilers.append(profiler)
+
+    def dump(self, path: str):
+        if self.sampler is not None:
+            self.sampler.dump(path)
+            return
+        stats = pstats.Stats(self.profiler)
+        for profiler in self.thread_profilers:
+            stats.add(profiler)
+        stats.dump_stats(path)
+
+
+_active_profile: contextvars.ContextVar = contextvars.ContextVar("request_profile", default=None)
+
+
+@contextmanager
+def profile_thread():
+    """Add the calling thread to the current request's profile, if it is being profiled"""
+    profile = _active_profile.get()
+    if profile is None:
+        yield
+        return
+    with profile.thread():
+        yield
+
+
+async def profile_requests(request: Request, call_next):
+    """HTTP middleware: profile the request when an admin asks for it"""
+    mode = request.headers.get("x-profile") or request.query_params.get("profile")
+    if not mode or not is_admin(request.headers.get("x-admin-token")):
+        return await call_next(request)
+    if mode not in ("cprofile", "sample"):
+        return JSONResponse(status_code=400, content={"detail": "X-Profile must be 'cprofile' or 'sample'"})
+    if not _profile_lock.acquire(blocking=False):
+        response = await call_next(request)
+        response.headers["X-Profile-Skipped"] = "another profile is running"
+        return response
+
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        start = time.perf_counter()
+
+        profile = RequestProfile(mode)
+        # Set before call_next, so the endpoint's task (and call_within on executor threads) inherits it
+        token = _active_profile.set(profile)
+        profile.start()
+        try:
+            response = await call_next(request)
+        finally:
+            profile.stop()
+            _active_profile.reset(token)
+        profile_id += ".prof" if mode == "cprofile" else ".collapsed"
+        profile.dump(os.path.join(PROFILE_DIR, profile_id))
+    finally:
+        _profile_lock.release()
+
+    response.headers["X-Profile-Id"] = profile_id
+    response.headers["X-Profile-Seconds"] = f"{time.perf_counter() - start:.4f}"
+    return response
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+def _profile_path(profile_id: str) -> str:
+    if not _PROFILE_ID.match(profile_id):
+        raise HTTPException(status_code=400, detail="Invalid profile id")
+    path = os.path.join(PROFILE_DIR, profile_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return path
+
+
+@router.get("/profiles")
+async def list_profiles():
+    if not os.path.isdir(PROFILE_DIR):
+        return {"profiles": []}
+    names = sorted((n for n in os.listdir(PROFILE_DIR) if _PROFILE_ID.match(n)), reverse=True)
+    return {"profiles": names}
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, raw: bool = False, limit: int = 40, sort: str = "cumulative"):
+    """Text report of a stored profile, or the raw .prof/.collapsed file with ?raw=true"""
+    path = _profile_path(profile_id)
+    if raw:
+        return FileResponse(path, filename=profile_id)
+
+    if profile_id.endswith(".prof"):
+        out = io.StringIO()
+        try:
+            pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+        except KeyError:
+            raise HTTPException(status_code=400, detail=f"Unknown sort key: {sort}")
+        return PlainTextResponse(out.getvalue())
+
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.readlines()[:limit]
+    return PlainTextResponse("".join(lines))
+
+
+_heap_snapshots = OrderedDict()
+
+
+def _top_stats(stats, limit):
+    return [
+        {"location": str(stat.traceback), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+        for stat in stats[:limit]
+    ]
+
+
+@router.post("/heap/start")
+async def heap_start(frames: int = 10):
+    """Start tracemalloc (adds allocation overhead until /admin/heap/stop)"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    return {"tracing": True, "frames": tracemalloc.get_traceback_limit()}
+
+
+@router.post("/heap/stop")
+async def heap_stop():
+    tracemalloc.stop()
+    _heap_snapshots.clear()
+    return {"tracing": False}
+
+
+@router.post("/heap/snapshot")
+async def heap_snapshot(limit: int = 20):
+    """Take a heap snapshot; the last few are kept in memory for diffing"""
+    if not tracemalloc.is_tracing():
+        raise HTTPException(status_code=409, detail="tracemalloc is not running; POST /admin/heap/start first")
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    snapshot_id = f"{time.strftime('%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    _heap_snapshots[snapshot_id] = snapshot
+    while len(_heap_snapshots) > MAX_HEAP_SNAPSHOTS:
+        _heap_snapshots.popitem(last=False)
+
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "snapshot_id": snapshot_id,
+        "traced_kb": round(current / 1024, 1),
+        "peak_kb": round(peak / 1024, 1),
+        "top": _top_stats(snapshot.statistics("lineno"), limit),
+        "available": list(_heap_snapshots),
+    }
+
+
+@router.get("/heap/diff")
+async def heap_diff(base: str, target: Optional[str] = None, limit: int = 30, group_by: str = "lineno"):
+    """Allocation growth between two snapshots (target defaults to the latest)"""
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by must be lineno, filename or traceback")
+    target = target or next(reversed(_heap_snapshots), None)
+    if base not in _heap_snapshots or target not in _heap_snapshots:
+        raise HTTPException(status_code=404, detail=f"Unknown snapshot; available: {list(_heap_snapshots)}")
+
+    diff = _heap_snapshots[target].compare_to(_heap_snapshots[base], group_by)
+    return {
+        "base": base,
+        "target": target,
+        "top": [
+            {
+                "location": str(stat.traceback),
+                "size_diff_kb": round(stat.size_diff / 1024, 1),
+                "size_kb": round(stat.size / 1024, 1),
+                "count_diff": stat.count_diff,
+            }
+            for stat in diff[:limit]
+        ],
+    }
@@ -0,0 +1,190 @@
+# backend/app/prompts.py
+"""
+Prompt compilation for the LLM calls.
+
+Templates live in prompts/<name>_prompt.txt with `<SLOT>` markers, and the
+reply schema in prompts/<name>.schema.json. A template is split into its
+static text and slots once and cached (reloaded when the file changes),
+with the static text's token count. `compile_prompt` fills the slots and
+keeps the prompt within a token budget. A slot given as a list is trimmed
+from the end (callers put the most important items first), and a slot
+given as one string is cut short. The schema goes to the providers, which
+constrain the reply to it (Gemini responseSchema, OpenAI json_schema), so
+replies are compact JSON with no prose or code fences to strip.
+
+Tokens are counted with tiktoken (cl100k_base) when it is installed. Without
+it, a local estimate is used that is close enough for budgeting.
+"""
+import os
+import re
+import json
+import threading
+from typing import Dict, Any, List, NamedTuple, Optional, Union
+
+from .telemetry import Counter
+
+# Optional: exact token counts (graceful fallback to an estimate if not installed)
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+PROMPTS_DIR = os.getenv("PROMPTS_DIR", os.path.join(os.path.dirname(__file__), "..", "..", "prompts"))
+# Most tokens a compiled prompt may use; slots are trimmed to fit
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1200"))
+
+LLM_TOKENS = Counter("dsa_llm_tokens_total", "Prompt and reply tokens per template", ("template", "kind"))
+PROMPT_TRIMS = Counter("dsa_prompt_trimmed_items_total", "Slot items dropped to fit the prompt budget",
+                       ("template",))
+
+_SLOT = re.compile(r"<([A-Z][A-Z_]*)>")
+_PIECES = re.compile(r"\d+|[^\W\d_]+|\n[ \t]*|[ \t]{2,}|\S")
+_encoding = None
+
+
+def _get_encoding():
+    """tiktoken's encoding, loaded on first use (it may have to download its ranks once)"""
+    global _encoding, TIKTOKEN_AVAILABLE
+    if _encoding is None and TIKTOKEN_AVAILABLE:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"Warning: tiktoken encoding unavailable, estimating token counts: {e}")
+            TIKTOKEN_AVAILABLE = False
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in text (tiktoken when available, else an estimate)"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # About 4 characters per word token, 3 digits per number token, 1 per symbol,
+    # newline or indentation run (single spaces merge into the next word)
+    tokens = 0
+    for piece in _PIECES.findall(text):
+        if piece[0].isdigit():
+            tokens += (len(piece) + 2) // 3
+        elif piece[0].isalpha():
+            tokens += (len(piece) + 3) // 4
+        else:
+            tokens += 1
+    return tokens
+
+
+class CompiledPrompt(NamedTuple):
+    name: str
+    text: str
+    tokens: int
+    trimmed: int                      # slot items (or characters) dropped to fit the budget
+    schema: Optional[Dict[str, Any]]
+
+
+class PromptTemplate:
+    """A template split into static text and slots, with the static token count cached"""
+
+    def __init__(self, name: str, source: str, schema: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.schema = schema
+        self.parts = _SLOT.split(source)  # even indexes: static text, odd: slot names
+        self.slots = set(self.parts[1::2])
+        self.static_tokens = count_tokens("".join(self.parts[0::2]))
+
+    def render(self, slots: Dict[str, Union[str, List[str], int, float]],
+               budget: int = PROMPT_TOKEN_BUDGET, separator: str = "\n") -> CompiledPrompt:
+        missing = self.slots - set(slots)
+        if missing:
+            raise KeyError(f"Prompt {self.name} is missing slots: {sorted(missing)}")
+
+        values = {}
+        tokens = self.static_tokens
+        lists = {}
+        for slot in self.slots:
+            value = slots[slot]
+            if isinstance(value, (list, tuple)):
+                lists[slot] = [str(item) for item in value]
+                value = separator.join(lists[slot])
+            else:
+                value = str(value)
+            values[slot] = value
+            tokens += count_tokens(value) * self.parts[1::2].count(slot)
+
+        trimmed = 0
+        # Drop list items from the end, the longest list first, until the prompt fits
+        while tokens > budget and any(lists.values()):
+            slot = max((s for s in lists if lists[s]), key=lambda s: len(values[s]))
+            lists[slot].pop()
+            before = count_tokens(values[slot])
+            values[slot] = separator.join(lists[slot])
+            tokens -= (before - count_tokens(values[slot])) * self.parts[1::2].count(slot)
+            trimmed += 1
+        # Still over: cut the longest string slot short
+        if tokens > budget:
+            slot = max(values, key=lambda s: len(values[s]), default=None)
+            if slot is not None:
+                value = values[slot]
+                keep = max(0, count_tokens(value) - (tokens - budget))
+                cut = value[:int(len(value) * keep / max(1, count_tokens(value)))]
+                trimmed += len(value) - len(cut)
+                tokens -= count_tokens(value) - count_tokens(cut)
+                values[slot] = cut
+        if trimmed:
+            PROMPT_TRIMS.inc(trimmed, template=self.name)
+
+        text = "".join(values[part] if i % 2 else part for i, part in enumerate(self.parts))
+        return CompiledPrompt(self.name, text, tokens, trimmed, self.schema)
+
+
+_templates: Dict[str, Any] = {}
+_templates_lock = threading.Lock()
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+def get_template(name: str) -> PromptTemplate:
+    """prompts/<name>_prompt.txt (and <name>.schema.json), compiled once per file version"""
+    prompt_path = os.path.join(PROMPTS_DIR, f"{name}_prompt.txt")
+    schema_path = os.path.join(PROMPTS_DIR, f"{name}.schema.json")
+    version = (_mtime(prompt_path), _mtime(schema_path))
+    with _templates_lock:
+        cached = _templates.get(name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+    with open(prompt_path, encoding="utf-8") as f:
+        source = f.read()
+    schema = None
+    if os.path.exists(schema_path):
+        with open(schema_path, encoding="utf-8") as f:
+            schema = json.load(f)
+    template = PromptTemplate(name, source, schema)
+    with _templates_lock:
+        _templates[name] = (version, template)
+    return template
+
+
+def compile_prompt(name: str, budget: int = PROMPT_TOKEN_BUDGET, **slots) -> CompiledPrompt:
+    """Fill template `name` with slots (upper-case names) within the token budget"""
+    return get_template(name).render(slots, budget)
+
+
+def record_reply(prompt: CompiledPrompt, text: str):
+    """Count a sent prompt's tokens and its reply's against the template"""
+    LLM_TOKENS.inc(prompt.tokens, template=prompt.name, kind="prompt")
+    LLM_TOKENS.inc(count_tokens(text), template=prompt.name, kind="output")
+
+
+def parse_reply(prompt: CompiledPrompt, text: str) -> Dict[str, Any]:
+    """The reply as JSON ({"raw": text} if a provider ignored the schema)"""
+    record_reply(prompt, text)
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        return {"raw": text}
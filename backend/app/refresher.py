@@ -0,0 +1,189 @@
+# backend/app/refresher.py
+"""
+Stale-while-revalidate precomputation for a tracked roster of handles.
+
+Results for tracked handles are stored in SQLite. /api/recommendations
+serves the last good result immediately (with its age) and, if it is
+older than REFRESH_INTERVAL, refreshes it in the background. A scheduler
+keeps the whole roster fresh within a Codeforces call budget. When
+codeforces.com is down, refreshes fail quietly and the stale result keeps
+being served.
+
+Only one worker process runs the scheduler (elected with a lock file);
+every worker can serve the stored results.
+"""
+import os
+import time
+import asyncio
+from typing import Callable, Dict, Any, Optional
+
+from . import db
+from .admission import get_admission
+from .deadline import Deadline, call_within
+from .log_writer import InterProcessLock
+from .telemetry import CACHE_REQUESTS, Counter
+
+# Seconds before a precomputed result is considered stale
+REFRESH_INTERVAL = int(os.getenv("REFRESH_INTERVAL", "3600"))
+# Wait this long after a failed refresh before trying the handle again
+REFRESH_RETRY_SECONDS = int(os.getenv("REFRESH_RETRY_SECONDS", "300"))
+REFRESH_POLL_SECONDS = int(os.getenv("REFRESH_POLL_SECONDS", "30"))
+REFRESH_ENABLED = os.getenv("REFRESH_ENABLED", "true").lower() == "true"
+# Codeforces calls per second the background refresher may spend
+CF_BACKGROUND_RATE = float(os.getenv("CF_BACKGROUND_RATE", "0.5"))
+# Seconds one background refresh may take (it queues behind interactive requests)
+REFRESH_DEADLINE = float(os.getenv("REFRESH_DEADLINE", "60"))
+# One pipeline run makes user.status (stats), user.info and user.status (recent)
+CF_CALLS_PER_REFRESH = 3
+# Comma-separated handles that are always tracked
+TRACKED_HANDLES = [h.strip() for h in os.getenv("TRACKED_HANDLES", "").split(",") if h.strip()]
+
+REFRESHES = Counter("dsa_background_refreshes_total", "Background refreshes of tracked handles", ("result",))
+
+
+class RateBudget:
+    """Async token bucket: `rate` tokens per second, up to `burst` saved"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+class HandleRefresher:
+    """
+    Keeps precomputed /api/recommendations results for tracked handles.
+    `compute` is the (blocking) pipeline; it runs in a worker thread.
+    """
+
+    def __init__(self, compute: Callable[[str], Dict[str, Any]]):
+        self.compute = compute
+        # Created on first use so its asyncio.Lock belongs to the server's event loop
+        self.budget = None
+        self._inflight = {}
+        self._task = None
+        self._leader_lock = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        for handle in TRACKED_HANDLES:
+            await loop.run_in_executor(None, db.add_tracked_handle, handle)
+        if not REFRESH_ENABLED:
+            return
+        lock = InterProcessLock(db.DB_PATH + ".refresher")
+        if lock.acquire(blocking=False):
+            # Held for the life of the process; released by the OS if it dies
+            self._leader_lock = lock
+            self._task = asyncio.create_task(self._run())
+            print(f"Background refresher running (pid {os.getpid()})")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._leader_lock:
+            self._leader_lock.release()
+            self._leader_lock = None
+
+    async def _run(self):
+        while True:
+            try:
+                entries = await asyncio.get_running_loop().run_in_executor(None, db.list_tracked_handles)
+                for entry in entries:
+                    if self._is_due(entry):
+                        await self.refresh(entry["handle"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Warning: Background refresh loop error: {e}")
+            await asyncio.sleep(REFRESH_POLL_SECONDS)
+
+    @staticmethod
+    def _is_due(entry: Dict[str, Any]) -> bool:
+        now = time.time()
+        if entry["last_error"] and entry["last_attempt"] and now - entry["last_attempt"] < REFRESH_RETRY_SECONDS:
+            return False
+        return entry["computed_at"] is None or now - entry["computed_at"] >= REFRESH_INTERVAL
+
+    def refresh(self, handle: str) -> "asyncio.Future":
+        """Refresh a handle, sharing the run with any refresh already in flight"""
+        handle = db.handle_key(handle)
+        task = self._inflight.get(handle)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(handle))
+            self._inflight[handle] = task
+            task.add_done_callback(lambda _: self._inflight.pop(handle, None))
+        return task
+
+    async def _refresh(self, handle: str):
+        if self.budget is None:
+            self.budget = RateBudget(CF_BACKGROUND_RATE, burst=CF_CALLS_PER_REFRESH)
+        await self.budget.acquire(CF_CALLS_PER_REFRESH)
+        loop = asyncio.get_running_loop()
+        try:
+            deadline = Deadline(REFRESH_DEADLINE)
+            async with get_admission().slot("batch", deadline):
+                result = await loop.run_in_executor(None, call_within, deadline, self.compute, handle)
+            await loop.run_in_executor(None, db.save_precomputed_result, handle, result)
+            REFRESHES.inc(result="ok")
+        except Exception as e:
+            # Codeforces down or the handle failed: keep serving the last good result
+            detail = getattr(e, "detail", None) or str(e) or type(e).__name__
+            try:
+                await loop.run_in_executor(None, db.record_refresh_error, handle, str(detail))
+            except Exception as db_error:
+                print(f"Warning: Failed to record refresh error for {handle}: {db_error}")
+            REFRESHES.inc(result="error")
+            print(f"Warning: Refresh of {handle} failed: {detail}")
+
+    async def serve_cached(self, handle: str) -> Optional[Dict[str, Any]]:
+        """
+        Last good result for a tracked handle, marked with its age. Starts a
+        background refresh when it is stale. None if nothing is stored.
+        """
+        handle = db.handle_key(handle)
+        stored = await asyncio.get_running_loop().run_in_executor(None, db.get_precomputed_result, handle)
+        if stored is None:
+            return None
+
+        age = time.time() - stored["computed_at"]
+        stale = age >= REFRESH_INTERVAL
+        if stale and handle not in self._inflight and self._is_due({
+            "computed_at": stored["computed_at"],
+            "last_attempt": stored["last_attempt"],
+            "last_error": stored["last_error"],
+        }):
+            self.refresh(handle)
+        CACHE_REQUESTS.inc(cache="precomputed", result="stale" if stale else "fresh")
+
+        response = dict(stored["payload"])
+        response["freshness"] = {
+            "computed_at": stored["computed_at"],
+            "age_seconds": round(age, 1),
+            "stale": stale,
+            "refreshing": handle in self._inflight,
+            "last_refresh_error": stored["last_error"],
+        }
+        return response
+
+    def store_if_tracked(self, handle: str, result: Dict[str, Any]):
+        """Blocking (SQLite); call it from a worker thread"""
+        if db.is_tracked_handle(handle):
+            db.save_precomputed_result(handle, result)
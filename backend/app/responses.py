@@ -0,0 +1,149 @@
+# backend/app/responses.py
+"""
+Response encoding for the API.
+
+- FastJSONResponse serializes with orjson when it is installed and falls
+  back to the stdlib encoder otherwise.
+- finalize_responses (HTTP middleware) adds a content-hash ETag to every
+  buffered 200 response. It answers a matching If-None-Match with 304 and
+  compresses bodies of RESPONSE_COMPRESS_MIN_BYTES or more with brotli
+  (when installed) or gzip, following Accept-Encoding.
+- select_fields trims a result to the top-level keys a client asked for;
+  recommendation_response also tags it by content, ignoring the volatile
+  `freshness` block of precomputed results.
+"""
+import os
+import gzip
+import json
+import hashlib
+from typing import Dict, Any, List, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+# Optional: faster JSON encoding (graceful fallback to the json module if not installed)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Optional: brotli compression (gzip only if not installed)
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Bodies smaller than this are sent uncompressed (0 disables compression)
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+RESPONSE_ETAGS = os.getenv("RESPONSE_ETAGS", "true").lower() == "true"
+
+_COMPRESSIBLE = ("application/json", "text/")
+
+
+def dumps(content: Any) -> bytes:
+    """Compact JSON, with orjson (int dict keys, numpy values) when available"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(
+            content,
+            default=jsonable_encoder,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+        )
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered by dumps"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def select_fields(payload: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """Only the requested top-level keys (all of them when fields is empty)"""
+    if not fields:
+        return payload
+    wanted = {f.strip() for field in fields for f in field.split(",") if f.strip()}
+    return {key: value for key, value in payload.items() if key in wanted}
+
+
+def _etag(body: bytes) -> str:
+    # Weak: the gzip and brotli representations share the tag of the identity body
+    return f'W/"{hashlib.sha1(body).hexdigest()}"'
+
+
+def recommendation_response(payload: Dict[str, Any], fields: Optional[List[str]] = None) -> FastJSONResponse:
+    """The selected fields, with an ETag that stays put while only `freshness` changes"""
+    selected = select_fields(payload, fields)
+    response = FastJSONResponse(selected)
+    if RESPONSE_ETAGS and "freshness" in selected:
+        stable = {key: value for key, value in selected.items() if key != "freshness"}
+        response.headers["etag"] = _etag(response.render(stable))
+    return response
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires"""
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    return any((t.strip()[2:] if t.strip().startswith("W/") else t.strip()) == opaque for t in header.split(","))
+
+
+def _add_vary(headers: Dict[str, str], name: str):
+    """Append to Vary without dropping what is already there (CORS adds Origin)"""
+    current = [v.strip() for v in headers.get("vary", "").split(",") if v.strip()]
+    if name.lower() not in (v.lower() for v in current):
+        current.append(name)
+    headers["vary"] = ", ".join(current)
+
+
+async def finalize_responses(request: Request, call_next):
+    response = await call_next(request)
+    # Streaming responses (no Content-Length) and already encoded bodies pass through untouched
+    if (response.status_code != 200 or "content-length" not in response.headers
+            or "content-encoding" in response.headers or request.method == "HEAD"):
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+    content_type = headers.get("content-type", "")
+
+    if RESPONSE_ETAGS:
+        etag = headers.get("etag") or _etag(body)
+        headers["etag"] = etag
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, etag):
+            # Keep the 200's headers (CORS runs inside this middleware and set them there)
+            _add_vary(headers, "Accept-Encoding")
+            return Response(status_code=304, headers=headers)
+
+    if RESPONSE_COMPRESS_MIN_BYTES > 0 and content_type.startswith(_COMPRESSIBLE):
+        _add_vary(headers, "Accept-Encoding")
+        if len(body) >= RESPONSE_COMPRESS_MIN_BYTES:
+            accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+            if BROTLI_AVAILABLE and "br" in accepted:
+                body = brotli.compress(body, quality=BROTLI_QUALITY)
+                headers["content-encoding"] = "br"
+            elif "gzip" in accepted:
+                body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+                headers["content-encoding"] = "gzip"
+
+    return Response(content=body, status_code=response.status_code, headers=headers,
+                    background=response.background)
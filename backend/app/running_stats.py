@@ -0,0 +1,150 @@
+# backend/app/running_stats.py
+"""
+Constant-memory running statistics.
+Used to keep aggregate metrics up to date without rescanning history.
+"""
+from bisect import insort
+from typing import Dict, Any, Optional
+
+
+class P2Quantile:
+    """
+    Streaming quantile estimator (P-square algorithm, Jain & Chlamtac).
+    Keeps five markers, so every update is O(1) regardless of how many
+    values have been observed.
+    """
+
+    def __init__(self, p: float):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x: float):
+        q = self.heights
+
+        # The first five observations initialise the markers
+        if len(q) < 5:
+            insort(q, x)
+            return
+
+        n = self.positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while k < 3 and x >= q[k + 1]:
+                k += 1
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Adjust the three middle markers if they drifted from their desired positions
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if d > 0 else -1
+                candidate = self._parabolic(i, step)
+                if q[i - 1] < candidate < q[i + 1]:
+                    q[i] = candidate
+                else:
+                    q[i] = q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+                n[i] += step
+
+    def _parabolic(self, i: int, d: int) -> float:
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self) -> Optional[float]:
+        if not self.heights:
+            return None
+        if len(self.heights) < 5 or self.positions[4] == 5:
+            # Not enough data for the markers yet - use the exact quantile
+            idx = min(int(round(self.p * (len(self.heights) - 1))), len(self.heights) - 1)
+            return self.heights[idx]
+        return self.heights[2]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "p": self.p,
+            "heights": list(self.heights),
+            "positions": list(self.positions),
+            "desired": list(self.desired),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "P2Quantile":
+        est = cls(data["p"])
+        est.heights = list(data["heights"])
+        est.positions = list(data["positions"])
+        est.desired = list(data["desired"])
+        return est
+
+
+class RunningStat:
+    """
+    Count/sum/min/max plus streaming quantiles for a single metric.
+    """
+
+    QUANTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.quantiles = {p: P2Quantile(p) for p in self.QUANTILES}
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        for est in self.quantiles.values():
+            est.add(value)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        result = {
+            "count": self.count,
+            "mean": self.mean,
+            "min": self.min,
+            "max": self.max,
+        }
+        for p, est in self.quantiles.items():
+            result[f"p{int(p * 100)}"] = est.value()
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+            "quantiles": [est.to_dict() for est in self.quantiles.values()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RunningStat":
+        stat = cls()
+        stat.count = data["count"]
+        stat.total = data["total"]
+        stat.min = data["min"]
+        stat.max = data["max"]
+        for q in data.get("quantiles", []):
+            est = P2Quantile.from_dict(q)
+            stat.quantiles[est.p] = est
+        return stat
@@ -0,0 +1,206 @@
+# backend/app/skill_model.py
+"""
+Per-tag skill ratings (Elo/IRT style) estimated from a handle's submissions.
+
+Each rated attempt is a Bernoulli trial whose success probability follows
+the Codeforces rating curve:
+
+    P(solve) = 1 / (1 + 10 ** ((problem_rating - skill) / 400))
+
+A full fit maximises the recency-weighted likelihood. Older submissions
+count less (SKILL_HALF_LIFE_DAYS), and each tag is shrunk towards the
+handle's overall skill, so tags with a few attempts stay close to it. The
+fit runs vectorized Newton steps over every tag at once. New submissions
+are folded into the stored state with a one-step update per attempt, and
+the model is refit from scratch every SKILL_REFIT_DAYS.
+
+The output gives a deterministic target rating per tag (the rating solved
+with probability SKILL_TARGET_SOLVE_PROB), which the planner uses directly.
+
+Histories come in as SubmissionArray (see submission_array); attempts are
+selected and ordered with numpy over its typed arrays.
+"""
+import os
+import math
+import time
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+from . import db
+from .submission_array import PROBLEMS, VERDICTS, SubmissionArray
+
+SKILL_HALF_LIFE_DAYS = float(os.getenv("SKILL_HALF_LIFE_DAYS", "120"))
+SKILL_REFIT_DAYS = float(os.getenv("SKILL_REFIT_DAYS", "7"))
+# Practise where the handle solves roughly this share of problems
+SKILL_TARGET_SOLVE_PROB = float(os.getenv("SKILL_TARGET_SOLVE_PROB", "0.4"))
+# Tag skill this far above/below the overall skill counts as strong/weak
+SKILL_STRENGTH_MARGIN = float(os.getenv("SKILL_STRENGTH_MARGIN", "75"))
+
+OVERALL_PRIOR_SD = 350.0
+TAG_PRIOR_SD = 200.0
+NEWTON_STEPS = 8
+MIN_RATING, MAX_RATING = 800, 3500
+_C = math.log(10) / 400
+
+# Verdicts that say nothing about skill
+_IGNORED_VERDICTS = {"COMPILATION_ERROR", "SKIPPED", "TESTING", "REJECTED", "CHALLENGED", None, ""}
+
+
+def _attempts(subs: SubmissionArray) -> Dict[str, np.ndarray]:
+    """Rated, judged submissions in chronological order, as parallel numpy arrays"""
+    problem_ratings = PROBLEMS.ratings
+    ids = np.array(subs.ids, dtype=np.int64)
+    times = np.array(subs.times, dtype=np.int64)
+    verdicts = np.array(subs.verdicts, dtype=np.int64)
+    ratings = np.array([problem_ratings[p] for p in subs.problems], dtype=float)
+    ignored = [VERDICTS.ids[v] for v in _IGNORED_VERDICTS if v in VERDICTS.ids]
+    keep = (ratings > 0) & ~np.isin(verdicts, ignored)
+    order = np.lexsort((ids, times))
+    order = order[keep[order]]
+    return {
+        "positions": order,
+        "ids": ids[order],
+        "times": times[order],
+        "ratings": ratings[order],
+        "outcomes": (verdicts[order] == VERDICTS.ids.get("OK", -1)).astype(float),
+    }
+
+
+def _newton(index, ratings, outcomes, weights, prior_mean, prior_precision, size):
+    """
+    MAP estimate for `size` skills at once. `index` maps each observation to
+    its skill; returns (skills, precisions).
+    """
+    skill = np.array(prior_mean, dtype=float)
+    for _ in range(NEWTON_STEPS):
+        p = 1 / (1 + np.exp(-_C * (skill[index] - ratings)))
+        grad = np.bincount(index, weights=weights * _C * (outcomes - p), minlength=size)
+        hess = np.bincount(index, weights=weights * _C * _C * p * (1 - p), minlength=size)
+        grad -= prior_precision * (skill - prior_mean)
+        skill += grad / (hess + prior_precision)
+    p = 1 / (1 + np.exp(-_C * (skill[index] - ratings)))
+    hess = np.bincount(index, weights=weights * _C * _C * p * (1 - p), minlength=size)
+    return skill, hess + prior_precision
+
+
+def fit(subs: SubmissionArray, now: float = None) -> Optional[Dict[str, Any]]:
+    """Full batch fit over a submission history; None if nothing is rated"""
+    attempts = _attempts(subs)
+    count = len(attempts["positions"])
+    if not count:
+        return None
+    now = now or time.time()
+    ratings = attempts["ratings"]
+    outcomes = attempts["outcomes"]
+    times = np.where(attempts["times"] > 0, attempts["times"], now)
+    weights = 0.5 ** (np.maximum((now - times) / 86400, 0) / SKILL_HALF_LIFE_DAYS)
+
+    overall, overall_precision = _newton(
+        np.zeros(count, dtype=int), ratings, outcomes, weights,
+        np.array([ratings.mean()]), 1 / OVERALL_PRIOR_SD ** 2, 1
+    )
+
+    attempt_tags = [subs.tags(i) for i in attempts["positions"].tolist()]
+    tags = sorted({tag for names in attempt_tags for tag in names})
+    tag_index = {tag: i for i, tag in enumerate(tags)}
+    rows, cols = [], []
+    for row, names in enumerate(attempt_tags):
+        for tag in names:
+            rows.append(row)
+            cols.append(tag_index[tag])
+    state = {
+        "overall": {"skill": float(overall[0]), "precision": float(overall_precision[0]), "attempts": count},
+        "tags": {},
+        "last_time": int(attempts["times"][-1]),
+        "last_id": int(attempts["ids"].max()),
+        "fitted_at": now,
+    }
+    if rows:
+        rows = np.array(rows)
+        cols = np.array(cols)
+        skills, precisions = _newton(
+            cols, ratings[rows], outcomes[rows], weights[rows],
+            np.full(len(tags), overall[0]), 1 / TAG_PRIOR_SD ** 2, len(tags)
+        )
+        counts = np.bincount(cols, minlength=len(tags))
+        for tag, i in tag_index.items():
+            state["tags"][tag] = {"skill": float(skills[i]), "precision": float(precisions[i]),
+                                  "attempts": int(counts[i])}
+    return state
+
+
+def _step(entry: Dict[str, Any], rating: float, outcome: float, prior_precision: float, decay: float):
+    """One Newton/Elo step for a single observation, after decaying old evidence"""
+    entry["precision"] = prior_precision + (entry["precision"] - prior_precision) * decay
+    p = 1 / (1 + math.exp(-_C * (entry["skill"] - rating)))
+    entry["precision"] += _C * _C * p * (1 - p)
+    entry["skill"] += _C * (outcome - p) / entry["precision"]
+    entry["attempts"] = entry.get("attempts", 0) + 1
+
+
+def update(state: Dict[str, Any], subs: SubmissionArray) -> Dict[str, Any]:
+    """Fold submissions newer than the state into it, one attempt at a time"""
+    attempts = _attempts(subs)
+    for pos, sub_id, t, rating, outcome in zip(attempts["positions"].tolist(), attempts["ids"].tolist(),
+                                               attempts["times"].tolist(), attempts["ratings"].tolist(),
+                                               attempts["outcomes"].tolist()):
+        if sub_id <= state["last_id"]:
+            continue
+        t = t or state["last_time"]
+        decay = 0.5 ** (max(0, t - state["last_time"]) / 86400 / SKILL_HALF_LIFE_DAYS)
+        _step(state["overall"], rating, outcome, 1 / OVERALL_PRIOR_SD ** 2, decay)
+        for tag in subs.tags(pos):
+            entry = state["tags"].get(tag)
+            if entry is None:
+                entry = state["tags"][tag] = {"skill": state["overall"]["skill"],
+                                              "precision": 1 / TAG_PRIOR_SD ** 2, "attempts": 0}
+            _step(entry, rating, outcome, 1 / TAG_PRIOR_SD ** 2, decay)
+        state["last_time"] = max(state["last_time"], t)
+        state["last_id"] = sub_id or state["last_id"]
+    return state
+
+
+def target_rating(skill: float) -> int:
+    """Problem rating solved with probability SKILL_TARGET_SOLVE_PROB, rounded like Codeforces ratings"""
+    p = SKILL_TARGET_SOLVE_PROB
+    rating = skill + math.log((1 - p) / p) / _C
+    return int(min(MAX_RATING, max(MIN_RATING, round(rating / 100) * 100)))
+
+
+def estimate_skills(handle: str, subs: SubmissionArray) -> Optional[Dict[str, Any]]:
+    """
+    Skill state for a handle: the stored state updated with new submissions,
+    or a full refit when there is no usable state.
+    """
+    state = db.get_skill_state(handle) if db.STORAGE_BACKEND == "sqlite" else None
+    oldest = min(subs.ids, default=0)
+    # Refit when the state is old (recency weights drift) or does not overlap this history
+    if (state is None or time.time() - state["fitted_at"] > SKILL_REFIT_DAYS * 86400
+            or state["last_id"] < oldest):
+        state = fit(subs)
+    else:
+        state = update(state, subs)
+    if state is not None and db.STORAGE_BACKEND == "sqlite":
+        db.save_skill_state(handle, state)
+    return state
+
+
+def describe(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-tag skills, uncertainties, strengths and target ratings for the API and planner"""
+    overall = state["overall"]["skill"]
+    tags = {}
+    for tag, entry in state["tags"].items():
+        diff = entry["skill"] - overall
+        tags[tag] = {
+            "skill": round(entry["skill"]),
+            "uncertainty": round(1 / math.sqrt(entry["precision"])),
+            "attempts": entry["attempts"],
+            "strength": "strong" if diff > SKILL_STRENGTH_MARGIN else "weak" if diff < -SKILL_STRENGTH_MARGIN else "medium",
+            "target_rating": target_rating(entry["skill"]),
+        }
+    return {
+        "overall_skill": round(overall),
+        "overall_target_rating": target_rating(overall),
+        "tags": tags,
+    }
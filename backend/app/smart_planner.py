@@ -4,29 +4,40 @@ Smart planner that uses topic statistics instead of analyzing every submission.
 More efficient and avoids rate limits.
 """
 import os
-import requests
-import json
 import time
+import hashlib
 
-GEMINI_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+from . import deadline
+from .db import cache_cf_response, get_cached_cf_response
+from .deadline import DeadlineExceeded
+from .json_stream import ArrayItemStream
+from .llm_router import LLMRateLimited, LLMUnavailable, get_router
+from .prompts import compile_prompt, record_reply
+from .telemetry import CACHE_REQUESTS, FALLBACKS, STAGE_SECONDS, UPSTREAM_RETRIES
 
-def generate_recommendations_from_stats(topic_stats, rating_dist, user_info, handle):
-    """
-    Generate recommendations based on topic statistics without analyzing every submission.
-    This is much more efficient!
-    """
+# false: build recommendations from per-tag target ratings without calling the LLM
+LLM_RECOMMENDATIONS = os.getenv("LLM_RECOMMENDATIONS", "true").lower() == "true"
+# Seconds an LLM plan is reused while the handle's skill picture (and so the prompt) is unchanged
+PLAN_CACHE_TTL = int(os.getenv("PLAN_CACHE_TTL", "86400"))
+
+def _weakness_key(item):
+    """Lowest skill first; topics without a skill rating by success rate, after rated ones"""
+    stats = item[1]
+    return (0, stats["skill"]) if "skill" in stats else (1, stats["success_rate"])
+
+def _build_prompt(topic_stats, rating_dist, user_info, handle):
+    """Compiled planner prompt plus the weak topics and average rating the fallbacks use"""
     
     # Sort topics by weakness (low success rate)
     weak_topics = sorted(
         [(tag, stats) for tag, stats in topic_stats.items() if stats["strength"] == "weak"],
-        key=lambda x: x[1]["success_rate"]
+        key=_weakness_key
     )[:5]  # Top 5 weakest topics
     
     # Sort by medium topics (room for improvement)
     medium_topics = sorted(
         [(tag, stats) for tag, stats in topic_stats.items() if stats["strength"] == "medium"],
-        key=lambda x: x[1]["success_rate"]
+        key=_weakness_key
     )[:3]
     
     # Calculate average rating
@@ -36,125 +47,162 @@ def generate_recommendations_from_stats(topic_stats, rating_dist, user_info, han
         counts = list(rating_dist.values())
         avg_rating = sum(ratings) // sum(counts) if counts else 0
     
-    # Build prompt for recommendations
-    prompt = f"""Based on Codeforces statistics for user {handle}:
-
-Topic Performance:
-"""
-    
+    # Topic lines go weakest first, so trimming to the token budget drops the strongest
+    topic_lines = []
     for tag, stats in (weak_topics + medium_topics)[:8]:
-        prompt += f"- {tag}: {stats['solved']} solved, {stats['failed']} failed, success rate {stats['success_rate']*100:.0f}% ({stats['strength']})\n"
+        line = f"- {tag}: {stats['solved']} solved, {stats['failed']} failed, success rate {stats['success_rate']*100:.0f}% ({stats['strength']})"
+        if "target_rating" in stats:
+            line += f", skill {stats['skill']}, recommend rating {stats['target_rating']}"
+        topic_lines.append(line)
     
     # Get user rating for context
     user_rating = user_info.get("rating", 0) if user_info else 0
     user_rank = user_info.get("rank", "unrated") if user_info else "unrated"
     
-    prompt += f"""
-User Rating: {user_rating} ({user_rank})
-Average Problem Rating Solved: {avg_rating}
-Total Solved: {len(topic_stats)}
-
-Generate exactly 5 personalized problem recommendations as JSON with this structure:
-{{
-  "recommendations": [
-    {{
-      "title": "Problem name",
-      "link": "https://codeforces.com/problemset/problem/XXXX/X or https://codeforces.com/problemset?tags=tag_name",
-      "difficulty": "easy/medium/hard",
-      "rating": 1200-2000 (actual problem rating number),
-      "reason": "Why this helps (1-2 sentences)",
-      "topic": "relevant topic"
-    }}
-  ]
-}}
+    prompt = compile_prompt(
+        "recommendations",
+        HANDLE=handle,
+        TOPICS=topic_lines,
+        USER_RATING=user_rating,
+        USER_RANK=user_rank,
+        AVG_RATING=avg_rating,
+        TOTAL_SOLVED=len(topic_stats),
+    )
+    return prompt, weak_topics, avg_rating
 
-Include the actual problem rating (e.g., 1400, 1600) in the rating field.
+def generate_recommendations_from_stats(topic_stats, rating_dist, user_info, handle):
+    """
+    Generate recommendations based on topic statistics without analyzing every submission.
+    This is much more efficient! Blocking: collects stream_recommendations.
+    """
+    stream = stream_recommendations(topic_stats, rating_dist, user_info, handle)
+    recommendations = []
+    while True:
+        try:
+            recommendations.append(next(stream))
+        except StopIteration as done:
+            complete = done.value
+            break
+    result = {"recommendations": recommendations}
+    if not complete:
+        result["partial"] = True
+    return result
 
-Focus on:
-1. Weak topics that need practice
-2. Problems around {avg_rating} rating (slightly above for growth)
-3. Balanced mix of topics
-Return ONLY valid JSON, no other text.
-"""
+def stream_recommendations(topic_stats, rating_dist, user_info, handle):
+    """
+    Yield recommendations one at a time, each as soon as the streamed reply
+    closes it. Returns False when the reply was cut off after some
+    recommendations had already been yielded (those are kept, nothing is cached).
+    """
+    prompt, weak_topics, avg_rating = _build_prompt(topic_stats, rating_dist, user_info, handle)
     
-    # Call Gemini API with retry logic
+    if not LLM_RECOMMENDATIONS:
+        yield from generate_fallback_recommendations(weak_topics, avg_rating)["recommendations"]
+        return True
+    
+    # The prompt only changes when the handle's statistics do, so an identical prompt gets the same plan
+    plan_key = f"plan:{hashlib.sha1(prompt.text.encode('utf-8')).hexdigest()}"
+    if PLAN_CACHE_TTL > 0:
+        cached = get_cached_cf_response(handle, plan_key, PLAN_CACHE_TTL)
+        CACHE_REQUESTS.inc(cache="plan", result="miss" if cached is None else "hit")
+        if cached is not None:
+            yield from cached["recommendations"]
+            return True
+    
+    # Call the LLM router (hedged across providers) with retry logic
     max_retries = 3
+    start = time.perf_counter()
     for attempt in range(max_retries):
+        parser = ArrayItemStream()
+        items = []
         try:
-            payload = {
-                "contents": [{"parts": [{"text": prompt}]}],
-                "generationConfig": {
-                    "temperature": 0.7,
-                    "maxOutputTokens": 800
-                }
-            }
-            
-            params = {"key": GEMINI_KEY}
-            headers = {"Content-Type": "application/json"}
-            
-            r = requests.post(GEMINI_URL, params=params, json=payload, headers=headers, timeout=30)
-            
-            if r.status_code == 429:
+            for item in _stream_llm(prompt, parser):
+                if not items:
+                    STAGE_SECONDS.observe(time.perf_counter() - start, stage="first_recommendation")
+                items.append(item)
+                yield item
+        except LLMUnavailable:
+            # No provider configured, or every provider's circuit breaker is open
+            FALLBACKS.inc(component="smart_planner", reason="no_provider")
+            yield from generate_fallback_recommendations(weak_topics, avg_rating)["recommendations"]
+            return True
+        except DeadlineExceeded as e:
+            # Out of request time: keep what arrived, otherwise answer without the LLM
+            print(f"Warning: Recommendations cut short by the request deadline: {e}")
+            FALLBACKS.inc(component="smart_planner", reason="deadline")
+            if items:
+                return False
+            yield from generate_fallback_recommendations(weak_topics, avg_rating)["recommendations"]
+            return True
+        except LLMRateLimited:
+            if attempt < max_retries - 1:
                 # Rate limited - wait and retry
                 wait_time = (2 ** attempt) * 2  # Exponential backoff: 2s, 4s, 8s
                 print(f"Rate limited, waiting {wait_time}s before retry {attempt + 1}/{max_retries}...")
-                time.sleep(wait_time)
+                UPSTREAM_RETRIES.inc(service="llm")
+                try:
+                    deadline.sleep(wait_time, "llm backoff")
+                except DeadlineExceeded:
+                    FALLBACKS.inc(component="smart_planner", reason="deadline")
+                    yield from generate_fallback_recommendations(weak_topics, avg_rating)["recommendations"]
+                    return True
                 continue
-            
-            r.raise_for_status()
-            resp = r.json()
-            
-            output = resp["candidates"][0]["content"]["parts"][0]["text"]
-            
-            # Extract JSON from response
-            try:
-                # Try to find JSON in the response
-                json_start = output.find("{")
-                json_end = output.rfind("}") + 1
-                if json_start != -1 and json_end > json_start:
-                    json_str = output[json_start:json_end]
-                    result = json.loads(json_str)
-                    
-                    # Ensure it has the right structure
-                    if "recommendations" not in result:
-                        result = {"recommendations": result if isinstance(result, list) else []}
-                    
-                    return result
-            except json.JSONDecodeError:
-                pass
-            
-            # Fallback: return structured response
-            return {
-                "recommendations": [
-                    {
-                        "title": f"Practice {topic}",
-                        "link": f"https://codeforces.com/problemset?tags={topic.lower().replace(' ', '+')}",
-                        "difficulty": "medium",
-                        "reason": f"Your {topic} success rate is {stats['success_rate']*100:.0f}%, practice needed",
-                        "topic": topic
-                    }
-                    for topic, stats in weak_topics[:5]
-                ]
-            }
-            
-        except requests.exceptions.HTTPError as e:
-            if e.response and e.response.status_code == 429:
-                if attempt < max_retries - 1:
-                    wait_time = (2 ** attempt) * 2
-                    print(f"Rate limited, waiting {wait_time}s...")
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    # Final attempt failed - return fallback recommendations
-                    return generate_fallback_recommendations(weak_topics, avg_rating)
-            raise
+            # Final attempt failed - return fallback recommendations
+            FALLBACKS.inc(component="smart_planner", reason="rate_limited")
+            yield from generate_fallback_recommendations(weak_topics, avg_rating)["recommendations"]
+            return True
         except Exception as e:
+            if items:
+                # Cut off mid-stream: what already arrived is complete, keep it
+                print(f"Warning: Recommendation stream ended early after {len(items)} items: {e}")
+                FALLBACKS.inc(component="smart_planner", reason="truncated")
+                return False
             print(f"Error generating recommendations: {e}")
             if attempt == max_retries - 1:
-                return generate_fallback_recommendations(weak_topics, avg_rating)
+                FALLBACKS.inc(component="smart_planner", reason="error")
+                yield from generate_fallback_recommendations(weak_topics, avg_rating)["recommendations"]
+                return True
+            UPSTREAM_RETRIES.inc(service="llm")
+            continue
+        
+        if items and parser.complete:
+            if PLAN_CACHE_TTL > 0:
+                cache_cf_response(handle, plan_key, {"recommendations": items})
+            return True
+        if items:
+            # e.g. maxOutputTokens reached inside the list
+            print(f"Warning: Recommendation reply truncated after {len(items)} items")
+            FALLBACKS.inc(component="smart_planner", reason="truncated")
+            return False
+        
+        # Fallback: return structured response
+        FALLBACKS.inc(component="smart_planner", reason="unparseable")
+        for topic, stats in weak_topics[:5]:
+            yield {
+                "title": f"Practice {topic}",
+                "link": f"https://codeforces.com/problemset?tags={topic.lower().replace(' ', '+')}",
+                "difficulty": "medium",
+                "reason": f"Your {topic} success rate is {stats['success_rate']*100:.0f}%, practice needed",
+                "topic": topic
+            }
+        return True
     
     # If all retries failed
-    return generate_fallback_recommendations(weak_topics, avg_rating)
+    FALLBACKS.inc(component="smart_planner", reason="retries_exhausted")
+    yield from generate_fallback_recommendations(weak_topics, avg_rating)["recommendations"]
+    return True
+
+def _stream_llm(prompt, parser):
+    """Stream the compiled prompt through the LLM router and yield each recommendation the parser completes"""
+    reply = []
+    try:
+        for text in get_router().stream(prompt.text, max_tokens=800, temperature=0.7, timeout=30,
+                                        schema=prompt.schema, schema_name=prompt.name):
+            reply.append(text)
+            yield from parser.feed(text)
+    finally:
+        if reply:
+            record_reply(prompt, "".join(reply))
 
 def generate_fallback_recommendations(weak_topics, avg_rating):
     """Generate recommendations without API when rate limited"""
@@ -174,12 +222,19 @@ def generate_fallback_recommendations(weak_topics, avg_rating):
     target_rating = get_rating_range(avg_rating)
     
     for topic, stats in weak_topics[:5]:
+        # Per-topic target from the skill model when the topic has rated attempts
+        rating = stats.get("target_rating", target_rating)
+        tag_filter = topic.lower().replace(' ', '+')
+        if "target_rating" in stats:
+            tag_filter += f",{rating - 100}-{rating + 100}"
         recommendations.append({
             "title": f"Practice {topic}",
-            "link": f"https://codeforces.com/problemset?tags={topic.lower().replace(' ', '+')}",
+            "link": f"https://codeforces.com/problemset?tags={tag_filter}",
             "difficulty": "medium",
-            "rating": target_rating,
-            "reason": f"Your {topic} success rate is {stats['success_rate']*100:.0f}%. Focus on this topic to improve.",
+            "rating": rating,
+            "reason": (f"Your {topic} skill (~{stats['skill']}) trails your other topics; problems around {rating} are the right stretch."
+                       if "skill" in stats else
+                       f"Your {topic} success rate is {stats['success_rate']*100:.0f}%. Focus on this topic to improve."),
             "topic": topic
         })
     
@@ -0,0 +1,167 @@
+# backend/app/stats_index.py
+"""
+Time-windowed topic statistics over a handle's submissions.
+
+TopicIndex sorts the submissions by time once, then keeps cumulative
+counters for each tag (solved / failed / attempted), verdict and problem
+rating. Any window [since, until] takes two binary searches per key
+followed by subtractions, so "weak topics in the last 30 days" does not
+have to loop over the history again.
+
+Indexes work on SubmissionArray histories (see submission_array) and keep
+their counters in typed arrays. They are cached per handle and rebuilt
+only when the handle's submissions (or their verdicts) change.
+"""
+import re
+import hashlib
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+
+from .submission_array import PROBLEMS, VERDICTS, SubmissionArray, tags_of
+
+INDEX_CACHE_SIZE = 256
+FAILED_VERDICTS = ("WRONG_ANSWER", "TIME_LIMIT_EXCEEDED", "RUNTIME_ERROR", "COMPILATION_ERROR")
+
+_WINDOW = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*$")
+_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+def parse_window(window: str) -> float:
+    """'30d', '12h', '2w' or plain seconds -> seconds"""
+    match = _WINDOW.match(str(window).lower())
+    if not match:
+        raise ValueError(f"Invalid window {window!r}; use e.g. 30d, 12h, 2w or seconds")
+    return float(match.group(1)) * _UNITS[match.group(2)]
+
+
+class _Series:
+    """Event times with cumulative counters: count of any counter in a window is two bisects"""
+
+    __slots__ = ("times", "cumulative")
+
+    def __init__(self, events: List[Tuple[int, Tuple[int, ...]]], width: int):
+        self.times = array("q", (t for t, _ in events))
+        # One prefix-sum array per counter, each starting at 0
+        self.cumulative = [array("i", [0]) for _ in range(width)]
+        for _, increments in events:
+            for column, step in zip(self.cumulative, increments):
+                column.append(column[-1] + step)
+
+    def count(self, since: Optional[float], until: Optional[float]) -> Tuple[int, ...]:
+        lo = 0 if since is None else bisect_left(self.times, since)
+        hi = len(self.times) if until is None else bisect_right(self.times, until)
+        if hi <= lo:
+            return tuple(0 for _ in self.cumulative)
+        return tuple(column[hi] - column[lo] for column in self.cumulative)
+
+
+class TopicIndex:
+    """Prefix-count index over one handle's submissions"""
+
+    def __init__(self, subs: SubmissionArray):
+        ordered = subs.sorted_by_time()
+        self.subs = ordered
+        self.times = ordered.times
+
+        tag_events = defaultdict(list)
+        verdict_events = defaultdict(list)
+        rating_events = defaultdict(list)
+        first_solved = {}
+        ok = VERDICTS.id("OK")
+        failed = {VERDICTS.id(v) for v in FAILED_VERDICTS}
+        for t, pid, vid in zip(ordered.times, ordered.problems, ordered.verdicts):
+            verdict_events[vid].append((t, (1,)))
+            rating = PROBLEMS.ratings[pid]
+            if rating:
+                rating_events[rating].append((t, (1,)))
+            tags = tags_of(PROBLEMS.tag_masks[pid])
+            if not tags:
+                continue
+            if vid == ok:
+                first_solved.setdefault(pid, t)
+                increments = (1, 0, 0)
+            else:
+                increments = (0, 1 if vid in failed else 0, 1)
+            for tag in tags:
+                tag_events[tag].append((t, increments))
+
+        # (solved, failed, attempted) per tag
+        self.tags = {tag: _Series(events, 3) for tag, events in tag_events.items()}
+        self.verdicts = {VERDICTS.names[v]: _Series(events, 1) for v, events in verdict_events.items()}
+        self.ratings = {r: _Series(events, 1) for r, events in rating_events.items()}
+        self.first_solves = array("q", sorted(first_solved.values()))
+
+    def window_subs(self, since: Optional[float] = None, until: Optional[float] = None) -> SubmissionArray:
+        lo = 0 if since is None else bisect_left(self.times, since)
+        hi = len(self.times) if until is None else bisect_right(self.times, until)
+        return self.subs.slice(lo, hi)
+
+    def statistics(self, since: Optional[float] = None, until: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Same shape as the full-history statistics. In a window, total_solved
+        counts problems first solved inside it.
+        """
+        topic_analysis = {}
+        for tag, series in self.tags.items():
+            solved, failed, _ = series.count(since, until)
+            total = solved + failed
+            if total > 0:
+                success_rate = solved / total
+                topic_analysis[tag] = {
+                    "solved": solved,
+                    "failed": failed,
+                    "total_attempts": total,
+                    "success_rate": round(success_rate, 2),
+                    "strength": "strong" if success_rate > 0.7 else "medium" if success_rate > 0.4 else "weak"
+                }
+
+        verdicts = {v: series.count(since, until)[0] for v, series in self.verdicts.items()}
+        ratings = {r: series.count(since, until)[0] for r, series in self.ratings.items()}
+        lo = 0 if since is None else bisect_left(self.first_solves, since)
+        hi = len(self.first_solves) if until is None else bisect_right(self.first_solves, until)
+        lo_all = 0 if since is None else bisect_left(self.times, since)
+        hi_all = len(self.times) if until is None else bisect_right(self.times, until)
+        return {
+            "topic_stats": topic_analysis,
+            "rating_distribution": {r: c for r, c in ratings.items() if c},
+            "verdict_distribution": {v: c for v, c in verdicts.items() if c},
+            "total_solved": max(0, hi - lo),
+            "total_attempted": max(0, hi_all - lo_all),
+        }
+
+
+_cache: "OrderedDict[str, Tuple[bytes, TopicIndex]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _fingerprint(subs: SubmissionArray) -> bytes:
+    """
+    Digest of the history's columns. Ids alone miss re-judged verdicts
+    (TESTING -> OK), so verdicts and problems are hashed as well, plus the
+    problem table version for problems that gained a rating or tags.
+    """
+    digest = hashlib.blake2b(PROBLEMS.version.to_bytes(8, "little"), digest_size=16)
+    for column in (subs.ids, subs.times, subs.problems, subs.verdicts):
+        digest.update(column.tobytes())
+    return digest.digest()
+
+
+def get_index(handle: str, subs: SubmissionArray) -> TopicIndex:
+    """Cached index for a handle, rebuilt when its submissions change"""
+    fingerprint = _fingerprint(subs)
+    key = handle.lower()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == fingerprint:
+            _cache.move_to_end(key)
+            return entry[1]
+    index = TopicIndex(subs)
+    with _cache_lock:
+        _cache[key] = (fingerprint, index)
+        _cache.move_to_end(key)
+        while len(_cache) > INDEX_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
@@ -0,0 +1,216 @@
+# backend/app/submission_array.py
+"""
+Compact in-memory submission histories.
+
+A list of dicts costs several hundred bytes per submission (a dict, its
+keys, a tag list and boxed ints). SubmissionArray keeps parallel typed
+arrays instead:
+
+    ids, times      array('q')   8 bytes each
+    problems        array('I')   4 bytes, index into the shared ProblemTable
+    verdicts        array('B')   1 byte, interned verdict id
+
+Problems are interned once per process in PROBLEMS and shared by every
+handle. The table holds contest id, index, rating, name and a tag bitset
+(interned tag ids) per problem. Per-submission cost is 21 bytes plus
+array slack.
+"""
+import threading
+from array import array
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+
+class _Interner:
+    """Bidirectional string <-> small int table"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+        self._lock = threading.Lock()
+
+    def id(self, name: str) -> int:
+        value = self.ids.get(name)
+        if value is None:
+            with self._lock:
+                value = self.ids.get(name)
+                if value is None:
+                    if len(self.names) >= self.limit:
+                        raise ValueError(f"More than {self.limit} distinct values")
+                    self.names.append(name)
+                    value = self.ids[name] = len(self.names) - 1
+        return value
+
+
+TAGS = _Interner(64)         # bit positions in a problem's tag mask
+VERDICTS = _Interner(256)
+_INDEXES = _Interner(1 << 16)
+_tag_lists: Dict[int, Tuple[str, ...]] = {}
+
+
+_dropped_tags = set()
+
+
+def tag_mask(tags: Iterable[str]) -> int:
+    mask = 0
+    for tag in tags:
+        try:
+            mask |= 1 << TAGS.id(tag)
+        except ValueError:
+            # Past 64 distinct tags the extra ones are left out of the stats rather than failing the request
+            if tag not in _dropped_tags:
+                _dropped_tags.add(tag)
+                print(f"Warning: Tag table full ({TAGS.limit} tags), ignoring tag {tag!r}")
+    return mask
+
+
+def tags_of(mask: int) -> Tuple[str, ...]:
+    """Tag names for a mask (cached: histories reuse a small set of masks)"""
+    tags = _tag_lists.get(mask)
+    if tags is None:
+        tags = _tag_lists[mask] = tuple(name for bit, name in enumerate(TAGS.names) if mask >> bit & 1)
+    return tags
+
+
+class ProblemTable:
+    """Problems seen by this process, stored once and shared by all handles"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids: Dict[Tuple, int] = {}
+        # Bumped whenever a stored problem gains its rating or tags
+        self.version = 0
+        self.contest_ids = array("i")
+        self.indexes = array("H")
+        self.ratings = array("H")
+        self.tag_masks = array("Q")
+        self.names: List[Optional[str]] = []
+
+    def intern(self, contest_id, index, name, rating, tags) -> int:
+        key = (contest_id, index) if contest_id else (None, name)
+        pid = self._ids.get(key)
+        if pid is not None and (not rating or self.ratings[pid]) and (not tags or self.tag_masks[pid]):
+            return pid
+        with self._lock:
+            pid = self._ids.get(key)
+            if pid is not None:
+                # Problems of a fresh contest are first seen unrated and often untagged
+                self._update(pid, rating, tags)
+            else:
+                self.contest_ids.append(contest_id or 0)
+                self.indexes.append(_INDEXES.id(index or ""))
+                self.ratings.append(rating or 0)
+                self.tag_masks.append(tag_mask(tags or ()))
+                self.names.append(name)
+                pid = self._ids[key] = len(self.names) - 1
+        return pid
+
+    def _update(self, pid: int, rating, tags):
+        """Take a later row's non-empty rating and tags"""
+        changed = False
+        if rating and rating != self.ratings[pid]:
+            self.ratings[pid] = rating
+            changed = True
+        if tags:
+            mask = tag_mask(tags)
+            if mask and mask != self.tag_masks[pid]:
+                self.tag_masks[pid] = mask
+                changed = True
+        if changed:
+            self.version += 1
+
+    def index(self, pid: int) -> str:
+        return _INDEXES.names[self.indexes[pid]]
+
+    def __len__(self):
+        return len(self.names)
+
+
+PROBLEMS = ProblemTable()
+
+
+class SubmissionArray:
+    """One handle's submissions as parallel typed arrays"""
+
+    __slots__ = ("ids", "times", "problems", "verdicts")
+
+    def __init__(self):
+        self.ids = array("q")
+        self.times = array("q")
+        self.problems = array("I")
+        self.verdicts = array("B")
+
+    def append(self, sub_id, created, contest_id, index, name, rating, tags, verdict):
+        self.ids.append(sub_id or 0)
+        self.times.append(created or 0)
+        self.problems.append(PROBLEMS.intern(contest_id, index, name, rating, tags))
+        self.verdicts.append(VERDICTS.id(verdict or ""))
+
+    @classmethod
+    def from_dicts(cls, subs: Iterable[Dict[str, Any]]) -> "SubmissionArray":
+        """From cf_client.normalize_submission dicts"""
+        arr = cls()
+        for s in subs:
+            arr.append(s.get("id"), s.get("creationTimeSeconds"), s.get("contestId"), s.get("index"),
+                       s.get("name"), s.get("rating"), s.get("tags") or (), s.get("verdict"))
+        return arr
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rating(self, i: int) -> Optional[int]:
+        return PROBLEMS.ratings[self.problems[i]] or None
+
+    def tags(self, i: int) -> Tuple[str, ...]:
+        return tags_of(PROBLEMS.tag_masks[self.problems[i]])
+
+    def verdict(self, i: int) -> str:
+        return VERDICTS.names[self.verdicts[i]]
+
+    def problem_id(self, i: int) -> str:
+        """Codeforces-style id, e.g. 1850A"""
+        pid = self.problems[i]
+        contest_id = PROBLEMS.contest_ids[pid]
+        return f"{contest_id if contest_id else None}{PROBLEMS.index(pid) or None}"
+
+    def sorted_by_time(self) -> "SubmissionArray":
+        order = sorted(range(len(self)), key=lambda i: (self.times[i], self.ids[i]))
+        return self.take(order)
+
+    def take(self, positions: Iterable[int]) -> "SubmissionArray":
+        out = SubmissionArray()
+        for i in positions:
+            out.ids.append(self.ids[i])
+            out.times.append(self.times[i])
+            out.problems.append(self.problems[i])
+            out.verdicts.append(self.verdicts[i])
+        return out
+
+    def slice(self, lo: int, hi: int) -> "SubmissionArray":
+        out = SubmissionArray()
+        out.ids = self.ids[lo:hi]
+        out.times = self.times[lo:hi]
+        out.problems = self.problems[lo:hi]
+        out.verdicts = self.verdicts[lo:hi]
+        return out
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Back to normalize_submission dicts (API responses, storage)"""
+        out = []
+        for i in range(len(self)):
+            pid = self.problems[i]
+            out.append({
+                "id": self.ids[i],
+                "contestId": PROBLEMS.contest_ids[pid] or None,
+                "index": PROBLEMS.index(pid) or None,
+                "name": PROBLEMS.names[pid],
+                "tags": list(self.tags(i)),
+                "verdict": self.verdict(i) or None,
+                "rating": self.rating(i),
+                "creationTimeSeconds": self.times[i],
+            })
+        return out
+
+    def nbytes(self) -> int:
+        """Bytes held by this history's arrays (the shared problem table is not included)"""
+        return sum(a.itemsize * a.buffer_info()[1] for a in (self.ids, self.times, self.problems, self.verdicts))
@@ -0,0 +1,174 @@
+# backend/app/telemetry.py
+"""
+Lightweight in-process metrics exposed in Prometheus text format on /metrics.
+
+Recording a sample is a dict lookup and a short lock, so the spans around
+pipeline stages and outbound calls cost microseconds. Each worker process
+keeps its own registry; scrape every worker (or run a single worker) to
+see the full picture.
+"""
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            series[idx] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        lines = []
+        for key, series in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "dsa_http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"))
+STAGE_SECONDS = Histogram(
+    "dsa_stage_duration_seconds", "Latency of recommendation pipeline stages", ("stage",))
+UPSTREAM_SECONDS = Histogram(
+    "dsa_upstream_request_duration_seconds", "Latency of outbound calls", ("service", "endpoint"))
+UPSTREAM_REQUESTS = Counter(
+    "dsa_upstream_requests_total", "Outbound calls by outcome", ("service", "endpoint", "status"))
+UPSTREAM_RETRIES = Counter(
+    "dsa_upstream_retries_total", "Retried outbound calls", ("service",))
+UPSTREAM_RATE_LIMITED = Counter(
+    "dsa_upstream_rate_limited_total", "Outbound calls rejected with 429 / call limit exceeded", ("service",))
+CACHE_REQUESTS = Counter(
+    "dsa_cache_requests_total", "Cache lookups by result", ("cache", "result"))
+FALLBACKS = Counter(
+    "dsa_fallbacks_total", "Times a component fell back to a degraded answer", ("component", "reason"))
+LLM_ROUTER_EVENTS = Counter(
+    "dsa_llm_router_events_total", "LLM router hedges, hedge wins, failovers, skips and breaker transitions",
+    ("provider", "event"))
+
+
+@contextmanager
+def span(stage: str):
+    """Time one stage of request handling"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+class _UpstreamCall:
+    __slots__ = ("status",)
+
+    def __init__(self):
+        self.status = "error"
+
+
+@contextmanager
+def upstream_call(service: str, endpoint: str):
+    """
+    Time an outbound call. Set `.status` on the yielded object (e.g. the HTTP
+    status code); it stays "error" if the block raises before doing so.
+    """
+    call = _UpstreamCall()
+    start = time.perf_counter()
+    try:
+        yield call
+    finally:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - start, service=service, endpoint=endpoint)
+        UPSTREAM_REQUESTS.inc(service=service, endpoint=endpoint, status=str(call.status))
+        if str(call.status) == "429":
+            UPSTREAM_RATE_LIMITED.inc(service=service)
+
+
+def render_metrics() -> str:
+    """All metrics in Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,4 @@
+"""
+Offline benchmark harness for the FastAPI backend.
+Replays recorded Codeforces and Gemini responses from a local stub server.
+"""
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Local/API routing benchmark for submission analysis.
+
+Concurrent clients call FinetunedAnalyzer.analyze under four policies:
+
+- local: local model only (the old behaviour with a model loaded)
+- api: hosted providers only (the old behaviour without one)
+- local_first: local model within LOCAL_LATENCY_BUDGET, else the API
+- speculative: local_first, racing local and API once the local queue is
+  LOCAL_RACE_QUEUE_DEPTH deep or likely to use up the budget
+
+The local model is simulated: one analysis at a time, log-normal service
+time around --local-ms, and a share of unparseable replies. The API is
+the Gemini stub. For each policy the report gives latency quantiles, who
+answered, the routing outcomes and the analyzer's own local latency
+quantiles, which is what LOCAL_LATENCY_BUDGET is tuned from.
+
+    cd backend
+    python -m benchmarks.analysis_routing_benchmark
+    python -m benchmarks.analysis_routing_benchmark --concurrency 8 --local-ms 300 --budget 0.8
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+_scratch = tempfile.mkdtemp(prefix="routing_bench_")
+os.environ.setdefault("DB_PATH", os.path.join(_scratch, "bench.db"))
+
+from app import finetuned_analyzer, llm_router
+from benchmarks.fixtures import CF_TAGS, VERDICTS
+from benchmarks.run_benchmark import percentile
+from benchmarks.stub_server import start_stub
+
+POLICIES = {
+    "local": ("local", 0),
+    "api": ("api", 0),
+    "local_first": ("speculative", 0),
+    "speculative": ("speculative", "race"),
+}
+
+
+def simulated_local_model(args, rng, model_lock):
+    """analyze_with_finetuned stand-in: one call at a time, log-normal latency, some unparseable replies"""
+    def analyze_with_finetuned(submission, adapter=None):
+        with model_lock:
+            seconds = args.local_ms / 1000 * math.exp(rng.gauss(0, args.local_sigma))
+            bad = rng.random() < args.local_bad_share
+            time.sleep(seconds)
+        if bad:
+            return {"raw": '{"topics": ["dp"'}
+        return {"topics": submission["tags"], "likely_issue": "edge cases", "difficulty_inference": "medium",
+                "recommendation_reason": "Practice similar problems"}
+    return analyze_with_finetuned
+
+
+def run_policy(name, args, submissions):
+    routing, race_depth = POLICIES[name]
+    finetuned_analyzer.LOCAL_ROUTING = routing
+    finetuned_analyzer.LOCAL_LATENCY_BUDGET = args.budget
+    finetuned_analyzer.LOCAL_RACE_QUEUE_DEPTH = args.race_depth if race_depth == "race" else 0
+
+    analyzer = finetuned_analyzer.FinetunedAnalyzer(use_finetuned=False)
+    analyzer.use_finetuned = True
+    analyzer.model = object()
+    analyzer.analyze_with_finetuned = simulated_local_model(args, random.Random(args.seed), threading.Lock())
+
+    latencies, served = [], {"local": 0, "local_unparseable": 0, "api": 0}
+    results_lock = threading.Lock()
+
+    def client(offset):
+        for i in range(offset, len(submissions), args.concurrency):
+            start = time.perf_counter()
+            result = analyzer.analyze(submissions[i])
+            elapsed = time.perf_counter() - start
+            with results_lock:
+                latencies.append(elapsed)
+                # The simulated local model answers with the submission's tags; the stub does not
+                if "raw" in result:
+                    served["local_unparseable"] += 1
+                else:
+                    served["local" if result.get("topics") == submissions[i]["tags"] else "api"] += 1
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(client, range(args.concurrency)))
+    latencies.sort()
+    stats = analyzer.stats()
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "served_by": served,
+        "routes": stats["routes"],
+        "local_latency_ms": {k: round(v * 1000, 1) for k, v in stats["local_latency"].items()
+                             if k.startswith("p") and v is not None},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local-first analysis with API fallback against fixed routing")
+    parser.add_argument("--requests", type=int, default=120)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--local-ms", type=float, default=250, help="Median local model latency")
+    parser.add_argument("--local-sigma", type=float, default=0.5, help="Spread of the log-normal local latency")
+    parser.add_argument("--local-bad-share", type=float, default=0.05, help="Share of unparseable local replies")
+    parser.add_argument("--api-ms", type=int, default=400, help="Stub API latency")
+    parser.add_argument("--budget", type=float, default=0.6, help="LOCAL_LATENCY_BUDGET in seconds")
+    parser.add_argument("--race-depth", type=int, default=2, help="LOCAL_RACE_QUEUE_DEPTH")
+    parser.add_argument("--policies", default=",".join(POLICIES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    server, _ = start_stub(0, os.path.join(_scratch, "fixtures"), latency_ms=args.api_ms)
+    port = server.server_address[1]
+    llm_router.GEMINI_URL = f"http://127.0.0.1:{port}/v1beta/models/gemini-2.0-flash:generateContent"
+    llm_router.GEMINI_KEY = llm_router.GEMINI_KEY or "benchmark-stub"
+    llm_router.LLM_PROVIDERS = ["gemini"]
+    llm_router.LLM_HEDGE_ENABLED = False
+
+    rng = random.Random(args.seed)
+    submissions = [{"name": f"Problem {1500 + i}A", "tags": rng.sample(CF_TAGS, 2), "verdict": rng.choice(VERDICTS)}
+                   for i in range(args.requests)]
+    report = {"requests": args.requests, "concurrency": args.concurrency, "budget_s": args.budget,
+              "race_depth": args.race_depth, "policies": {}}
+    for name in args.policies.split(","):
+        report["policies"][name] = run_policy(name, args, submissions)
+    server.shutdown()
+
+    print("=" * 60)
+    print(json.dumps(report, indent=2))
+    print("=" * 60)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Offline hit-rate and latency benchmark for the collaborative recommender.
+
+Each handle's most recent solves are held out. The matrix is built from
+everything else, and the benchmark measures how often the top-k contains a
+held-out problem. A most-solved-unsolved popularity baseline is measured
+the same way for comparison.
+
+    cd backend
+    python -m benchmarks.cf_recommender_benchmark                      # synthetic cohort
+    python -m benchmarks.cf_recommender_benchmark --source db          # the submission store (DB_PATH)
+    python -m benchmarks.cf_recommender_benchmark --handles 5000 --k 10 --output cf_report.json
+
+The synthetic cohort mimics training groups: handles in a group work
+through overlapping problem sets in roughly the same order, each at their
+own pace.
+"""
+import sys
+import json
+import time
+import random
+import argparse
+from collections import Counter, defaultdict
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.collaborative import SolveMatrix, problem_key
+from benchmarks.fixtures import CF_TAGS
+
+
+def synthesize_solves(handles, problems, groups, solves_per_handle, seed):
+    """(handle, problem, time, meta) tuples with group structure"""
+    rng = random.Random(seed)
+    catalogue = []
+    for i in range(problems):
+        contest_id, index = 1000 + i // 6, "ABCDEF"[i % 6]
+        catalogue.append((problem_key(contest_id, index), {
+            "name": f"Problem {contest_id}{index}",
+            "rating": 800 + (i % 6) * 300 + rng.randint(0, 2) * 100,
+            "tags": rng.sample(CF_TAGS, rng.randint(1, 3)),
+        }))
+    # Each group favours its own slice of the catalogue, in a shared order
+    group_sets = [rng.sample(catalogue, min(len(catalogue), solves_per_handle * 3)) for _ in range(groups)]
+
+    solves = []
+    for h in range(handles):
+        handle = f"user{h}"
+        favoured = group_sets[h % groups]
+        # Members of a group are at different points of the same syllabus
+        target = rng.randint(solves_per_handle // 4, solves_per_handle * 2)
+        t = 1700000000
+        count = 0
+        for key, meta in favoured:
+            if count >= target:
+                break
+            # Mostly follow the group's order, sometimes skip ahead or wander off into the catalogue
+            if rng.random() < 0.1:
+                key, meta = rng.choice(catalogue)
+            elif rng.random() < 0.15:
+                continue
+            t += rng.randint(3600, 86400)
+            solves.append((handle, key, t, meta))
+            count += 1
+    return solves
+
+
+def load_store_solves():
+    from app import db
+    return [
+        (row["handle"], problem_key(row["contest_id"], row["problem_index"]), row["created"] or 0,
+         {"name": row["name"], "rating": row["rating"], "tags": row["tags"]})
+        for row in db.iter_accepted_submissions_after(0)
+    ]
+
+
+def split(solves, holdout, min_train):
+    """Hold out each handle's last `holdout` distinct solves"""
+    by_handle = defaultdict(dict)
+    meta = {}
+    for handle, key, t, m in solves:
+        first = by_handle[handle].get(key)
+        if first is None or t < first:
+            by_handle[handle][key] = t
+        meta[key] = m
+    train, test = [], {}
+    for handle, problems in by_handle.items():
+        ordered = sorted(problems.items(), key=lambda item: item[1])
+        if len(ordered) < min_train + holdout:
+            train.extend((handle, key, t) for key, t in ordered)
+            continue
+        train.extend((handle, key, t) for key, t in ordered[:-holdout])
+        test[handle] = {key for key, _ in ordered[-holdout:]}
+    return train, test, meta
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] if ordered else 0
+
+
+def evaluate(matrix, test, k, sample):
+    popularity = [key for key, _ in Counter(
+        {key: len(solvers) for key, solvers in matrix.solvers.items()}).most_common()]
+    hits = recall = pop_hits = pop_recall = 0
+    latencies = []
+    for handle, held_out in sample:
+        start = time.perf_counter()
+        recs = matrix.recommend(handle, k=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        keys = {r["link"].split("/problem/")[1] for r in recs}
+        found = len(keys & held_out)
+        hits += found > 0
+        recall += found / len(held_out)
+
+        solved = matrix.solved.get(handle, {})
+        popular = set()
+        for key in popularity:
+            if key not in solved:
+                popular.add(key)
+                if len(popular) == k:
+                    break
+        pop_found = len(popular & held_out)
+        pop_hits += pop_found > 0
+        pop_recall += pop_found / len(held_out)
+
+    n = len(sample) or 1
+    return {
+        "evaluated_handles": len(sample),
+        f"hit_rate@{k}": round(hits / n, 4),
+        f"recall@{k}": round(recall / n, 4),
+        f"popularity_hit_rate@{k}": round(pop_hits / n, 4),
+        f"popularity_recall@{k}": round(pop_recall / n, 4),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(max(latencies), 3) if latencies else 0,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collaborative recommender hit-rate and latency benchmark")
+    parser.add_argument("--source", choices=("synthetic", "db"), default="synthetic")
+    parser.add_argument("--handles", type=int, default=2000)
+    parser.add_argument("--problems", type=int, default=3000)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--solves", type=int, default=150, help="Solves per synthetic handle")
+    parser.add_argument("--holdout", type=int, default=5)
+    parser.add_argument("--min-train", type=int, default=10)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--eval-handles", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    if args.source == "db":
+        solves = load_store_solves()
+    else:
+        solves = synthesize_solves(args.handles, args.problems, args.groups, args.solves, args.seed)
+    train, test, meta = split(solves, args.holdout, args.min_train)
+    if not test:
+        raise SystemExit("Not enough solves to hold any out; ingest submissions or lower --min-train")
+
+    matrix = SolveMatrix()
+    start = time.perf_counter()
+    for handle, key, t in train:
+        matrix.add(handle, key, t, meta[key])
+    build_seconds = time.perf_counter() - start
+
+    rng = random.Random(args.seed)
+    sample = rng.sample(sorted(test.items()), min(args.eval_handles, len(test)))
+    report = {"source": args.source, "matrix": matrix.stats(), "build_seconds": round(build_seconds, 3)}
+    report.update(evaluate(matrix, test, args.k, sample))
+
+    # Incremental update: fold the held-out solves back in one at a time
+    held = [(handle, key) for handle, keys in test.items() for key in keys]
+    start = time.perf_counter()
+    for handle, key in held:
+        matrix.add(handle, key, 0, meta[key])
+    report["incremental_add_us"] = round((time.perf_counter() - start) / max(1, len(held)) * 1e6, 2)
+
+    print("=" * 60)
+    print(json.dumps(report, indent=2))
+    print("=" * 60)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Chat benchmark: streamed SSE replies from /api/chat/stream against the
+whole-reply call that server.js /api/generate makes.
+
+Starts the stub (chat prompts get a --reply-chars answer, streamed a few
+characters per event with --delay-ms between events) and the backend
+pointed at it. It then measures:
+
+- latency: time to the first reply text and to the end of the reply, for
+  the old one-piece generateContent call and for the SSE endpoint
+- history: a --turns conversation in one session; prompt tokens per turn
+  stay within CHAT_PROMPT_TOKENS while older turns are trimmed
+- cache: the same first question asked in new sessions, answered from the
+  cache after the first time
+
+    cd backend
+    python -m benchmarks.chat_benchmark
+    python -m benchmarks.chat_benchmark --questions 10 --turns 12 --delay-ms 30 --prompt-tokens 600
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import requests
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+_scratch = tempfile.mkdtemp(prefix="chat_bench_")
+os.environ.setdefault("DB_PATH", os.path.join(_scratch, "bench.db"))
+
+from benchmarks.run_benchmark import _free_port, launch_backend, percentile
+from benchmarks.stub_server import start_stub
+
+QUESTIONS = [
+    "How do I detect a cycle in a directed graph?",
+    "When should I use a segment tree instead of a Fenwick tree?",
+    "Explain the two pointers technique with an example.",
+    "What is the difference between BFS and Dijkstra?",
+    "How does binary search on the answer work?",
+    "How do I compute longest increasing subsequence in n log n?",
+    "What is a monotonic stack used for?",
+    "How do I count inversions in an array?",
+]
+
+
+def sse_events(response):
+    """(event, data) pairs from a text/event-stream response"""
+    event = None
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            yield event, json.loads(line[len("data: "):])
+
+
+def chat_turn(target, message, session_id=None):
+    start = time.perf_counter()
+    first = None
+    text, done = [], None
+    with requests.post(f"{target}/api/chat/stream", json={"message": message, "session_id": session_id},
+                       stream=True, timeout=120) as r:
+        r.raise_for_status()
+        for event, data in sse_events(r):
+            if event == "session":
+                session_id = data["session_id"]
+            elif event == "token":
+                first = first or time.perf_counter() - start
+                text.append(data["text"])
+            elif event == "error":
+                raise SystemExit(f"Chat turn failed: {data}")
+            elif event == "done":
+                done = data
+    return {"session_id": session_id, "first": first, "total": time.perf_counter() - start,
+            "text": "".join(text), "done": done}
+
+
+def whole_reply(stub_port, message):
+    """
+    What server.js /api/generate does: one call, the reply used once the
+    model has finished. The stub only paces streamed replies, so this reads
+    the whole stream before any of it counts as received.
+    """
+    start = time.perf_counter()
+    r = requests.post(f"http://127.0.0.1:{stub_port}/v1beta/models/gemini-2.0-flash:streamGenerateContent",
+                      params={"key": "benchmark-stub", "alt": "sse"}, timeout=120,
+                      json={"contents": [{"parts": [{"text": f"Student: {message}\nTutor:"}]}],
+                            "generationConfig": {"maxOutputTokens": 1024}})
+    r.raise_for_status()
+    elapsed = time.perf_counter() - start
+    return {"first": elapsed, "total": elapsed}
+
+
+def summary_ms(samples):
+    samples = sorted(samples)
+    return {"p50": round(percentile(samples, 50) * 1000, 1), "p95": round(percentile(samples, 95) * 1000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streamed chat against whole-reply generation")
+    parser.add_argument("--questions", type=int, default=len(QUESTIONS))
+    parser.add_argument("--turns", type=int, default=10, help="Turns in the history conversation")
+    parser.add_argument("--reply-chars", type=int, default=1200)
+    parser.add_argument("--chunk-chars", type=int, default=40)
+    parser.add_argument("--delay-ms", type=int, default=20, help="Delay between streamed events")
+    parser.add_argument("--latency-ms", type=int, default=200, help="Stub latency before the first event")
+    parser.add_argument("--prompt-tokens", type=int, default=800, help="CHAT_PROMPT_TOKENS for the backend")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    server, _ = start_stub(0, os.path.join(_scratch, "fixtures"), latency_ms=args.latency_ms,
+                           stream_chunk_chars=args.chunk_chars, stream_delay_ms=args.delay_ms,
+                           chat_reply_chars=args.reply_chars)
+    stub_port = server.server_address[1]
+    os.environ.update({"CHAT_PROMPT_TOKENS": str(args.prompt_tokens), "REFRESH_ENABLED": "false",
+                       "LLM_HEDGE_ENABLED": "false"})
+    proc, target = launch_backend(stub_port, _free_port())
+    try:
+        questions = [QUESTIONS[i % len(QUESTIONS)] + (f" (case {i})" if i >= len(QUESTIONS) else "")
+                     for i in range(args.questions)]
+        old = [whole_reply(stub_port, q) for q in questions]
+        new = [chat_turn(target, q) for q in questions]
+
+        conversation, session_id = [], None
+        for i in range(args.turns):
+            turn = chat_turn(target, f"Follow-up {i}: {questions[i % len(questions)]}", session_id)
+            session_id = turn["session_id"]
+            conversation.append({k: turn["done"][k] for k in ("prompt_tokens", "history_turns", "trimmed_turns")})
+
+        time.sleep(1.5)  # let the sqlite writer flush the cached answers
+        repeats = [chat_turn(target, q.upper() + "  ") for q in questions]
+        if not all(turn["done"]["cached"] for turn in repeats):
+            raise SystemExit("A repeated first question was not answered from the cache")
+        if [turn["text"] for turn in repeats] != [turn["text"] for turn in new]:
+            raise SystemExit("A cached answer differs from the streamed one")
+    finally:
+        proc.terminate()
+        proc.wait()
+        server.shutdown()
+
+    report = {
+        "questions": args.questions,
+        "reply_chars": args.reply_chars,
+        "generate_whole_reply_ms": {"first_text": summary_ms([r["first"] for r in old]),
+                                    "complete": summary_ms([r["total"] for r in old])},
+        "chat_stream_ms": {"first_text": summary_ms([r["first"] for r in new]),
+                           "complete": summary_ms([r["total"] for r in new])},
+        "chat_cached_ms": {"first_text": summary_ms([r["first"] for r in repeats]),
+                           "complete": summary_ms([r["total"] for r in repeats])},
+        "history": {"prompt_token_budget": args.prompt_tokens, "turns": conversation,
+                    "max_prompt_tokens": max(t["prompt_tokens"] for t in conversation)},
+    }
+    print("=" * 60)
+    print(json.dumps(report, indent=2))
+    print("=" * 60)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Cohort baseline tables: build cost, size, lookup latency and incremental rebuilds.
+
+Fills a scratch submission store with a synthetic cohort. Each handle has a
+rating, and its solve probability depends on the problem rating and a
+per-tag knack. Cached user.info responses supply the ratings, so the build
+runs offline. The report gives:
+
+- build: full build time, table and state file sizes
+- lookup: annotating one handle's topic statistics from the loaded tables,
+  against computing the same ranks live from the other handles' stored
+  histories (the cheapest live path; without the store each handle costs
+  a user.status call)
+- incremental: new submissions for --changed handles, rebuilt from the
+  state file against a full rebuild, with the two tables checked to be equal
+
+Ranks are also checked against a brute-force percentile over the cohort.
+
+    cd backend
+    python -m benchmarks.cohort_baseline_benchmark
+    python -m benchmarks.cohort_baseline_benchmark --handles 5000 --submissions 300 --changed 50
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+_scratch = tempfile.mkdtemp(prefix="cohort_bench_")
+os.environ.setdefault("DB_PATH", os.path.join(_scratch, "bench.db"))
+os.environ.setdefault("COHORT_BASELINES_PATH", os.path.join(_scratch, "cohort_baselines.npz"))
+os.environ.setdefault("COHORT_STATE_PATH", os.path.join(_scratch, "cohort_baselines.state.npz"))
+
+import numpy as np
+
+from app import cohort_baselines, db
+from app.stats_index import TopicIndex
+from benchmarks.fixtures import CF_TAGS
+from benchmarks.run_benchmark import percentile
+
+
+def synthesize(handle, rating, rng, count, start_id, now):
+    """count submissions whose verdict depends on rating, problem rating and a per-tag knack"""
+    knack = {tag: rng.gauss(0, 150) for tag in CF_TAGS}
+    subs = []
+    for i in range(count):
+        problem_rating = max(800, min(3500, int(rng.gauss(rating, 300)) // 100 * 100))
+        tags = rng.sample(CF_TAGS, rng.randint(1, 3))
+        skill = rating + sum(knack[t] for t in tags) / len(tags)
+        solved = rng.random() < 1 / (1 + 10 ** ((problem_rating - skill) / 400))
+        contest_id = rng.randint(1, 2100)
+        subs.append({"id": start_id + i, "contestId": contest_id, "index": rng.choice("ABCDEF"),
+                     "name": f"Problem {contest_id}", "tags": tags, "rating": problem_rating,
+                     "verdict": "OK" if solved else rng.choice(["WRONG_ANSWER", "TIME_LIMIT_EXCEEDED"]),
+                     "creationTimeSeconds": now - rng.randint(0, 3 * 365 * 86400)})
+    return subs
+
+
+def cache_ratings(ratings):
+    """user.info responses in cf_cache, as the pipeline leaves them"""
+    conn = db.get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO cf_cache (handle, endpoint, fetched_at, payload) VALUES (?, 'user.info', ?, ?)",
+            [(handle, time.time(), json.dumps({"status": "OK", "result": [{"handle": handle, "rating": rating}]}))
+             for handle, rating in ratings.items()])
+
+
+def live_ranks(handle, rating, topics, cohort):
+    """What a request would compute without the tables: every same-bucket handle's stats, then ranks"""
+    bucket = cohort_baselines.rating_bucket(rating)
+    rates = {}
+    for other, other_rating in cohort.items():
+        if other == handle or cohort_baselines.rating_bucket(other_rating) != bucket:
+            continue
+        stats = TopicIndex(db.load_submissions(other, cohort_baselines.COHORT_MAX_SUBMISSIONS)).statistics()
+        for tag, t in stats["topic_stats"].items():
+            if t["total_attempts"] >= cohort_baselines.COHORT_MIN_ATTEMPTS:
+                rates.setdefault(tag, []).append(t["solved"] / t["total_attempts"])
+    ranks = {}
+    for tag, t in topics.items():
+        values = rates.get(tag, [])
+        if values and t["total_attempts"] >= cohort_baselines.COHORT_MIN_ATTEMPTS:
+            mine = t["solved"] / t["total_attempts"]
+            ranks[tag] = 100 * (sum(v < mine for v in values) + 0.5 * sum(v == mine for v in values)) / len(values)
+    return ranks
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cohort baseline table build, lookup and incremental rebuild")
+    parser.add_argument("--handles", type=int, default=2000)
+    parser.add_argument("--submissions", type=int, default=200, help="Stored submissions per handle")
+    parser.add_argument("--changed", type=int, default=20, help="Handles with new submissions before the rebuild")
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--live", type=int, default=3, help="Handles ranked live for comparison")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    now = 1760000000
+    cohort = {f"cohort_user_{i:05d}": int(rng.triangular(800, 3000, 1300)) for i in range(args.handles)}
+    for i, (handle, rating) in enumerate(cohort.items()):
+        db.save_handle_submissions(handle, synthesize(handle, rating, rng, args.submissions,
+                                                      i * 10 * args.submissions, now))
+    cache_ratings(cohort)
+    path, state_path = cohort_baselines.COHORT_BASELINES_PATH, cohort_baselines.COHORT_STATE_PATH
+
+    full, full_seconds = timed(cohort_baselines.build, full=True, offline=True)
+    table, load_seconds = timed(cohort_baselines.BaselineTable, path)
+
+    # Lookups for real topic statistics, as /api/recommendations annotates them
+    sample = rng.sample(list(cohort), min(args.lookups, len(cohort)))
+    per_handle = {h: TopicIndex(db.load_submissions(h, cohort_baselines.COHORT_MAX_SUBMISSIONS)).statistics()
+                  for h in sample}
+    lookup_samples = []
+    for handle in sample:
+        stats = per_handle[handle]
+        start = time.perf_counter()
+        table.annotate(stats, cohort[handle])
+        lookup_samples.append(time.perf_counter() - start)
+
+    # Table ranks against brute force over the cohort (the handle itself included, as in the tables)
+    worst = 0.0
+    live_samples = []
+    for handle in sample[:args.live]:
+        start = time.perf_counter()
+        brute = live_ranks(None, cohort[handle], per_handle[handle]["topic_stats"], cohort)
+        live_samples.append(time.perf_counter() - start)
+        for tag, expected in brute.items():
+            got = per_handle[handle]["topic_stats"][tag].get("percentile")
+            if got is not None:
+                worst = max(worst, abs(got - expected))
+    # Whole-percent rate levels can move a rank by the share of handles within half a percent
+    if worst > 10:
+        raise SystemExit(f"Table ranks differ from brute force by up to {worst:.1f} points")
+
+    # New submissions for a few handles: incremental rebuild against a full one
+    changed = rng.sample(list(cohort), min(args.changed, len(cohort)))
+    for i, handle in enumerate(changed):
+        db.save_handle_submissions(handle, synthesize(handle, cohort[handle], rng, 30,
+                                                      10 ** 9 + i * 100, now + 86400))
+    incremental, incremental_seconds = timed(cohort_baselines.build, offline=True)
+    with np.load(path) as data:
+        incremental_ranks = data["ranks"].copy()
+    _, rebuild_seconds = timed(cohort_baselines.build, full=True, offline=True)
+    with np.load(path) as data:
+        if not np.array_equal(incremental_ranks, data["ranks"]):
+            raise SystemExit("Incremental rebuild differs from a full rebuild")
+
+    lookup_samples.sort()
+    report = {
+        "handles": args.handles,
+        "submissions_per_handle": args.submissions,
+        "build": {
+            "full_seconds": round(full_seconds, 2),
+            "tags": full["tags"],
+            "table_bytes": full["bytes"],
+            "state_bytes": os.path.getsize(state_path),
+            "load_ms": round(load_seconds * 1000, 2),
+        },
+        "lookup": {
+            "annotate_us_p50": round(percentile(lookup_samples, 50) * 1e6, 1),
+            "annotate_us_p99": round(percentile(lookup_samples, 99) * 1e6, 1),
+            "live_from_store_ms": round(sum(live_samples) / max(1, len(live_samples)) * 1000, 1),
+            "max_rank_difference_vs_brute_force": round(worst, 2),
+        },
+        "incremental": {
+            "changed_handles": len(changed),
+            "recounted": incremental["handles_recounted"],
+            "incremental_seconds": round(incremental_seconds, 2),
+            "full_seconds": round(rebuild_seconds, 2),
+            "speedup": round(rebuild_seconds / max(incremental_seconds, 1e-9), 1),
+            "identical_tables": True,
+        },
+    }
+    print("=" * 60)
+    print(json.dumps(report, indent=2))
+    print("=" * 60)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
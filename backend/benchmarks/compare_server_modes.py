@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Requests/sec of the development server versus production mode.
+
+Launches `run_python_server.py` in each mode against the fixture stub and
+drives the same load through it:
+
+    cd backend
+    python -m benchmarks.compare_server_modes --workers 4 --concurrency 16 --requests 400
+
+Upstream latency is simulated with --stub-latency-ms so the comparison
+reflects the mix of I/O waits and JSON/statistics work seen in production.
+Each mode runs against its own fresh database (see launch_backend) and the
+same warmup, so neither starts with caches filled by the other; the
+upstream calls per request are reported to make that visible.
+"""
+import sys
+import argparse
+import signal
+
+from benchmarks.fixtures import FIXTURES_DIR, load_fixtures, synthesize_corpus
+from benchmarks.run_benchmark import _free_port, build_report, launch_backend, run_load
+from benchmarks.stub_server import start_stub
+
+
+def measure(command, stub, state, handles, args):
+    # A new scratch DB per launch: the Codeforces cache starts empty in every mode
+    proc, target = launch_backend(stub.server_address[1], _free_port(), command)
+    try:
+        run_load(target, handles, args.warmup, args.concurrency)
+        state.reset()
+        samples, wall = run_load(target, handles, args.requests, args.concurrency)
+        return build_report(samples, wall, state.snapshot(), args.concurrency)
+    finally:
+        # SIGTERM exercises the graceful shutdown path in both modes
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare dev and production server throughput")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--stub-latency-ms", type=int, default=50)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    args = parser.parse_args()
+
+    if not load_fixtures(args.fixtures):
+        synthesize_corpus(fixtures_dir=args.fixtures)
+
+    stub, state = start_stub(0, args.fixtures, args.stub_latency_ms)
+    handles = sorted(state.fixtures)
+    modes = {
+        "dev (reload, 1 process)": [sys.executable, "run_python_server.py"],
+        f"prod ({args.workers} workers)": [sys.executable, "run_python_server.py", "--prod", "--workers", str(args.workers)],
+    }
+    results = {}
+    try:
+        for name, command in modes.items():
+            print(f"Measuring {name}...")
+            results[name] = measure(command, stub, state, handles, args)
+    finally:
+        stub.shutdown()
+
+    print("=" * 84)
+    print(f"{'mode':<28}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ok':>6}{'upstream/req':>14}")
+    for name, report in results.items():
+        lat = report["latency_ms"]
+        print(f"{name:<28}{report['throughput_rps']:>10}{lat['p50']:>10.1f}{lat['p95']:>10.1f}{lat['p99']:>10.1f}"
+              f"{report['succeeded']:>6}{report['upstream_calls_per_request']:>14}")
+    print("=" * 84)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Constrained decoding benchmark for the local analyzer model.
+
+Generates analyses for synthetic submissions twice, the old way (sample up
+to max_new_tokens, then look for the outermost braces) and with the schema
+logits processor and closing-brace stop. For each mode it reports new
+tokens per reply, tokens/sec, replies per second and how many replies
+parse as JSON with all four analysis fields.
+
+With torch and transformers installed, the model is BASE_MODEL_NAME (or
+--model), with the LoRA adapter from FINETUNED_MODEL_PATH when one has been
+trained. --simulate needs neither: a model with random logits over a small
+vocabulary stands in for it. That checks the guarantee (every constrained
+reply parses, within the token budget, for any logits) and measures the
+per-token cost of computing the allowed tokens.
+
+    cd backend
+    python -m benchmarks.constrained_decoding_benchmark --simulate --samples 500
+    python -m benchmarks.constrained_decoding_benchmark --samples 20 --max-new-tokens 200
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app import constrained_decoding, finetuned_analyzer
+from app.prompts import compile_prompt, get_template
+from benchmarks.fixtures import CF_TAGS, VERDICTS
+
+FIELDS = ("topics", "likely_issue", "difficulty_inference", "recommendation_reason")
+
+
+def synthetic_submissions(count, seed):
+    rng = random.Random(seed)
+    return [{"name": f"Problem {1500 + i}{rng.choice('ABCDEF')}",
+             "tags": rng.sample(CF_TAGS, rng.randint(1, 3)),
+             "verdict": rng.choice(VERDICTS)} for i in range(count)]
+
+
+def brace_scan(text):
+    """What analyze_with_finetuned did before: parse the outermost braces"""
+    start, end = text.find("{"), text.rfind("}") + 1
+    if start == -1 or end <= start:
+        return None
+    try:
+        return json.loads(text[start:end])
+    except ValueError:
+        return None
+
+
+def is_analysis(result):
+    return isinstance(result, dict) and all(field in result for field in FIELDS)
+
+
+def summarize(rows, seconds):
+    tokens = sum(r["tokens"] for r in rows)
+    return {
+        "replies": len(rows),
+        "new_tokens_mean": round(tokens / len(rows), 1),
+        "new_tokens_max": max(r["tokens"] for r in rows),
+        "tokens_per_sec": round(tokens / seconds, 1),
+        "replies_per_sec": round(len(rows) / seconds, 2),
+        "parse_success_rate": round(sum(r["parsed"] for r in rows) / len(rows), 3),
+    }
+
+
+# -- simulated model ---------------------------------------------------------
+
+SIM_WORDS = [" the", " dp", " graph", " greedy", " binary", " search", " two", " pointers", " off", " by", " one",
+             " base", " case", " overflow", " practice", " more", "easy", "medium", "hard", "topics", "likely",
+             "_issue", "difficulty", "_inference", "recommendation", "_reason", '{"', '":"', '","', '"]', '":["',
+             '"}', '"],"', "\n", "\\n", "\t", "�"]
+
+
+def simulate(args):
+    vocab = ["<|endoftext|>"] + [chr(c) for c in range(32, 127)] + SIM_WORDS
+    decoder = constrained_decoding.SchemaDecoder(get_template("analyzer").schema, vocab, 0)
+    rng = random.Random(args.seed)
+
+    def sample(ids, temperature):
+        weights = [math.exp(rng.gauss(0, 1) / temperature) for _ in ids]
+        return rng.choices(ids, weights)[0]
+
+    everything = list(range(len(vocab)))
+    report = {}
+    for mode in ("unconstrained", "constrained"):
+        rows = []
+        mask_seconds = 0.0
+        started = time.perf_counter()
+        for _ in range(args.samples):
+            state = decoder.new_state()
+            text = []
+            for step in range(args.max_new_tokens):
+                if mode == "constrained":
+                    t0 = time.perf_counter()
+                    allowed = decoder.allowed(state, args.max_new_tokens - step)
+                    mask_seconds += time.perf_counter() - t0
+                else:
+                    allowed = everything
+                token_id = sample(allowed, args.temperature)
+                if token_id == 0:
+                    break
+                state.feed(token_id)
+                text.append(vocab[token_id])
+                if mode == "constrained" and state.done:
+                    break
+            reply = "".join(text)
+            if mode == "constrained":
+                try:
+                    parsed = json.loads(reply)
+                except ValueError:
+                    parsed = None
+            else:
+                parsed = brace_scan(reply)
+            rows.append({"tokens": len(text), "parsed": is_analysis(parsed)})
+        report[mode] = summarize(rows, time.perf_counter() - started)
+        if mode == "constrained":
+            tokens = sum(r["tokens"] for r in rows)
+            report[mode]["allowed_us_per_token"] = round(mask_seconds / max(1, tokens) * 1e6, 2)
+    report["model"] = f"simulated (random logits, {len(vocab)}-token vocabulary)"
+    report["min_tokens_for_reply"] = decoder.tokens_needed(decoder.new_state())
+    return report
+
+
+# -- real model ---------------------------------------------------------------
+
+def run_model(args):
+    import torch
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model)
+    if args.model == finetuned_analyzer.BASE_MODEL_NAME and os.path.exists(finetuned_analyzer.FINETUNED_MODEL_PATH):
+        from peft import PeftModel
+        model = PeftModel.from_pretrained(model, finetuned_analyzer.FINETUNED_MODEL_PATH)
+    model.eval()
+    torch.manual_seed(args.seed)
+
+    started = time.perf_counter()
+    decoder = constrained_decoding.SchemaDecoder(get_template("analyzer").schema,
+                                                 constrained_decoding.token_texts(tokenizer),
+                                                 tokenizer.eos_token_id, tokenizer.all_special_ids)
+    build_seconds = time.perf_counter() - started
+
+    submissions = synthetic_submissions(args.samples, args.seed)
+    report = {}
+    for mode in ("unconstrained", "constrained"):
+        rows = []
+        started = time.perf_counter()
+        for submission in submissions:
+            context = f"Problem: {submission['name']}\nTags: {', '.join(submission['tags'])}\nVerdict: {submission['verdict']}\n"
+            inputs = tokenizer(compile_prompt("analyzer", CONTEXT=context).text, return_tensors="pt",
+                               truncation=True, max_length=512)
+            prompt_length = inputs["input_ids"].shape[1]
+            generation = {"max_new_tokens": args.max_new_tokens}
+            if mode == "constrained":
+                generation, _ = constrained_decoding.constrained_generation_kwargs(
+                    decoder, prompt_length, 1, args.max_new_tokens)
+            with torch.no_grad():
+                outputs = model.generate(**inputs, **generation, temperature=args.temperature, do_sample=True,
+                                         pad_token_id=tokenizer.eos_token_id)
+            new_tokens = outputs[0][prompt_length:]
+            reply = tokenizer.decode(new_tokens, skip_special_tokens=True)
+            if mode == "constrained":
+                try:
+                    parsed = json.loads(reply)
+                except ValueError:
+                    parsed = None
+            else:
+                parsed = brace_scan(reply)
+            rows.append({"tokens": len(new_tokens), "parsed": is_analysis(parsed)})
+        report[mode] = summarize(rows, time.perf_counter() - started)
+    report["model"] = args.model
+    report["decoder_build_ms"] = round(build_seconds * 1000, 1)
+    report["min_tokens_for_reply"] = decoder.tokens_needed(decoder.new_state())
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local-model decoding with and without the schema constraint")
+    parser.add_argument("--simulate", action="store_true", help="Random-logit model instead of torch/transformers")
+    parser.add_argument("--model", default=finetuned_analyzer.BASE_MODEL_NAME)
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--max-new-tokens", type=int, default=finetuned_analyzer.LOCAL_MAX_NEW_TOKENS)
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    if not args.simulate and not constrained_decoding.TORCH_AVAILABLE:
+        print("Warning: torch/transformers not installed, running with --simulate")
+        args.simulate = True
+    report = simulate(args) if args.simulate else run_model(args)
+
+    print("=" * 60)
+    print(json.dumps(report, indent=2))
+    print("=" * 60)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if report["constrained"]["parse_success_rate"] < 1.0:
+        print("Constrained replies that did not parse: the schema guarantee is broken")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
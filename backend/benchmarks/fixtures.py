@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Record or synthesize upstream fixtures for the benchmark stub.
+
+Each fixture is one JSON file per handle holding the raw responses of
+`user.status`, `user.info` and the Gemini `generateContent` call:
+
+    python -m benchmarks.fixtures record tourist Petr      # live capture
+    python -m benchmarks.fixtures synthesize --count 50    # offline corpus
+"""
+import os
+import json
+import random
+import argparse
+
+import requests
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+CF_BASE = "https://codeforces.com/api"
+
+CF_TAGS = [
+    "implementation", "math", "greedy", "dp", "data structures", "brute force",
+    "constructive algorithms", "graphs", "sortings", "binary search", "dfs and similar",
+    "trees", "strings", "number theory", "combinatorics", "two pointers", "bitmasks",
+    "geometry", "dsu", "shortest paths", "probabilities", "divide and conquer", "hashing",
+]
+VERDICTS = ["OK"] * 6 + ["WRONG_ANSWER"] * 3 + ["TIME_LIMIT_EXCEEDED", "RUNTIME_ERROR", "COMPILATION_ERROR"]
+RANKS = [(1200, "newbie"), (1400, "pupil"), (1600, "specialist"), (1900, "expert"),
+         (2100, "candidate master"), (2400, "master"), (4000, "grandmaster")]
+
+
+def fixture_path(handle, fixtures_dir=FIXTURES_DIR):
+    return os.path.join(fixtures_dir, f"{handle}.json")
+
+
+def load_fixtures(fixtures_dir=FIXTURES_DIR):
+    """Load every fixture in the directory, keyed by handle"""
+    fixtures = {}
+    if not os.path.isdir(fixtures_dir):
+        return fixtures
+    for name in sorted(os.listdir(fixtures_dir)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(fixtures_dir, name), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        fixtures[data["handle"]] = data
+    return fixtures
+
+
+def save_fixture(fixture, fixtures_dir=FIXTURES_DIR):
+    os.makedirs(fixtures_dir, exist_ok=True)
+    with open(fixture_path(fixture["handle"], fixtures_dir), "w", encoding="utf-8") as f:
+        json.dump(fixture, f)
+
+
+def gemini_reply(recommendations):
+    """Wrap recommendations in the generateContent response envelope"""
+    text = json.dumps({"recommendations": recommendations})
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+
+def record_handle(handle, max_submissions=500, gemini_key=None):
+    """Capture live Codeforces responses (and optionally a Gemini reply) for one handle"""
+    status = requests.get(f"{CF_BASE}/user.status?handle={handle}&from=1&count={max_submissions}", timeout=15).json()
+    info = requests.get(f"{CF_BASE}/user.info?handles={handle}", timeout=10).json()
+    fixture = {"handle": handle, "user.status": status, "user.info": info, "gemini": None}
+
+    if gemini_key and status.get("status") == "OK":
+        # Reuse the real planner so the recorded reply matches the production prompt
+        from app import smart_planner
+        from app.cf_client import get_topic_statistics
+        captured = []
+        original_stream = smart_planner._stream_llm
+
+        def capture(*args, **kwargs):
+            for item in original_stream(*args, **kwargs):
+                captured.append(item)
+                yield item
+
+        smart_planner._stream_llm = capture
+        try:
+            stats = get_topic_statistics(handle, max_submissions=max_submissions)
+            user_info = info["result"][0] if info.get("result") else None
+            smart_planner.generate_recommendations_from_stats(
+                stats["topic_stats"], stats["rating_distribution"], user_info, handle
+            )
+        finally:
+            smart_planner._stream_llm = original_stream
+        fixture["gemini"] = gemini_reply(captured) if captured else None
+
+    return fixture
+
+
+def synthesize_handle(handle, rng, submissions=400):
+    """Build a realistic-looking fixture without touching the network"""
+    rating = rng.randint(800, 2600)
+    rank = next(name for limit, name in RANKS if rating < limit)
+    now = 1760000000
+    results = []
+    for i in range(submissions):
+        problem_rating = max(800, min(3500, int(rng.gauss(rating, 300)) // 100 * 100))
+        contest_id = rng.randint(1, 2100)
+        results.append({
+            "id": 300000000 - i,
+            "contestId": contest_id,
+            "creationTimeSeconds": now - i * rng.randint(600, 86400),
+            "problem": {
+                "contestId": contest_id,
+                "index": rng.choice("ABCDEF"),
+                "name": f"Problem {contest_id}{i}",
+                "type": "PROGRAMMING",
+                "rating": problem_rating,
+                "tags": rng.sample(CF_TAGS, rng.randint(1, 4)),
+            },
+            "programmingLanguage": "C++17 (GCC 7-32)",
+            "verdict": rng.choice(VERDICTS),
+        })
+
+    recommendations = []
+    for tag in rng.sample(CF_TAGS, 5):
+        contest_id = rng.randint(1000, 2100)
+        index = rng.choice("ABCDE")
+        recommendations.append({
+            "title": f"Problem {contest_id}{index}",
+            "link": f"https://codeforces.com/problemset/problem/{contest_id}/{index}",
+            "difficulty": rng.choice(["easy", "medium", "hard"]),
+            "rating": rating // 100 * 100 + 100,
+            "reason": f"Targets your {tag} success rate.",
+            "topic": tag,
+        })
+
+    return {
+        "handle": handle,
+        "user.status": {"status": "OK", "result": results},
+        "user.info": {"status": "OK", "result": [{
+            "handle": handle, "rating": rating, "maxRating": rating + rng.randint(0, 300), "rank": rank,
+        }]},
+        "gemini": gemini_reply(recommendations),
+    }
+
+
+def synthesize_corpus(count=20, seed=0, submissions=400, fixtures_dir=FIXTURES_DIR):
+    rng = random.Random(seed)
+    handles = []
+    for i in range(count):
+        handle = f"bench_user_{i:03d}"
+        save_fixture(synthesize_handle(handle, rng, submissions), fixtures_dir)
+        handles.append(handle)
+    return handles
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record or synthesize benchmark fixtures")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="Capture live responses for the given handles")
+    rec.add_argument("handles", nargs="+")
+    rec.add_argument("--with-gemini", action="store_true", help="Also record a Gemini reply (uses GEMINI_API_KEY)")
+
+    syn = sub.add_parser("synthesize", help="Generate a deterministic offline corpus")
+    syn.add_argument("--count", type=int, default=20)
+    syn.add_argument("--seed", type=int, default=0)
+    syn.add_argument("--submissions", type=int, default=400)
+
+    for p in (rec, syn):
+        p.add_argument("--dir", default=FIXTURES_DIR, help="Fixture directory")
+
+    args = parser.parse_args()
+
+    if args.command == "record":
+        key = os.getenv("GEMINI_API_KEY") if args.with_gemini else None
+        for handle in args.handles:
+            save_fixture(record_handle(handle, gemini_key=key), args.dir)
+            print(f"Recorded {handle}")
+    else:
+        handles = synthesize_corpus(args.count, args.seed, args.submissions, args.dir)
+        print(f"Synthesized {len(handles)} fixtures in {args.dir}")
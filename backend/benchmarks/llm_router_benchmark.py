@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+LLM router check and benchmark against two stub providers.
+
+Runs a Gemini stub and an OpenAI stub (benchmarks.stub_server) and sends
+completions through app.llm_router:
+
+- tail: a share of Gemini calls is slow. Latency quantiles are compared
+  with hedging off and on; with hedging, the slow calls are answered by
+  OpenAI after the hedge delay.
+- breaker: Gemini fails every call. After LLM_BREAKER_FAILURES failures
+  its breaker opens and Gemini gets no more requests, while OpenAI answers
+  every call. Once Gemini is healthy again, the first trial after the
+  cooldown closes the breaker.
+
+    cd backend
+    python -m benchmarks.llm_router_benchmark
+    python -m benchmarks.llm_router_benchmark --requests 200 --slow-share 0.1 --slow-ms 1500
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+_scratch = tempfile.mkdtemp(prefix="router_bench_")
+os.environ.setdefault("DB_PATH", os.path.join(_scratch, "bench.db"))
+
+from app import llm_router
+from benchmarks.fixtures import synthesize_corpus
+from benchmarks.run_benchmark import percentile
+from benchmarks.stub_server import start_stub
+
+
+def make_router(gemini_port, openai_port, hedge, failures=5, cooldown=30.0):
+    llm_router.GEMINI_KEY = "benchmark-stub"
+    llm_router.GEMINI_URL = f"http://127.0.0.1:{gemini_port}/v1beta/models/gemini-2.0-flash:generateContent"
+    llm_router.OPENAI_KEY = "benchmark-stub"
+    llm_router.OPENAI_URL = f"http://127.0.0.1:{openai_port}/v1/chat/completions"
+    llm_router.LLM_HEDGE_ENABLED = hedge
+    providers = [llm_router.GeminiProvider(), llm_router.OpenAIProvider()]
+    for provider in providers:
+        provider.breaker = llm_router.CircuitBreaker(provider.name, failures, cooldown)
+    return llm_router.LLMRouter(providers, order=["gemini", "openai"])
+
+
+def run_tail(router, prompts, total, warmup):
+    # Warm-up calls give the router the latency samples its hedge delay needs
+    for i in range(warmup):
+        router.complete(prompts[i % len(prompts)], timeout=10)
+    latencies = []
+    winners = {}
+    for i in range(total):
+        start = time.perf_counter()
+        result = router.complete(prompts[i % len(prompts)], timeout=10)
+        latencies.append(time.perf_counter() - start)
+        winners[result["provider"]] = winners.get(result["provider"], 0) + 1
+    latencies.sort()
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+        "answered_by": winners,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM router hedging and circuit breaker benchmark")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--latency-ms", type=int, default=20, help="Normal stub LLM latency")
+    parser.add_argument("--slow-share", type=float, default=0.1, help="Share of slow Gemini calls")
+    parser.add_argument("--slow-ms", type=int, default=1000, help="Extra latency of a slow Gemini call")
+    parser.add_argument("--hedge-min-ms", type=int, default=50, help="Lower bound of the hedge delay")
+    parser.add_argument("--failures", type=int, default=5, help="Breaker threshold")
+    parser.add_argument("--cooldown", type=float, default=1.0, help="Breaker cooldown in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    fixtures_dir = os.path.join(_scratch, "fixtures")
+    handles = synthesize_corpus(5, args.seed, 50, fixtures_dir)
+    prompts = [f"Recommend problems for user {h}: (benchmark)" for h in handles]
+    gemini, gemini_state = start_stub(0, fixtures_dir, args.latency_ms, llm_slow_share=args.slow_share,
+                                      llm_slow_ms=args.slow_ms, seed=args.seed)
+    openai, openai_state = start_stub(0, fixtures_dir, args.latency_ms)
+    ports = gemini.server_address[1], openai.server_address[1]
+
+    # Tail latency: the hedge delay settles on Gemini's p95 once enough calls are seen
+    llm_router.LLM_HEDGE_MIN_DELAY = args.hedge_min_ms / 1000.0
+    tail = {}
+    for hedge in (False, True):
+        # Both runs see the same sequence of slow calls
+        gemini_state.rng = random.Random(args.seed)
+        router = make_router(*ports, hedge)
+        result = run_tail(router, prompts, args.requests, llm_router.LLM_HEDGE_MIN_SAMPLES)
+        providers = router.stats()["providers"]
+        result["hedges_started"] = providers["openai"]["hedges_started"]
+        result["gemini_cancelled"] = providers["gemini"]["cancelled"]
+        result["hedge_delay_ms"] = round(providers["gemini"]["hedge_delay"]["complete"] * 1000, 1)
+        tail["hedged" if hedge else "unhedged"] = result
+    if tail["hedged"]["max_ms"] >= tail["unhedged"]["max_ms"] / 2:
+        raise SystemExit("Hedging did not lower the tail latency")
+
+    # Circuit breaker: Gemini down, then back up
+    gemini_state.llm_slow_share = 0.0
+    gemini_state.llm_error_status = 503
+    gemini_state.reset()
+    router = make_router(*ports, True, args.failures, args.cooldown)
+    answered = [router.complete(prompts[i % len(prompts)], timeout=10)["provider"] for i in range(args.failures * 4)]
+    gemini_calls_while_down = gemini_state.snapshot().get("gemini", 0)
+    if set(answered) != {"openai"}:
+        raise SystemExit("A call was not failed over to OpenAI while Gemini was down")
+    if gemini_calls_while_down != args.failures or router.providers["gemini"].breaker.state != "open":
+        raise SystemExit(f"Breaker let {gemini_calls_while_down} calls through, expected {args.failures}")
+
+    gemini_state.llm_error_status = 0
+    time.sleep(args.cooldown)
+    recovered = router.complete(prompts[0], timeout=10)["provider"]
+    if recovered != "gemini" or router.providers["gemini"].breaker.state != "closed":
+        raise SystemExit("Breaker did not close after Gemini recovered")
+
+    gemini.shutdown()
+    openai.shutdown()
+
+    report = {
+        "requests": args.requests,
+        "slow_gemini_share": args.slow_share,
+        "slow_gemini_extra_ms": args.slow_ms,
+        "tail": tail,
+        "breaker": {
+            "calls_while_down": len(answered),
+            "gemini_requests_while_down": gemini_calls_while_down,
+            "answered_by_openai": answered.count("openai"),
+            "after_cooldown": recovered,
+        },
+    }
+    print("=" * 60)
+    print(json.dumps(report, indent=2))
+    print("=" * 60)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Multi-adapter LoRA serving: memory and switch latency.
+
+Creates --adapters LoRA adapters with random weights for the base model and
+serves them from one AdapterPool. The report compares:
+
+- memory: base and adapter weight bytes for one shared base against one
+  base copy per adapter (what loading each adapter as its own model costs)
+- switch latency: set_adapter between loaded adapters, an LRU miss (load
+  one adapter, evict another) when the pool holds fewer adapters than are
+  in use, and reloading base plus adapter as a separate model
+- batching: one mixed-adapter generate for a batch against one generate
+  per adapter group
+
+Needs torch, transformers and peft. --tiny builds a small randomly
+initialised GPT-2 locally instead of downloading --model.
+
+    cd backend
+    python -m benchmarks.lora_adapter_benchmark --tiny
+    python -m benchmarks.lora_adapter_benchmark --adapters 6 --max-loaded 4 --switches 200
+"""
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app import finetuned_analyzer, lora_adapters
+from benchmarks.run_benchmark import percentile
+
+try:
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer, GPT2Config, GPT2LMHeadModel
+    from peft import LoraConfig, PeftModel, get_peft_model
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+
+def load_base(args):
+    if args.tiny:
+        torch.manual_seed(args.seed)
+        return GPT2LMHeadModel(GPT2Config(n_layer=2, n_head=4, n_embd=128, vocab_size=1000, n_positions=256))
+    return AutoModelForCausalLM.from_pretrained(args.model)
+
+
+def make_adapters(base, count, directory):
+    """count adapters with random (non-zero) LoRA weights, saved like finetune_train.py saves one"""
+    paths = {}
+    for i in range(count):
+        config = LoraConfig(r=8, lora_alpha=32, target_modules=["c_attn", "c_proj"], init_lora_weights=False)
+        model = get_peft_model(copy.deepcopy(base), config)
+        paths[f"style{i}"] = os.path.join(directory, f"style{i}")
+        model.save_pretrained(paths[f"style{i}"])
+    return paths
+
+
+def timings_ms(samples):
+    samples = sorted(samples)
+    return {"p50": round(percentile(samples, 50) * 1000, 3), "p95": round(percentile(samples, 95) * 1000, 3),
+            "mean": round(sum(samples) / len(samples) * 1000, 3)}
+
+
+def switch_latency(pool, names, rounds):
+    samples = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        with pool.use(names[i % len(names)]):
+            pass
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory and switch latency of LoRA adapters on one shared base model")
+    parser.add_argument("--model", default=finetuned_analyzer.BASE_MODEL_NAME)
+    parser.add_argument("--tiny", action="store_true", help="Small random GPT-2 instead of --model (no download)")
+    parser.add_argument("--adapters", type=int, default=4)
+    parser.add_argument("--max-loaded", type=int, default=None, help="Pool size for the LRU-miss run (default adapters - 1)")
+    parser.add_argument("--switches", type=int, default=100)
+    parser.add_argument("--reloads", type=int, default=3)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--new-tokens", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    if not TORCH_AVAILABLE:
+        print("This benchmark needs torch, transformers and peft (pip install -r requirements.txt)")
+        sys.exit(1)
+    torch.manual_seed(args.seed)
+    scratch = tempfile.mkdtemp(prefix="lora_bench_")
+    base = load_base(args)
+    base.eval()
+    paths = make_adapters(base, args.adapters, scratch)
+    names = list(paths)
+
+    # All adapters resident: a switch is set_adapter only
+    pool = lora_adapters.AdapterPool(base, paths, max_loaded=args.adapters)
+    for name in names:
+        with pool.use(name):
+            pass
+    stats = pool.stats()
+    adapter_bytes = sum(stats["adapter_bytes"].values())
+    switches = switch_latency(pool, names, args.switches)
+
+    # Batching across adapters: one mixed generate against one generate per adapter
+    if args.tiny:
+        input_ids = torch.randint(0, 1000, (args.batch, 32))
+    else:
+        tokenizer = AutoTokenizer.from_pretrained(args.model)
+        input_ids = tokenizer(["Problem: Watermelon\nTags: math\nVerdict: OK\n"] * args.batch,
+                              return_tensors="pt")["input_ids"]
+    rows = [names[i % len(names)] for i in range(args.batch)]
+    generation = dict(max_new_tokens=args.new_tokens, min_new_tokens=args.new_tokens, do_sample=False,
+                      pad_token_id=0)
+    with torch.no_grad():
+        start = time.perf_counter()
+        pool.generate(rows, input_ids=input_ids, **generation)
+        mixed = time.perf_counter() - start
+        start = time.perf_counter()
+        for name in names:
+            selected = [i for i, row in enumerate(rows) if row == name]
+            if selected:
+                pool.generate([name] * len(selected), input_ids=input_ids[selected], **generation)
+        grouped = time.perf_counter() - start
+    del pool
+
+    # Fewer slots than adapters in use: round-robin makes every switch an LRU miss
+    max_loaded = args.max_loaded or max(1, args.adapters - 1)
+    small_pool = lora_adapters.AdapterPool(load_base(args), paths, max_loaded=max_loaded)
+    misses = switch_latency(small_pool, names, args.switches)
+    del small_pool
+
+    # One model per adapter: switching means loading base and adapter again
+    reloads = []
+    for i in range(args.reloads):
+        start = time.perf_counter()
+        PeftModel.from_pretrained(load_base(args), paths[names[i % len(names)]])
+        reloads.append(time.perf_counter() - start)
+
+    report = {
+        "model": "tiny random GPT-2" if args.tiny else args.model,
+        "adapters": args.adapters,
+        "memory_bytes": {
+            "base": stats["base_bytes"],
+            "adapters": adapter_bytes,
+            "shared_base": stats["base_bytes"] + adapter_bytes,
+            "base_per_adapter": args.adapters * stats["base_bytes"] + adapter_bytes,
+        },
+        "switch_ms": {
+            "loaded": timings_ms(switches),
+            f"lru_miss_{max_loaded}_slots": timings_ms(misses),
+            "reload_model": timings_ms(reloads),
+        },
+        "batch_ms": {
+            "mixed_adapters": round(mixed * 1000, 1),
+            "per_adapter_groups": round(grouped * 1000, 1),
+            "rows": args.batch,
+            "new_tokens": args.new_tokens,
+        },
+    }
+    print("=" * 60)
+    print(json.dumps(report, indent=2))
+    print("=" * 60)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
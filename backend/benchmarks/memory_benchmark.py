@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Memory footprint of cached submission histories: normalized dicts vs
+SubmissionArray.
+
+Builds the same synthetic histories both ways and measures the allocations
+with tracemalloc. The array figure includes each handle's arrays; the
+shared problem table, which every handle reuses, is reported separately.
+
+    cd backend
+    python -m benchmarks.memory_benchmark
+    python -m benchmarks.memory_benchmark --handles 2000 --submissions 500 --output memory_report.json
+"""
+import gc
+import sys
+import json
+import random
+import argparse
+import tracemalloc
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.cf_client import normalize_submission
+from app.stats_index import TopicIndex
+from app.submission_array import PROBLEMS, SubmissionArray
+from benchmarks.fixtures import synthesize_handle
+
+
+def raw_payloads(handles, submissions, seed):
+    """user.status result bodies as the API returns them (JSON text)"""
+    rng = random.Random(seed)
+    for i in range(handles):
+        yield json.dumps(synthesize_handle(f"user{i}", rng, submissions)["user.status"]["result"])
+
+
+def measure(build):
+    """(result, bytes still allocated by build())"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes per cached submission: dicts vs SubmissionArray")
+    parser.add_argument("--handles", type=int, default=500)
+    parser.add_argument("--submissions", type=int, default=500, help="Submissions per handle")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    payloads = list(raw_payloads(args.handles, args.submissions, args.seed))
+
+    # What the handle cache held before: normalized dicts decoded from each response
+    dicts, dict_bytes = measure(lambda: [[normalize_submission(item) for item in json.loads(p)] for p in payloads])
+    total = sum(len(d) for d in dicts)
+
+    problems_before = len(PROBLEMS)
+    arrays, array_bytes = measure(lambda: [SubmissionArray.from_dicts(subs) for subs in dicts])
+    table_bytes = sum(a.itemsize * a.buffer_info()[1] for a in
+                      (PROBLEMS.contest_ids, PROBLEMS.indexes, PROBLEMS.ratings, PROBLEMS.tag_masks))
+    table_bytes += sys.getsizeof(PROBLEMS.names) + sum(sys.getsizeof(n) for n in PROBLEMS.names)
+    arrays_only = sum(a.nbytes() for a in arrays)
+
+    _, index_bytes = measure(lambda: [TopicIndex(a) for a in arrays])
+
+    report = {
+        "handles": args.handles,
+        "submissions": total,
+        "dict_bytes_per_submission": round(dict_bytes / total, 1),
+        # Allocations made while converting: the arrays plus problems interned for the first time
+        "array_bytes_per_submission": round(array_bytes / total, 1),
+        "array_buffer_bytes_per_submission": round(arrays_only / total, 1),
+        "problem_table": {"problems": len(PROBLEMS) - problems_before, "bytes": table_bytes},
+        "topic_index_bytes_per_submission": round(index_bytes / total, 1),
+        "reduction": round(dict_bytes / max(1, array_bytes), 1),
+        "dict_mb": round(dict_bytes / 2 ** 20, 1),
+        "array_mb": round(array_bytes / 2 ** 20, 1),
+    }
+    print("=" * 60)
+    print(json.dumps(report, indent=2))
+    print("=" * 60)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
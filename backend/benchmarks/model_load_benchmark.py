@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Local model startup: hub loader against the offline safetensors artifact.
+
+Each load runs in a fresh interpreter, so nothing is shared between runs
+but the OS page cache. The report gives the time from interpreter start to
+a usable model and tokenizer, and the peak RSS, for:
+
+- hub: from_pretrained(BASE_MODEL_NAME), the current loader (resolves the
+  name against the hub, then reads the local cache)
+- artifact: app.model_artifacts.load_model, offline and memory-mapped
+
+The artifact is exported to a scratch directory first, unless --artifact-root
+points at an existing export. With --tiny, a small randomly initialised
+GPT-2 saved in the pickled format stands in for the hub model, so no
+network is needed at all.
+
+    cd backend
+    python -m benchmarks.model_load_benchmark --tiny
+    python -m benchmarks.model_load_benchmark --runs 5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+
+def child(loader, source, root):
+    """Load once and print seconds since interpreter start and peak RSS"""
+    from app import model_artifacts
+    if loader == "hub":
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+        AutoTokenizer.from_pretrained(source)
+        AutoModelForCausalLM.from_pretrained(source)
+    else:
+        model_artifacts.load_model(model_artifacts.resolve_artifact(root=root))
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"seconds": time.time() - float(os.environ["LOAD_BENCH_STARTED"]), "peak_rss_mb": peak_kb / 1024}))
+
+
+def make_tiny_model(directory):
+    from transformers import GPT2Config, GPT2LMHeadModel, GPT2TokenizerFast
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    vocab = {chr(c): i for i, c in enumerate(range(32, 127))}
+    vocab["<|endoftext|>"] = len(vocab)
+    tokenizer = Tokenizer(models.BPE(vocab=vocab, merges=[]))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    GPT2TokenizerFast(tokenizer_object=tokenizer, eos_token="<|endoftext|>").save_pretrained(directory)
+    config = GPT2Config(n_layer=6, n_head=8, n_embd=512, vocab_size=len(vocab), n_positions=512)
+    GPT2LMHeadModel(config).save_pretrained(directory, safe_serialization=False)
+
+
+def run(loader, source, root, runs):
+    results = []
+    for _ in range(runs):
+        env = dict(os.environ, LOAD_BENCH_STARTED=repr(time.time()))
+        output = subprocess.run([sys.executable, "-m", "benchmarks.model_load_benchmark", "--child", loader,
+                                 "--source", source, "--artifact-root", root],
+                                cwd=backend_dir, env=env, capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    seconds = sorted(r["seconds"] for r in results)
+    return {
+        "seconds_median": round(seconds[len(seconds) // 2], 3),
+        "seconds_min": round(seconds[0], 3),
+        "peak_rss_mb": round(max(r["peak_rss_mb"] for r in results), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time of the hub loader against the offline artifact")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--tiny", action="store_true", help="Small random GPT-2 instead of BASE_MODEL_NAME")
+    parser.add_argument("--artifact-root", help="Use an existing MODEL_ARTIFACTS_DIR instead of exporting")
+    parser.add_argument("--output", help="Write the report as JSON")
+    parser.add_argument("--child", choices=["hub", "artifact"], help=argparse.SUPPRESS)
+    parser.add_argument("--source", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.source, args.artifact_root)
+        return
+
+    from app import finetuned_analyzer, model_artifacts
+    if not model_artifacts.TORCH_AVAILABLE:
+        print("This benchmark needs torch, transformers and safetensors (pip install -r requirements.txt)")
+        sys.exit(1)
+    scratch = tempfile.mkdtemp(prefix="load_bench_")
+    source = finetuned_analyzer.BASE_MODEL_NAME
+    if args.tiny:
+        source = os.path.join(scratch, "hub_model")
+        make_tiny_model(source)
+    root = args.artifact_root
+    if root is None:
+        root = os.path.join(scratch, "artifacts")
+        model_artifacts.export_artifact(source, {}, root=root)
+
+    report = {
+        "model": "tiny random GPT-2" if args.tiny else source,
+        "runs": args.runs,
+        "hub": run("hub", source, root, args.runs),
+        "artifact": run("artifact", source, root, args.runs),
+    }
+    report["speedup"] = round(report["hub"]["seconds_median"] / report["artifact"]["seconds_median"], 2)
+    print("=" * 60)
+    print(json.dumps(report, indent=2))
+    print("=" * 60)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Prompt compiler benchmark: prompt and reply tokens and latency, before and after.
+
+"Before" is the planner prompt as it used to be assembled (an f-string that
+spells out the JSON structure), sent without a schema. The stub answers
+like a free-form model: indented JSON in a code fence. "After" is the
+compiled recommendations template, sent with its JSON schema, which the
+stub answers compactly. Both replies are streamed a few characters per
+event, so reply size shows up in latency. The benchmark also reports how
+many replies json.loads can read as they are, and what compiling a cached
+template costs.
+
+    cd backend
+    python -m benchmarks.prompt_benchmark
+    python -m benchmarks.prompt_benchmark --handles 20 --chunk-chars 16 --delay-ms 5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+_scratch = tempfile.mkdtemp(prefix="prompt_bench_")
+os.environ.setdefault("DB_PATH", os.path.join(_scratch, "bench.db"))
+
+from app import cf_client, llm_router, prompts, smart_planner
+from benchmarks.fixtures import synthesize_corpus
+from benchmarks.run_benchmark import percentile
+from benchmarks.stub_server import start_stub
+
+
+def legacy_prompt(topic_stats, rating_dist, user_info, handle):
+    """The planner prompt as smart_planner built it before the prompt compiler"""
+    compiled, weak_topics, avg_rating = smart_planner._build_prompt(topic_stats, rating_dist, user_info, handle)
+    medium_topics = sorted(
+        [(tag, stats) for tag, stats in topic_stats.items() if stats["strength"] == "medium"],
+        key=smart_planner._weakness_key
+    )[:3]
+    prompt = f"""Based on Codeforces statistics for user {handle}:
+
+Topic Performance:
+"""
+    for tag, stats in (weak_topics + medium_topics)[:8]:
+        prompt += f"- {tag}: {stats['solved']} solved, {stats['failed']} failed, success rate {stats['success_rate']*100:.0f}% ({stats['strength']})"
+        if "target_rating" in stats:
+            prompt += f", skill {stats['skill']}, recommend rating {stats['target_rating']}"
+        prompt += "\n"
+    user_rating = user_info.get("rating", 0) if user_info else 0
+    user_rank = user_info.get("rank", "unrated") if user_info else "unrated"
+    prompt += f"""
+User Rating: {user_rating} ({user_rank})
+Average Problem Rating Solved: {avg_rating}
+Total Solved: {len(topic_stats)}
+
+Generate exactly 5 personalized problem recommendations as JSON with this structure:
+{{
+  "recommendations": [
+    {{
+      "title": "Problem name",
+      "link": "https://codeforces.com/problemset/problem/XXXX/X or https://codeforces.com/problemset?tags=tag_name",
+      "difficulty": "easy/medium/hard",
+      "rating": 1200-2000 (actual problem rating number),
+      "reason": "Why this helps (1-2 sentences)",
+      "topic": "relevant topic"
+    }}
+  ]
+}}
+
+Include the actual problem rating (e.g., 1400, 1600) in the rating field.
+
+Focus on:
+1. Weak topics that need practice
+2. Problems at each topic's recommended rating (otherwise around {avg_rating}, slightly above for growth)
+3. Balanced mix of topics
+Return ONLY valid JSON, no other text.
+"""
+    return prompt, compiled
+
+
+def timed_stream(text, schema=None):
+    start = time.perf_counter()
+    reply = "".join(llm_router.get_router().stream(text, max_tokens=800, timeout=30, schema=schema))
+    return reply, time.perf_counter() - start
+
+
+def parses(reply):
+    try:
+        json.loads(reply)
+        return True
+    except ValueError:
+        return False
+
+
+def summarize(rows):
+    latencies = sorted(r["latency"] for r in rows)
+    return {
+        "prompt_tokens": round(sum(r["prompt_tokens"] for r in rows) / len(rows), 1),
+        "output_tokens": round(sum(r["output_tokens"] for r in rows) / len(rows), 1),
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "latency_p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "json_loads_ok": sum(r["parses"] for r in rows),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt/reply tokens and latency before and after the prompt compiler")
+    parser.add_argument("--handles", type=int, default=10)
+    parser.add_argument("--chunk-chars", type=int, default=16, help="Reply characters per streamed event")
+    parser.add_argument("--delay-ms", type=int, default=5, help="Stub delay between streamed events")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    fixtures_dir = os.path.join(_scratch, "fixtures")
+    handles = synthesize_corpus(args.handles, args.seed, 300, fixtures_dir)
+    server, _ = start_stub(0, fixtures_dir, stream_chunk_chars=args.chunk_chars, stream_delay_ms=args.delay_ms)
+    port = server.server_address[1]
+    cf_client.BASE = f"http://127.0.0.1:{port}/api"
+    llm_router.GEMINI_STREAM_URL = f"http://127.0.0.1:{port}/v1beta/models/gemini-2.0-flash:streamGenerateContent"
+    llm_router.GEMINI_KEY = llm_router.GEMINI_KEY or "benchmark-stub"
+    llm_router.LLM_PROVIDERS = ["gemini"]
+
+    before, after = [], []
+    for handle in handles:
+        stats = cf_client.get_topic_statistics(handle)
+        user_info = cf_client.fetch_user_info(handle)
+        old, compiled = legacy_prompt(stats["topic_stats"], stats["rating_distribution"], user_info, handle)
+
+        reply, latency = timed_stream(old)
+        before.append({"prompt_tokens": prompts.count_tokens(old), "output_tokens": prompts.count_tokens(reply),
+                       "latency": latency, "parses": parses(reply)})
+        reply, latency = timed_stream(compiled.text, compiled.schema)
+        after.append({"prompt_tokens": compiled.tokens, "output_tokens": prompts.count_tokens(reply),
+                      "latency": latency, "parses": parses(reply)})
+    server.shutdown()
+
+    # Compile cost: first load of the template file against the cached template
+    slots = dict(HANDLE="x", TOPICS=["- dp: 1 solved"] * 8, USER_RATING=1500, USER_RANK="specialist",
+                 AVG_RATING=1400, TOTAL_SOLVED=20)
+    prompts._templates.clear()
+    start = time.perf_counter()
+    prompts.compile_prompt("recommendations", **slots)
+    cold = time.perf_counter() - start
+    rounds = 2000
+    start = time.perf_counter()
+    for _ in range(rounds):
+        prompts.compile_prompt("recommendations", **slots)
+    warm = (time.perf_counter() - start) / rounds
+
+    report = {
+        "handles": len(handles),
+        "tokenizer": "tiktoken cl100k_base" if prompts.TIKTOKEN_AVAILABLE else "local estimate",
+        "before": summarize(before),
+        "after": summarize(after),
+        "compile_us": {"first_load": round(cold * 1e6, 1), "cached": round(warm * 1e6, 1)},
+    }
+    print("=" * 60)
+    print(json.dumps(report, indent=2))
+    print("=" * 60)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark for /api/recommendations against recorded fixtures.
+
+Starts the fixture stub, launches the FastAPI app pointed at it (or uses
+--target for an already running server), drives the endpoint at the
+requested concurrency and reports latency percentiles, throughput,
+upstream call counts and AgentEvaluator recommendation quality.
+
+    cd backend
+    python -m benchmarks.run_benchmark --concurrency 8 --requests 200
+    python -m benchmarks.run_benchmark --baseline bench_baseline.json   # fail on regressions
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import shutil
+import socket
+import argparse
+import tempfile
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.evaluator import AgentEvaluator
+from benchmarks.fixtures import FIXTURES_DIR, load_fixtures, synthesize_corpus
+from benchmarks.stub_server import start_stub
+
+# Allowed relative slowdown before a metric counts as a regression
+DEFAULT_TOLERANCE = 0.15
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    idx = min(int(round(p / 100.0 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[idx]
+
+
+def launch_backend(stub_port, port, command=None):
+    """
+    Start the backend (uvicorn by default) with upstream URLs pointed at the stub.
+    Every launch gets its own empty SQLite database, log and evaluation files in a
+    scratch directory, so runs never read or write the real ones and never start
+    with caches warmed by an earlier run.
+    """
+    scratch = tempfile.mkdtemp(prefix="backend_bench_")
+    atexit.register(shutil.rmtree, scratch, ignore_errors=True)
+    env = dict(os.environ)
+    env.update({
+        "STORAGE_BACKEND": "sqlite",
+        "DB_PATH": os.path.join(scratch, "dsa_agent.db"),
+        "LOG_FILE": os.path.join(scratch, "logs.jsonl"),
+        "EVAL_RESULTS_FILE": os.path.join(scratch, "evaluation_results.jsonl"),
+        "EVAL_SNAPSHOT_PATH": os.path.join(scratch, "evaluation_snapshot.json"),
+        "CODEFORCES_API_BASE": f"http://127.0.0.1:{stub_port}/api",
+        "GEMINI_API_URL": f"http://127.0.0.1:{stub_port}/v1beta/models/gemini-2.0-flash:generateContent",
+        "GEMINI_API_KEY": "benchmark-stub",
+        "LLM_PROVIDERS": "gemini",
+    })
+    command = command or [sys.executable, "-m", "uvicorn", "app.main:app", "--log-level", "warning"]
+    proc = subprocess.Popen(command + ["--host", "127.0.0.1", "--port", str(port)], cwd=str(backend_dir), env=env)
+    target = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("Backend exited during startup")
+        try:
+            if requests.get(f"{target}/health", timeout=1).ok:
+                return proc, target
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("Backend did not become healthy within 30s")
+
+
+def run_load(target, handles, total_requests, concurrency):
+    """Drive /api/recommendations and return per-request samples"""
+    session_url = f"{target}/api/recommendations"
+
+    def one(i):
+        handle = handles[i % len(handles)]
+        start = time.perf_counter()
+        try:
+            r = requests.post(session_url, json={"handle": handle}, timeout=120)
+            elapsed = time.perf_counter() - start
+            body = r.json() if r.headers.get("content-type", "").startswith("application/json") else None
+            return {"handle": handle, "status": r.status_code, "latency": elapsed, "body": body}
+        except requests.RequestException as e:
+            return {"handle": handle, "status": "error", "latency": time.perf_counter() - start, "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        samples = list(pool.map(one, range(total_requests)))
+        wall = time.perf_counter() - start
+    return samples, wall
+
+
+def build_report(samples, wall, upstream_calls, concurrency):
+    # Only scores the responses: nothing is rehydrated from or written to storage
+    evaluator = AgentEvaluator(persist=False)
+    latencies = sorted(s["latency"] * 1000 for s in samples)
+    ok = [s for s in samples if s["status"] == 200 and s.get("body")]
+
+    qualities = [
+        evaluator.evaluate_recommendations(s["body"].get("recommendations", {}), s["handle"])["recommendation_quality"]
+        for s in ok
+    ]
+
+    return {
+        "requests": len(samples),
+        "concurrency": concurrency,
+        "succeeded": len(ok),
+        "status_codes": dict(Counter(str(s["status"]) for s in samples)),
+        "wall_time_s": round(wall, 3),
+        "throughput_rps": round(len(samples) / wall, 2) if wall else None,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None,
+        },
+        "upstream_calls": upstream_calls,
+        "upstream_calls_per_request": round(sum(upstream_calls.values()) / len(samples), 3) if samples else None,
+        "quality": {
+            "mean_recommendation_quality": round(sum(qualities) / len(qualities), 4) if qualities else 0.0,
+            "min_recommendation_quality": min(qualities) if qualities else 0.0,
+        },
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Return a list of human-readable regressions versus the baseline report"""
+    regressions = []
+    for key in ("p50", "p95", "p99"):
+        old, new = baseline["latency_ms"].get(key), report["latency_ms"].get(key)
+        if old and new and new > old * (1 + tolerance):
+            regressions.append(f"latency {key}: {old:.1f}ms -> {new:.1f}ms")
+    old, new = baseline.get("throughput_rps"), report.get("throughput_rps")
+    if old and new and new < old * (1 - tolerance):
+        regressions.append(f"throughput: {old} -> {new} req/s")
+    old, new = baseline.get("upstream_calls_per_request"), report.get("upstream_calls_per_request")
+    if old is not None and new is not None and new > old:
+        regressions.append(f"upstream calls/request: {old} -> {new}")
+    old = baseline["quality"]["mean_recommendation_quality"]
+    new = report["quality"]["mean_recommendation_quality"]
+    if new < old - 0.01:
+        regressions.append(f"recommendation quality: {old} -> {new}")
+    if report["succeeded"] < report["requests"]:
+        regressions.append(f"{report['requests'] - report['succeeded']} requests failed")
+    return regressions
+
+
+def print_report(report):
+    lat = report["latency_ms"]
+    print("=" * 50)
+    print(f"Requests: {report['requests']} (ok {report['succeeded']}) @ concurrency {report['concurrency']}")
+    print(f"Throughput: {report['throughput_rps']} req/s over {report['wall_time_s']}s")
+    print(f"Latency ms: mean {lat['mean']}  p50 {lat['p50']:.1f}  p90 {lat['p90']:.1f}  "
+          f"p95 {lat['p95']:.1f}  p99 {lat['p99']:.1f}  max {lat['max']:.1f}")
+    print(f"Upstream calls: {report['upstream_calls']} ({report['upstream_calls_per_request']}/request)")
+    print(f"Recommendation quality: {report['quality']['mean_recommendation_quality']}")
+    print("=" * 50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for /api/recommendations")
+    parser.add_argument("--requests", type=int, default=100, help="Measured requests")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="Fixture directory (synthesized if empty)")
+    parser.add_argument("--stub-latency-ms", type=int, default=0, help="Artificial upstream latency")
+    parser.add_argument("--target", help="Benchmark an already running server instead of launching one")
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--baseline", help="Compare with a previous JSON report and exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    if not load_fixtures(args.fixtures):
+        print(f"No fixtures in {args.fixtures}, synthesizing a corpus...")
+        synthesize_corpus(fixtures_dir=args.fixtures)
+
+    stub, state = start_stub(0, args.fixtures, args.stub_latency_ms)
+    handles = sorted(state.fixtures)
+    proc = None
+    try:
+        if args.target:
+            target = args.target
+        else:
+            proc, target = launch_backend(stub.server_address[1], _free_port())
+
+        print(f"Benchmarking {target} with {len(handles)} handles...")
+        if args.warmup:
+            run_load(target, handles, args.warmup, args.concurrency)
+            # Only count upstream calls made during the measured window
+            state.reset()
+        samples, wall = run_load(target, handles, args.requests, args.concurrency)
+        upstream = state.snapshot()
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=10)
+        stub.shutdown()
+
+    report = build_report(samples, wall, upstream, args.concurrency)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("❌ Performance regressions:")
+            for r in regressions:
+                print(f"  - {r}")
+            sys.exit(1)
+        print("✅ No regressions versus baseline")
+
+
+if __name__ == "__main__":
+    main()
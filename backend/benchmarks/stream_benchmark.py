@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Streaming planner check and benchmark against the chunked Gemini stub.
+
+Synthesizes fixtures and serves them from benchmarks.stub_server, which
+streams each reply a few characters per event. It then measures, per
+handle, when the first recommendation is ready compared with the whole
+reply (what the non-streaming planner waited for). It also checks that:
+
+- the incremental parser returns the same objects as json.loads, however
+  the reply is split;
+- a stream cut off part-way still yields the recommendations completed
+  before the cut and is marked partial.
+
+    cd backend
+    python -m benchmarks.stream_benchmark
+    python -m benchmarks.stream_benchmark --handles 10 --chunk-chars 20 --delay-ms 30 --cut 0.6
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+# Keep the benchmark's caches and logs out of the real database
+_scratch = tempfile.mkdtemp(prefix="stream_bench_")
+os.environ.setdefault("DB_PATH", os.path.join(_scratch, "bench.db"))
+
+from app import cf_client, llm_router, smart_planner
+from app.json_stream import ArrayItemStream
+from benchmarks.fixtures import synthesize_corpus, load_fixtures
+from benchmarks.stub_server import start_stub
+
+
+def check_parser(replies, rng, rounds=20):
+    """Random chunkings of each reply parse to the same objects as json.loads"""
+    for text in replies:
+        expected = json.loads(text)["recommendations"]
+        for _ in range(rounds):
+            parser = ArrayItemStream()
+            items = []
+            pos = 0
+            while pos < len(text):
+                step = rng.randint(1, 25)
+                items.extend(parser.feed(text[pos:pos + step]))
+                pos += step
+            if items != expected or not parser.complete:
+                raise SystemExit("Incremental parser disagrees with json.loads")
+        # Cut anywhere: every yielded item is one of the expected ones, in order
+        cut = rng.randint(1, len(text) - 1)
+        items = ArrayItemStream().feed(text[:cut])
+        if items != expected[:len(items)]:
+            raise SystemExit("Incremental parser returned a wrong item from a truncated reply")
+    return len(replies) * rounds
+
+
+def run_planner(handle):
+    """(seconds to first recommendation, seconds to last, recommendations, complete)"""
+    stats = cf_client.get_topic_statistics(handle)
+    start = time.perf_counter()
+    first = None
+    items = []
+    stream = smart_planner.stream_recommendations(stats["topic_stats"], stats["rating_distribution"], None, handle)
+    while True:
+        try:
+            items.append(next(stream))
+        except StopIteration as done:
+            complete = done.value
+            break
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start, items, complete
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming planner benchmark against the chunked Gemini stub")
+    parser.add_argument("--handles", type=int, default=5)
+    parser.add_argument("--chunk-chars", type=int, default=20)
+    parser.add_argument("--delay-ms", type=int, default=30, help="Stub delay between streamed events")
+    parser.add_argument("--cut", type=float, default=0.6, help="Share of events sent in the cut-off run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    fixtures_dir = os.path.join(_scratch, "fixtures")
+    handles = synthesize_corpus(args.handles, args.seed, 200, fixtures_dir)
+    replies = [f["gemini"]["candidates"][0]["content"]["parts"][0]["text"] for f in load_fixtures(fixtures_dir).values()]
+    parser_checks = check_parser(replies, random.Random(args.seed))
+
+    server, state = start_stub(0, fixtures_dir, stream_chunk_chars=args.chunk_chars, stream_delay_ms=args.delay_ms)
+    port = server.server_address[1]
+    cf_client.BASE = f"http://127.0.0.1:{port}/api"
+    llm_router.GEMINI_STREAM_URL = f"http://127.0.0.1:{port}/v1beta/models/gemini-2.0-flash:streamGenerateContent"
+    llm_router.GEMINI_KEY = llm_router.GEMINI_KEY or "benchmark-stub"
+    llm_router.LLM_PROVIDERS = ["gemini"]
+    smart_planner.PLAN_CACHE_TTL = 0
+
+    full = [run_planner(h) for h in handles]
+    state.stream_cut = args.cut
+    cut = [run_planner(h) for h in handles]
+    server.shutdown()
+
+    if not all(complete and len(items) == 5 for _, _, items, complete in full):
+        raise SystemExit("A full stream did not produce 5 recommendations")
+    if any(complete or not items for _, _, items, complete in cut):
+        raise SystemExit("A cut-off stream was not recovered as a partial result")
+
+    def mean(values):
+        return round(sum(values) / len(values) * 1000, 1)
+
+    report = {
+        "handles": len(handles),
+        "parser_chunkings_checked": parser_checks,
+        "first_recommendation_ms": mean([first for first, _, _, _ in full]),
+        "full_reply_ms": mean([total for _, total, _, _ in full]),
+        "cut_off": {
+            "events_sent": args.cut,
+            "recovered_recommendations": round(sum(len(items) for _, _, items, _ in cut) / len(cut), 2),
+            "first_recommendation_ms": mean([first for first, _, _, _ in cut]),
+        },
+    }
+    print("=" * 60)
+    print(json.dumps(report, indent=2))
+    print("=" * 60)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Local stub for the Codeforces, Gemini and OpenAI chat APIs.
+Serves recorded fixtures and counts every upstream call it receives.
+Streamed replies (streamGenerateContent, chat completions with "stream")
+are sent as chunked server-sent events, a few characters per event,
+optionally cut off part-way. LLM calls can be made slow now and then or
+fail outright, to exercise the LLM router. Like the real models, the stub
+answers a schema-constrained request (Gemini responseSchema, OpenAI
+json_schema) with compact JSON and anything else with pretty-printed JSON
+in a ```json fence. Chat prompts (the last line is "Tutor:") get a prose
+answer of --chat-reply-chars characters that quotes the question.
+
+    python -m benchmarks.stub_server --port 8900 --latency-ms 50
+    python -m benchmarks.stub_server --stream-chunk-chars 40 --stream-delay-ms 20 --stream-cut 0.6
+    python -m benchmarks.stub_server --llm-slow-share 0.1 --llm-slow-ms 2000 --llm-error-status 503
+
+Point the backend at it with:
+    CODEFORCES_API_BASE=http://127.0.0.1:8900/api
+    GEMINI_API_URL=http://127.0.0.1:8900/v1beta/models/gemini-2.0-flash:generateContent
+    OPENAI_API_URL=http://127.0.0.1:8900/v1/chat/completions
+"""
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from .fixtures import FIXTURES_DIR, load_fixtures, gemini_reply
+
+NOT_FOUND = {"status": "FAILED", "comment": "handle: User with handle not found"}
+_HANDLE_IN_PROMPT = re.compile(r"for user (\S+?):")
+_CHAT_QUESTION = re.compile(r"Student: ([^\n]*)\nTutor:\s*$")
+_CHAT_FILLER = ("Start from the brute force, find the repeated work, and store it so each state is solved once. "
+                "Check the constraints to pick the complexity you can afford, then handle the edge cases. ")
+
+
+def chat_reply(question, chars):
+    """A tutor-style answer to question, about chars characters long"""
+    text = f"Good question: {question.strip()} "
+    while len(text) < chars:
+        text += _CHAT_FILLER
+    return {"candidates": [{"content": {"parts": [{"text": text[:max(chars, 1)].rstrip()}]}}]}
+
+
+def _styled(reply, constrained):
+    """The fixture reply as a schema-constrained (compact) or free-form (fenced, indented) model would write it"""
+    text = reply["candidates"][0]["content"]["parts"][0]["text"]
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return reply
+    if constrained:
+        text = json.dumps(data, separators=(",", ":"))
+    else:
+        text = "```json\n" + json.dumps(data, indent=2) + "\n```"
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+
+class StubState:
+    """Fixtures plus thread-safe call counters shared by all handler threads"""
+
+    def __init__(self, fixtures, latency_ms=0, stream_chunk_chars=40, stream_delay_ms=0, stream_cut=0.0,
+                 llm_slow_share=0.0, llm_slow_ms=0, llm_error_status=0, chat_reply_chars=1200, seed=0):
+        self.fixtures = fixtures
+        self.latency = latency_ms / 1000.0
+        self.stream_chunk_chars = stream_chunk_chars
+        self.stream_delay = stream_delay_ms / 1000.0
+        # Drop the connection after this share of the stream's events (0 sends everything)
+        self.stream_cut = stream_cut
+        # Tail latency: this share of LLM calls waits llm_slow_ms longer
+        self.llm_slow_share = llm_slow_share
+        self.llm_slow = llm_slow_ms / 1000.0
+        # Answer every LLM call with this HTTP status (0 answers normally)
+        self.llm_error_status = llm_error_status
+        self.chat_reply_chars = chat_reply_chars
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def llm_delay(self):
+        with self.lock:
+            slow = self.llm_slow_share and self.rng.random() < self.llm_slow_share
+        return self.latency + (self.llm_slow if slow else 0.0)
+
+    def count(self, endpoint):
+        with self.lock:
+            self.calls[endpoint] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.calls)
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+
+
+def make_handler(state):
+    class StubHandler(BaseHTTPRequestHandler):
+        # Chunked transfer encoding for streamed replies
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_stream(self, reply, openai=False):
+            """The reply text as SSE events in chunked encoding, like streamGenerateContent?alt=sse"""
+            text = reply["candidates"][0]["content"]["parts"][0]["text"]
+            size = max(1, state.stream_chunk_chars)
+            chunks = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+            cut = int(len(chunks) * state.stream_cut) if state.stream_cut else None
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, chunk in enumerate(chunks):
+                if cut is not None and i >= cut:
+                    # Simulate a dropped connection: no terminating chunk
+                    self.close_connection = True
+                    return
+                last = i == len(chunks) - 1
+                if openai:
+                    event = {"choices": [{"index": 0, "delta": {"content": chunk},
+                                          "finish_reason": "stop" if last else None}]}
+                else:
+                    candidate = {"content": {"parts": [{"text": chunk}], "role": "model"}}
+                    if last:
+                        candidate["finishReason"] = "STOP"
+                    event = {"candidates": [candidate]}
+                self._write_chunk(f"data: {json.dumps(event)}\r\n\r\n".encode("utf-8"))
+                if state.stream_delay:
+                    time.sleep(state.stream_delay)
+            if openai:
+                self._write_chunk(b"data: [DONE]\r\n\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _write_chunk(self, data):
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+
+            if url.path == "/_stub/calls":
+                return self._send_json(200, state.snapshot())
+
+            if state.latency:
+                time.sleep(state.latency)
+
+            if url.path == "/api/user.status":
+                state.count("user.status")
+                fixture = state.fixtures.get(query.get("handle", [""])[0])
+                if not fixture:
+                    return self._send_json(400, NOT_FOUND)
+                body = dict(fixture["user.status"])
+                first = max(1, int(query.get("from", ["1"])[0] or 1))
+                count = int(query.get("count", ["0"])[0] or 0)
+                if body.get("status") == "OK":
+                    body["result"] = body["result"][first - 1:first - 1 + count if count else None]
+                return self._send_json(200, body)
+
+            if url.path == "/api/user.info":
+                state.count("user.info")
+                fixture = state.fixtures.get(query.get("handles", [""])[0])
+                if not fixture:
+                    return self._send_json(400, NOT_FOUND)
+                return self._send_json(200, fixture["user.info"])
+
+            self._send_json(404, {"error": "unknown stub path"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length) if length else b""
+
+            if url.path == "/_stub/reset":
+                state.reset()
+                return self._send_json(200, {"status": "reset"})
+
+            openai = url.path == "/v1/chat/completions"
+            try:
+                request = json.loads(body)
+            except ValueError:
+                request = {}
+            if openai:
+                streaming = bool(request.get("stream"))
+            else:
+                streaming = url.path.endswith(":streamGenerateContent")
+                if not streaming and not url.path.endswith(":generateContent"):
+                    return self._send_json(404, {"error": "unknown stub path"})
+
+            state.count("openai" if openai else "gemini")
+            delay = state.llm_delay()
+            if delay:
+                time.sleep(delay)
+            if state.llm_error_status:
+                return self._send_json(state.llm_error_status, {"error": {"message": "stub failure"}})
+
+            try:
+                if openai:
+                    prompt = request["messages"][-1]["content"]
+                else:
+                    prompt = request["contents"][0]["parts"][0]["text"]
+            except (KeyError, IndexError, TypeError):
+                prompt = ""
+            question = _CHAT_QUESTION.search(prompt)
+            if question:
+                reply = chat_reply(question.group(1), state.chat_reply_chars)
+            else:
+                match = _HANDLE_IN_PROMPT.search(prompt)
+                fixture = state.fixtures.get(match.group(1)) if match else None
+                reply = (fixture.get("gemini") if fixture else None) or gemini_reply([])
+                constrained = "response_format" in request if openai else \
+                    "responseSchema" in (request.get("generationConfig") or {})
+                reply = _styled(reply, constrained)
+            if streaming:
+                return self._send_stream(reply, openai)
+            if openai:
+                text = reply["candidates"][0]["content"]["parts"][0]["text"]
+                return self._send_json(200, {"object": "chat.completion", "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}]})
+            self._send_json(200, reply)
+
+    return StubHandler
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hang up on purpose (hedged requests cancel the loser)
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_stub(port=0, fixtures_dir=FIXTURES_DIR, latency_ms=0, **options):
+    """Start the stub in a daemon thread. Returns (server, state)."""
+    state = StubState(load_fixtures(fixtures_dir), latency_ms, **options)
+    server = StubServer(("127.0.0.1", port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve recorded Codeforces/Gemini/OpenAI fixtures")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--dir", default=FIXTURES_DIR, help="Fixture directory")
+    parser.add_argument("--latency-ms", type=int, default=0, help="Artificial upstream latency")
+    parser.add_argument("--stream-chunk-chars", type=int, default=40, help="Reply characters per streamed event")
+    parser.add_argument("--stream-delay-ms", type=int, default=0, help="Delay between streamed events")
+    parser.add_argument("--stream-cut", type=float, default=0.0,
+                        help="Drop streamed replies after this share of their events (0 = never)")
+    parser.add_argument("--llm-slow-share", type=float, default=0.0, help="Share of LLM calls that are slow")
+    parser.add_argument("--llm-slow-ms", type=int, default=0, help="Extra latency of a slow LLM call")
+    parser.add_argument("--llm-error-status", type=int, default=0, help="Fail every LLM call with this status")
+    parser.add_argument("--chat-reply-chars", type=int, default=1200, help="Length of answers to chat prompts")
+    args = parser.parse_args()
+
+    server, state = start_stub(args.port, args.dir, args.latency_ms, stream_chunk_chars=args.stream_chunk_chars,
+                               stream_delay_ms=args.stream_delay_ms, stream_cut=args.stream_cut,
+                               llm_slow_share=args.llm_slow_share, llm_slow_ms=args.llm_slow_ms,
+                               llm_error_status=args.llm_error_status, chat_reply_chars=args.chat_reply_chars)
+    print(f"Stub serving {len(state.fixtures)} handles on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
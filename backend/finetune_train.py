@@ -18,11 +18,31 @@ from peft import LoraConfig, get_peft_model, TaskType, prepare_model_for_kbit_tr
 from datasets import Dataset as HFDataset
 import argparse
 
+from app.model_artifacts import list_artifacts, resolve_artifact
+
 # Configuration
 BASE_MODEL = "microsoft/DialoGPT-small"  # Lightweight model suitable for fine-tuning
 OUTPUT_DIR = "./models/lora_dsa_analyzer"
+ADAPTERS_DIR = "./models/lora_adapters"  # named adapters served next to the default one
 DATA_DIR = "./training_data"
 
+def base_model_source():
+    """(path, local_files_only): the exported artifact's base model when there is one, else the hub"""
+    artifact = resolve_artifact()
+    if artifact is None:
+        return BASE_MODEL, False
+    if not artifact.merged:
+        return artifact.model_dir, True
+    # A merged artifact already contains an adapter, so train on the newest plain export instead
+    plain = [entry for entry in list_artifacts(artifact.name) if not entry["merged"]]
+    if plain:
+        return resolve_artifact(artifact.name, plain[-1]["version"]).model_dir, True
+    raise RuntimeError(
+        f"Model artifact {artifact.name}/{artifact.version} has adapter '{artifact.merged}' merged into "
+        f"its weights and no non-merged version exists to train from. Export one without --merge "
+        f"(python -m app.model_artifacts export), then `use {artifact.version}` to keep serving the merged one."
+    )
+
 class DSAAnalysisDataset(Dataset):
     """Dataset for DSA submission analysis"""
     
@@ -85,7 +105,8 @@ class DSAAnalysisDataset(Dataset):
 
 def load_base_model():
     """Load base model with quantization"""
-    print(f"Loading base model: {BASE_MODEL}")
+    source, local_only = base_model_source()
+    print(f"Loading base model: {source}")
     
     quantization_config = BitsAndBytesConfig(
         load_in_4bit=True,
@@ -95,9 +116,10 @@ def load_base_model():
     )
     
     model = AutoModelForCausalLM.from_pretrained(
-        BASE_MODEL,
+        source,
         quantization_config=quantization_config,
-        device_map="auto"
+        device_map="auto",
+        local_files_only=local_only
     )
     
     # Prepare model for k-bit training
@@ -131,7 +153,8 @@ def train_model(args):
     
     # Load tokenizer
     print("Loading tokenizer...")
-    tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL)
+    source, local_only = base_model_source()
+    tokenizer = AutoTokenizer.from_pretrained(source, local_files_only=local_only)
     if tokenizer.pad_token is None:
         tokenizer.pad_token = tokenizer.eos_token
     
@@ -146,9 +169,12 @@ def train_model(args):
     
     print(f"Dataset size: {len(dataset)}")
     
+    # A named adapter (an analysis style or language) is saved next to the others
+    output_dir = os.path.join(ADAPTERS_DIR, args.adapter_name) if args.adapter_name else OUTPUT_DIR
+    
     # Training arguments
     training_args = TrainingArguments(
-        output_dir=OUTPUT_DIR,
+        output_dir=output_dir,
         num_train_epochs=args.epochs,
         per_device_train_batch_size=args.batch_size,
         gradient_accumulation_steps=2,
@@ -177,12 +203,12 @@ def train_model(args):
     trainer.train()
     
     # Save model
-    print(f"Saving model to {OUTPUT_DIR}...")
+    print(f"Saving model to {output_dir}...")
     trainer.save_model()
-    tokenizer.save_pretrained(OUTPUT_DIR)
+    tokenizer.save_pretrained(output_dir)
     
     print("✅ Fine-tuning complete!")
-    print(f"Model saved to: {OUTPUT_DIR}")
+    print(f"Model saved to: {output_dir}")
 
 def prepare_training_data():
     """Helper function to prepare training data"""
@@ -222,6 +248,7 @@ if __name__ == "__main__":
     parser.add_argument("--batch-size", type=int, default=4, help="Batch size")
     parser.add_argument("--learning-rate", type=float, default=2e-4, help="Learning rate")
     parser.add_argument("--prepare-data", action="store_true", help="Prepare training data")
+    parser.add_argument("--adapter-name", help="Save as a named adapter in models/lora_adapters/ instead of the default one")
     
     args = parser.parse_args()
     
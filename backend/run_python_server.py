@@ -1,23 +1,133 @@
 #!/usr/bin/env python3
 """
 Script to run the FastAPI backend server
+
+    python run_python_server.py                      # development: single process, auto-reload
+    python run_python_server.py --prod --workers 4   # production (or APP_ENV=production)
+
+Production mode disables the reloader, uses uvloop/httptools when installed
+and drains in-flight requests on shutdown. On Linux/macOS it runs under
+gunicorn with the app (and the fine-tuned model, if enabled) preloaded in
+the master, so workers share the weights copy-on-write after fork. On
+Windows, or without gunicorn, it falls back to uvicorn's own workers, which
+load the app separately in each process.
 """
 import uvicorn
 import os
 import sys
+import gc
+import inspect
+import argparse
 from pathlib import Path
 
 # Add backend directory to path so imports work
 backend_dir = Path(__file__).parent
 sys.path.insert(0, str(backend_dir))
 
-if __name__ == "__main__":
-    # Run on port 8000 to avoid conflict with Node.js backend on 5000
+
+def _has_module(name):
+    try:
+        __import__(name)
+        return True
+    except ImportError:
+        return False
+
+
+def preload_app():
+    """Import the app and warm the model in this process (before any fork)"""
+    from app.main import app
+
+    if os.getenv("USE_FINETUNED_MODEL", "false").lower() == "true":
+        from app.finetuned_analyzer import get_finetuned_analyzer
+        get_finetuned_analyzer(use_finetuned=True)
+
+    # Move everything loaded so far out of the GC's reach so collections in
+    # the workers do not touch (and therefore copy) the shared pages
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def run_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+
+    class PreloadedApplication(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    options = {
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        # UvicornWorker picks uvloop and httptools automatically when installed
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "graceful_timeout": args.graceful_timeout,
+        "timeout": args.worker_timeout,
+        "keepalive": args.keepalive,
+        "accesslog": "-" if args.access_log else None,
+    }
+    PreloadedApplication(preload_app(), options).run()
+
+
+def run_uvicorn_workers(args):
+    kwargs = {
+        "host": args.host,
+        "port": args.port,
+        "workers": args.workers,
+        "reload": False,
+        "loop": "uvloop" if _has_module("uvloop") else "auto",
+        "http": "httptools" if _has_module("httptools") else "auto",
+        "timeout_keep_alive": args.keepalive,
+        "access_log": args.access_log,
+    }
+    # Older uvicorn releases do not support a graceful shutdown timeout
+    if "timeout_graceful_shutdown" in inspect.signature(uvicorn.Config).parameters:
+        kwargs["timeout_graceful_shutdown"] = args.graceful_timeout
+
+    if args.workers == 1:
+        # Single process: pass the app object so the model is loaded once, up front
+        uvicorn.run(preload_app(), **kwargs)
+    else:
+        uvicorn.run("app.main:app", **kwargs)
+
+
+def run_development(args):
     uvicorn.run(
         "app.main:app",
-        host="0.0.0.0",
-        port=8000,
+        host=args.host,
+        port=args.port,
         reload=True,
         reload_dirs=[str(backend_dir / "app")]
     )
 
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the FastAPI backend")
+    parser.add_argument("--prod", action="store_true", default=os.getenv("APP_ENV") == "production",
+                        help="Production mode (default when APP_ENV=production)")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    # Run on port 8000 to avoid conflict with Node.js backend on 5000
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))))
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="Seconds to drain in-flight requests on shutdown")
+    parser.add_argument("--worker-timeout", type=int, default=180, help="Restart a worker stuck longer than this (gunicorn)")
+    parser.add_argument("--keepalive", type=int, default=5)
+    parser.add_argument("--access-log", action="store_true")
+    parser.add_argument("--no-gunicorn", action="store_true", help="Use uvicorn workers even if gunicorn is available")
+    args = parser.parse_args()
+
+    if not args.prod:
+        run_development(args)
+    elif os.name != "nt" and not args.no_gunicorn and _has_module("gunicorn"):
+        run_gunicorn(args)
+    else:
+        run_uvicorn_workers(args)
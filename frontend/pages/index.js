@@ -6,6 +6,7 @@ export default function Home() {
   const [input, setInput] = useState("");
   const [chatMessages, setChatMessages] = useState([]);
   const [chatLoading, setChatLoading] = useState(false);
+  const [chatSessionId, setChatSessionId] = useState(null);
   
   // Recommendations state (main page)
   const [handle, setHandle] = useState("");
@@ -25,21 +26,44 @@ export default function Home() {
     setChatMessages(newMessages);
     
     try {
-      const res = await fetch("http://localhost:5000/api/generate", {
+      const res = await fetch("http://localhost:8000/api/chat/stream", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ prompt: userMessage })
+        body: JSON.stringify({ message: userMessage, session_id: chatSessionId })
       });
 
       if (!res.ok) {
         const errorData = await res.json().catch(() => ({}));
-        throw new Error(errorData.error || "Backend returned an error");
+        throw new Error(errorData.detail || "Backend returned an error");
       }
 
-      const data = await res.json();
-      const text = data?.candidates?.[0]?.content?.parts?.[0]?.text ?? "No response from AI.";
-
-      setChatMessages([...newMessages, { role: "assistant", content: text }]);
+      // Server-sent events: show the reply as it is written
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let text = "";
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop();
+        for (const raw of events) {
+          const event = raw.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] ?? "{}");
+          if (event === "session") {
+            setChatSessionId(data.session_id);
+          } else if (event === "token") {
+            text += data.text;
+            setChatMessages([...newMessages, { role: "assistant", content: text }]);
+          } else if (event === "error") {
+            throw new Error(data.message);
+          }
+        }
+      }
+      if (!text) {
+        setChatMessages([...newMessages, { role: "assistant", content: "No response from AI." }]);
+      }
     } catch (err) {
       setChatMessages([...newMessages, { role: "assistant", content: "❌ Error: " + err.message }]);
     } finally {
@@ -368,6 +392,7 @@ export default function Home() {
                               }}
                             >
                               {topic}: {stats.solved}/{stats.total_attempts} ({stats.success_rate * 100}%)
+                              {stats.percentile != null && ` · P${Math.round(stats.percentile)}`}
                             </div>
                           ))}
                       </div>